@@ -47,6 +47,8 @@ def pytest_ignore_collect(path, config):
         return True
     if "test_inject.py" in str(path):
         return True
+    if "test_perf.py" in str(path):
+        return True
 
     uitest_file = "tests/uitests" in str(path)
     if uitest_file and not uitests_requested:
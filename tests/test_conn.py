@@ -10,6 +10,8 @@ from virtinst import pollhelpers
 from virtinst import StoragePool
 from virtinst import URI
 
+from tests import utils
+
 
 ############################
 # VirtinstConnection tests #
@@ -92,3 +94,77 @@ def test_poll():
     poolobj1.undefine()
     poolobj2.destroy()
     poolobj2.undefine()
+
+
+def test_poll_reconciler():
+    # Cover the incremental UUID keyed pollhelpers reconciler
+    conn = cli.getConnection(utils.URIs.test_default)
+    reconciler = pollhelpers.PollReconciler("domain")
+    built = []
+    def build_cb(obj, name):
+        built.append(name)
+        return [obj, name]
+
+    delta = pollhelpers.reconcile_vms(conn, reconciler, build_cb)
+    assert bool(delta) is True
+    assert delta.generation == 1
+    assert [o[1] for o in delta.new] == ["test"]
+    assert len(reconciler) == 1
+    guestobj = delta.new[0]
+    assert reconciler.tracks(guestobj)
+
+    # Nothing changed, so nothing should be built
+    delta = pollhelpers.reconcile_vms(conn, reconciler, build_cb)
+    assert bool(delta) is False
+    assert delta.generation == 1
+    assert built == ["test"]
+    assert list(reconciler.objects()) == [guestobj]
+
+    # Rename keeps the UUID, so it's reported as a rename
+    dom = conn.lookupByName("test")
+    dom.destroy()
+    dom.rename("test-renamed", 0)
+    def renamed_cb(obj, newname):
+        return True
+    delta = pollhelpers.reconcile_vms(conn, reconciler, build_cb, renamed_cb)
+    assert delta.renamed == [(guestobj, "test", "test-renamed")]
+    assert not delta.new and not delta.gone
+    assert delta.generation == 2
+
+    # Rejected renames are replaced with a freshly built object
+    dom.rename("test", 0)
+    delta = pollhelpers.reconcile_vms(conn, reconciler, build_cb)
+    assert delta.gone == [guestobj]
+    assert [o[1] for o in delta.new] == ["test"]
+    assert not reconciler.tracks(guestobj)
+    guestobj = delta.new[0]
+
+    # Discarded objects are reported as new on the next poll
+    assert reconciler.discard(guestobj) is True
+    assert reconciler.discard(guestobj) is False
+    delta = pollhelpers.reconcile_vms(conn, reconciler, build_cb)
+    assert [o[1] for o in delta.new] == ["test"]
+
+    # A discarded object that then disappears is never reported gone,
+    # like a denylisted object that was never initialized
+    reconciler.discard(delta.new[0])
+    dom.undefine()
+    delta = pollhelpers.reconcile_vms(conn, reconciler, build_cb)
+    assert not delta
+    dom = conn.defineXML(dom.XMLDesc(0))
+    delta = pollhelpers.reconcile_vms(conn, reconciler, build_cb)
+    assert [o[1] for o in delta.new] == ["test"]
+
+    # Undefined objects are reported as gone
+    guestobj = delta.new[0]
+    dom.undefine()
+    delta = pollhelpers.reconcile_vms(conn, reconciler, build_cb)
+    assert delta.gone == [guestobj]
+    assert len(reconciler) == 0
+
+    # nodedevs don't have a UUID, but still work
+    reconciler = pollhelpers.PollReconciler("nodedev")
+    delta = pollhelpers.reconcile_nodedevs(conn, reconciler, build_cb)
+    assert delta.new
+    assert not pollhelpers.reconcile_nodedevs(conn, reconciler, build_cb)
+    conn.close()
@@ -0,0 +1,549 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+"""
+Performance benchmarks. These are not run by default, since timing
+results aren't meaningful on shared CI machines. Run them with:
+
+    pytest --capture=no tests/test_perf.py
+"""
+
+import os
+import time
+import uuid
+
+import pytest
+
+from virtinst import cli
+from virtinst import pollhelpers
+
+# pylint: disable=protected-access
+
+
+_DOMAIN_TEMPLATE = """
+<domain type='test'>
+  <name>%(name)s</name>
+  <uuid>%(uuid)s</uuid>
+  <memory unit='KiB'>65536</memory>
+  <vcpu>1</vcpu>
+  <os><type arch='i686'>hvm</type></os>
+  <devices>
+    <disk type='file' device='disk'>
+      <source file='/var/lib/libvirt/images/%(name)s.img'/>
+      <target dev='vda' bus='virtio'/>
+    </disk>
+    <interface type='network'>
+      <source network='default'/>
+    </interface>
+  </devices>
+</domain>
+"""
+
+
+def _make_testdriver(tmpdir, count):
+    """
+    Write a testdriver XML file with `count` domains and return
+    a connection to it
+    """
+    path = os.path.join(str(tmpdir), "perf-%s.xml" % count)
+    with open(path, "w") as f:
+        f.write("<node>\n")
+        for idx in range(count):
+            f.write(_DOMAIN_TEMPLATE % {
+                "name": "perf%.5d" % idx,
+                "uuid": str(uuid.UUID(int=idx + 1)),
+            })
+        f.write("</node>\n")
+    return cli.getConnection("test://%s" % path)
+
+
+def _timeit(cb, iterations):
+    start = time.perf_counter()
+    for dummy in range(iterations):
+        cb()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def _report(title, rows):
+    print("\n%s" % title)
+    for row in rows:
+        print("  " + "  ".join(str(c).rjust(12) for c in row))
+
+
+#####################
+# pollhelpers ticks #
+#####################
+
+@pytest.mark.parametrize("count", [100, 1000, 5000])
+def test_perf_poll_reconcile(tmpdir, count):
+    """
+    Compare the legacy name keyed poll helper against the UUID keyed
+    reconciler for a steady state tick where nothing changed
+    """
+    conn = _make_testdriver(tmpdir, count)
+    rawobjs = conn.listAllDomains()
+    iterations = 20
+    builds = []
+    def build_cb(obj, name):
+        builds.append(name)
+        return obj
+
+    # Legacy path: vmmConnection rebuilt the name map every tick
+    origmap = dict((o.name(), o) for o in rawobjs)
+    def legacy_tick():
+        keymap = dict((o.name(), o) for o in origmap.values())
+        pollhelpers._new_poll_helper(keymap, "domain",
+                lambda: rawobjs, build_cb, lambda: True)
+
+    reconciler = pollhelpers.PollReconciler("domain")
+    reconciler.reconcile(lambda: rawobjs, lambda: True, build_cb)
+    del builds[:]
+    def reconcile_tick():
+        delta = reconciler.reconcile(lambda: rawobjs,
+                lambda: True, build_cb)
+        assert not delta
+
+    legacy = _timeit(legacy_tick, iterations)
+    incremental = _timeit(reconcile_tick, iterations)
+    listing = _timeit(conn.listAllDomains, iterations)
+    assert not builds
+
+    _report("poll tick, %d domains (ms/tick)" % count, [
+        ["listAll", "legacy", "reconcile"],
+        ["%.3f" % listing, "%.3f" % legacy, "%.3f" % incremental]])
+    conn.close()
+
+
+##########################
+# vmmConnection registry #
+##########################
+
+class _FakeObject(object):
+    def __init__(self, idx):
+        self._name = "perf%.5d" % idx
+        self._uuid = str(uuid.UUID(int=idx + 1))
+    def get_name(self):
+        return self._name
+    def get_uuid(self):
+        return self._uuid
+
+
+def test_perf_object_registry():
+    """
+    Lookup and listing cost of vmmConnection's object registry
+    """
+    from virtManager.connection import _ObjectList
+
+    count = 10000
+    iterations = 1000
+    objlist = _ObjectList()
+    objs = [_FakeObject(idx) for idx in range(count)]
+    start = time.perf_counter()
+    for obj in objs:
+        assert objlist.add(obj)
+    addtime = (time.perf_counter() - start) * 1000
+    assert not objlist.add(_FakeObject(0))
+
+    names = [o.get_name() for o in objs[::count // iterations]]
+    def by_name():
+        for name in names:
+            objlist.lookup_object(_FakeObject, name)
+    def by_uuid():
+        for obj in objs[::count // iterations]:
+            objlist.lookup_object_by_uuid(_FakeObject, obj.get_uuid())
+    def list_all():
+        objlist.get_objects_for_class(_FakeObject)
+    def list_after_change():
+        objlist.remove(objs[0])
+        objlist.add(objs[0])
+        objlist.get_objects_for_class(_FakeObject)
+
+    assert len(objlist.get_objects_for_class(_FakeObject)) == count
+    lookup = _timeit(by_name, 10) * 1000 / len(names)
+    uuidlookup = _timeit(by_uuid, 10) * 1000 / len(names)
+    listing = _timeit(list_all, iterations) * 1000
+    relist = _timeit(list_after_change, 100) * 1000
+
+    _report("object registry, %d objects (us/op)" % count, [
+        ["add all (ms)", "by name", "by uuid", "list", "list+change"],
+        ["%.3f" % addtime, "%.3f" % lookup, "%.3f" % uuidlookup,
+         "%.3f" % listing, "%.3f" % relist]])
+    objlist.cleanup()
+
+
+#########################
+# Stats history buffers #
+#########################
+
+class _LegacyRecord(object):
+    # Mirrors the old dict backed _VMStatsRecord
+    def __init__(self, names, value):
+        for name in names:
+            setattr(self, name, value)
+
+
+@pytest.mark.parametrize("history", [120, 3600])
+def test_perf_stats_history(history):
+    """
+    Memory and CPU cost of per VM stats history for 1000 VMs, comparing
+    the old list of record objects with the columnar StatsRing
+    """
+    import tracemalloc
+    from virtManager.lib.statsmanager import StatsRing, _VMStatsRecord
+
+    count = 1000
+    names = _VMStatsRecord.__slots__
+    sample = dict((name, 1.0) for name in names)
+    graphlen = 40
+
+    def legacy_fill():
+        ret = []
+        for dummy in range(count):
+            records = []
+            for idx in range(history):
+                records.insert(0, _LegacyRecord(names, float(idx)))
+            ret.append(records)
+        return ret
+
+    def ring_fill():
+        ret = []
+        for dummy in range(count):
+            ring = StatsRing(names, history)
+            for dummy2 in range(history):
+                ring.append(sample)
+            ret.append(ring)
+        return ret
+
+    def measure(cb):
+        tracemalloc.start()
+        start = time.perf_counter()
+        ret = cb()
+        filltime = (time.perf_counter() - start) * 1000
+        mem = tracemalloc.get_traced_memory()[0] / (1024.0 * 1024.0)
+        tracemalloc.stop()
+        return ret, filltime, mem
+
+    legacy, legacyfill, legacymem = measure(legacy_fill)
+    rings, ringfill, ringmem = measure(ring_fill)
+
+    def legacy_tick():
+        for records in legacy:
+            records.insert(0, _LegacyRecord(names, 1.0))
+            del records[history:]
+            [getattr(records[i], "cpuHostPercent") / 100.0
+             for i in range(graphlen)]
+    def ring_tick():
+        for ring in rings:
+            ring.append(sample)
+            ring.get_vector("cpuHostPercent", graphlen)
+
+    legacytick = _timeit(legacy_tick, 5)
+    ringtick = _timeit(ring_tick, 5)
+    assert len(rings[0]) == history
+
+    _report("stats history, %d VMs x %d samples" % (count, history), [
+        ["", "MiB", "fill (ms)", "tick (ms)"],
+        ["legacy", "%.1f" % legacymem, "%.1f" % legacyfill,
+         "%.3f" % legacytick],
+        ["ring", "%.1f" % ringmem, "%.1f" % ringfill, "%.3f" % ringtick]])
+
+
+def test_perf_stats_rollups():
+    """
+    Cost of building a graph vector for a 2 minute and a 24 hour window.
+    Raw samples grow with the window, the rollups keep the number of
+    points at the graph width
+    """
+    from virtManager.lib.statsmanager import StatsRing, StatsRollups
+
+    names = ["cpuHostPercent"]
+    width = 300
+    rows = [["window", "source", "points", "vector (ms)"]]
+    for window in [120, 86400]:
+        raw = StatsRing(["timestamp"] + names, window + 1)
+        rollups = StatsRollups(names, window)
+        for idx in range(window):
+            sample = {"timestamp": float(idx),
+                      "cpuHostPercent": float(idx % 100)}
+            raw.append(sample)
+            rollups.add(sample)
+
+        def raw_vector():
+            return raw.get_vector("cpuHostPercent", window)
+        def rollup_vector():
+            return rollups.get_vector(raw, "cpuHostPercent", width, 1)
+
+        assert len(rollup_vector()) <= width
+        rows.append([str(window), "raw", str(len(raw_vector())),
+                     "%.3f" % _timeit(raw_vector, 20)])
+        rows.append([str(window), "rollups", str(len(rollup_vector())),
+                     "%.3f" % _timeit(rollup_vector, 20)])
+
+    _report("stats graph vector, %d pixels wide" % width, rows)
+
+
+#######################
+# Bulk stats handling #
+#######################
+
+def _make_raw_domstats(disks, nics):
+    ret = {"state.state": 1, "state.reason": 1, "cpu.time": 123456789,
+           "vcpu.current": 2, "vcpu.maximum": 2,
+           "balloon.current": 1048576, "balloon.unused": 524288,
+           "block.count": disks, "net.count": nics}
+    for idx in range(disks):
+        for key in ["rd.reqs", "rd.bytes", "rd.times", "wr.reqs",
+                    "wr.bytes", "wr.times", "fl.reqs", "fl.times",
+                    "allocation", "capacity", "physical"]:
+            ret["block.%d.%s" % (idx, key)] = 1000 + idx
+        ret["block.%d.name" % idx] = "vd%s" % chr(ord("a") + idx)
+    for idx in range(nics):
+        for key in ["rx.bytes", "rx.pkts", "rx.errs", "rx.drop",
+                    "tx.bytes", "tx.pkts", "tx.errs", "tx.drop"]:
+            ret["net.%d.%s" % (idx, key)] = 2000 + idx
+        ret["net.%d.name" % idx] = "vnet%d" % idx
+    return ret
+
+
+def test_perf_all_stats_compact():
+    """
+    Cost of reducing one getAllDomainStats response for 1000 domains
+    with 8 disks and 4 NICs, regex based vs suffix checks
+    """
+    import re
+    from virtManager.lib.statsproc import compact_domain_stats
+
+    count = 1000
+    raw = dict(("uuid-%d" % idx, _make_raw_domstats(8, 4))
+               for idx in range(count))
+
+    regexes = [
+        ("block.rd.bytes", re.compile(r"block\.[0-9]+\.rd\.bytes$")),
+        ("block.wr.bytes", re.compile(r"block\.[0-9]+\.wr\.bytes$")),
+        ("net.rx.bytes", re.compile(r"net\.[0-9]+\.rx\.bytes$")),
+        ("net.tx.bytes", re.compile(r"net\.[0-9]+\.tx\.bytes$")),
+    ]
+    def regex_compact():
+        for rawstats in raw.values():
+            ret = dict((key, 0) for key, regex in regexes)
+            for rawkey, value in rawstats.items():
+                if not rawkey.startswith(("block.", "net.")):
+                    continue
+                for key, regex in regexes:
+                    if regex.match(rawkey):
+                        ret[key] += value
+                        break
+
+    compacted = {}
+    def suffix_compact():
+        for uuidstr, rawstats in raw.items():
+            compacted[uuidstr] = compact_domain_stats(rawstats)
+    suffix_compact()
+    assert len(compacted) == count
+
+    _report("getAllDomainStats reduction, %d domains" % count, [
+        ["", "ms"],
+        ["regex", "%.2f" % _timeit(regex_compact, 5)],
+        ["suffix", "%.2f" % _timeit(suffix_compact, 5)]])
+
+
+####################
+# Sparkline render #
+####################
+
+def test_perf_sparkline_render():
+    """
+    Cost of exposing a 1000 row manager list with all 5 stats columns,
+    drawing every graph vs painting cached surfaces. Exposes without a
+    new stats sample, like scrolling or hovering, hit the cache
+    """
+    import cairo
+    from gi.repository import Gdk
+    if not Gdk.Display.get_default():
+        pytest.skip("No display available")
+    from virtManager.lib.graphwidgets import CellRendererSparkline
+
+    rows = [_FakeObject(idx) for idx in range(1000)]
+    data = [(idx % 17) / 17.0 for idx in range(40)]
+    cells = [CellRendererSparkline() for dummy in range(5)]
+    width = 140
+    height = 40
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32,
+                                 width * len(cells), height * 25)
+    cr = cairo.Context(surface)
+
+    def expose(cached):
+        for rowidx, row in enumerate(rows):
+            area = Gdk.Rectangle()
+            area.y = (rowidx % 25) * height
+            area.width = width
+            area.height = height
+            for cellidx, cell in enumerate(cells):
+                area.x = cellidx * width
+                cell.cache_key = cached and (row, 1) or None
+                if not cached or not cell.is_cached((row, 1)):
+                    cell.data_array = data
+                cell.do_render(cr, None, area, area, 0)
+
+    expose(True)
+    _report("manager list expose, %d rows x %d graphs" %
+            (len(rows), len(cells)), [
+        ["", "ms"],
+        ["draw", "%.1f" % _timeit(lambda: expose(False), 3)],
+        ["cached", "%.1f" % _timeit(lambda: expose(True), 3)]])
+
+
+#######################
+# XMLProperty lookups #
+#######################
+
+def _xmlparse_domains():
+    """
+    Return the XML of all domain fixtures in tests/data/xmlparse
+    """
+    from tests import utils
+    datadir = os.path.join(utils.DATADIR, "xmlparse")
+    ret = []
+    for filename in sorted(os.listdir(datadir)):
+        if not filename.endswith("-in.xml"):
+            continue
+        with open(os.path.join(datadir, filename)) as f:
+            xml = f.read()
+        if xml.lstrip().startswith("<domain"):
+            ret.append(xml)
+    return ret
+
+
+def _read_all_props(obj):
+    """
+    Read every XMLProperty of obj and its children, return the number
+    of properties read
+    """
+    from virtinst import xmlutil
+    count = 0
+    for propname in obj._all_xml_props():
+        getattr(obj, propname)
+        count += 1
+    for propname in obj._all_child_props():
+        for child in xmlutil.listify(getattr(obj, propname)):
+            count += _read_all_props(child)
+    return count
+
+
+def test_perf_xml_property_reads(monkeypatch):
+    """
+    XMLProperty read throughput over the xmlparse domain fixtures,
+    with and without the xpath and node lookup caches of the XML API
+    """
+    from tests import utils
+    from virtinst import Guest
+    from virtinst.xmlapi import XMLAPI
+
+    conn = utils.URIs.open_testdefault_cached()
+    guests = [Guest(conn, parsexml=xml) for xml in _xmlparse_domains()]
+    reads = sum(_read_all_props(guest) for guest in guests)
+
+    def read_all():
+        for guest in guests:
+            _read_all_props(guest)
+
+    rows = [["", "ms", "reads/s"]]
+    for label, cache in [("uncached", False), ("cached", True)]:
+        monkeypatch.setattr(XMLAPI, "CACHE_LOOKUPS", cache)
+        read_all()
+        ms = _timeit(read_all, 5)
+        rows.append([label, "%.1f" % ms, "%d" % (reads / ms * 1000)])
+    _report("XMLProperty reads, %d domains, %d properties" %
+            (len(guests), reads), rows)
+
+
+def test_perf_xml_guest_parse():
+    """
+    Guest parse cost over the xmlparse domain fixtures, when only top
+    level properties are read, like fetch_all_domains users, and when
+    every device list is accessed
+    """
+    from tests import utils
+    from virtinst import Guest
+
+    conn = utils.URIs.open_testdefault_cached()
+    xmls = _xmlparse_domains() * 20
+
+    def parse_cold():
+        for xml in xmls:
+            guest = Guest(conn, parsexml=xml)
+            dummy = (guest.name, guest.uuid)
+
+    def parse_accessed():
+        for xml in xmls:
+            guest = Guest(conn, parsexml=xml)
+            dummy = (guest.name, guest.uuid)
+            guest.devices.get_all()
+
+    _report("Guest parse, %d domains (ms)" % len(xmls), [
+        ["cold", "accessed"],
+        ["%.1f" % _timeit(parse_cold, 3),
+         "%.1f" % _timeit(parse_accessed, 3)]])
+
+
+def test_perf_xml_backends(monkeypatch):
+    """
+    Raw document parse and Guest parse plus full property reads over
+    the xmlparse domain fixtures, for every available XMLAPI backend
+    """
+    from tests import utils
+    from virtinst import Guest
+    from virtinst import xmlapi
+    from virtinst import xmlbuilder
+
+    conn = utils.URIs.open_testdefault_cached()
+    xmls = _xmlparse_domains() * 20
+
+    def parse_raw(backend):
+        for xml in xmls:
+            backend(xml)
+
+    def parse_guest():
+        for xml in xmls:
+            _read_all_props(Guest(conn, parsexml=xml))
+
+    rows = [["", "raw ms", "guest ms"]]
+    for name, backend in sorted(xmlapi.get_backends().items()):
+        monkeypatch.setattr(xmlbuilder, "XMLAPI", backend)
+        rows.append([name,
+                     "%.1f" % _timeit(lambda: parse_raw(backend), 3),
+                     "%.1f" % _timeit(parse_guest, 3)])
+    _report("XML backends, %d domains" % len(xmls), rows)
+
+
+def test_perf_guest_summary():
+    """
+    Cost of getting list view and path lookup values over the xmlparse
+    domain fixtures, from a GuestSummary and from a full Guest
+    """
+    from tests import utils
+    from virtinst import Guest
+    from virtinst import GuestSummary
+
+    conn = utils.URIs.open_testdefault_cached()
+    xmls = _xmlparse_domains() * 20
+
+    def from_guest():
+        for xml in xmls:
+            guest = Guest(conn, parsexml=xml)
+            dummy = (guest.name, guest.uuid, guest.title, guest.description,
+                     [disk.get_source_path() for disk in guest.devices.disk],
+                     [nic.macaddr for nic in guest.devices.interface])
+
+    def from_summary():
+        for xml in xmls:
+            summary = GuestSummary(conn, xml)
+            dummy = (summary.name, summary.uuid, summary.title,
+                     summary.description,
+                     [disk.get_source_path() for disk in summary.disks],
+                     [nic.macaddr for nic in summary.interfaces])
+
+    _report("Domain summary values, %d domains (ms)" % len(xmls), [
+        ["Guest", "GuestSummary"],
+        ["%.1f" % _timeit(from_guest, 3),
+         "%.1f" % _timeit(from_summary, 3)]])
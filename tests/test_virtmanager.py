@@ -0,0 +1,967 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+"""
+Unit tests for virtManager helpers that don't need a running UI
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import types
+
+import libvirt
+import pytest
+
+# Like virtmanager.py, import config first to resolve the
+# baseclass <-> config import cycle
+import virtManager.config  # pylint: disable=unused-import
+from virtManager.baseclass import vmmGObject
+from virtManager.connection import _TickPacer
+from virtManager.lib import metricsexporter
+from virtManager.lib import module_trace
+from virtManager.lib import statsproc
+from virtManager.lib.statsmanager import (StatsRing, StatsRollups,
+        _DeviceStats, _RollupTier, update_history_file, vmmStatsManager)
+from virtManager.lib.statsstore import StatsFile, open_stats_file
+from virtManager.lib import tickscheduler
+from virtManager.object.libvirtobject import vmmLibvirtObject
+
+from tests import utils
+
+# pylint: disable=protected-access
+
+
+class _FakeConn(object):
+    def __init__(self, uri):
+        self._uri = uri
+
+    def get_uri(self):
+        return self._uri
+
+
+####################
+# vmmLibvirtObject #
+####################
+
+class _FakeXMLObject(vmmLibvirtObject):
+    def __init__(self):
+        self.xml = "<foo/>"
+        conn = types.SimpleNamespace(get_backend=lambda: None)
+        vmmLibvirtObject.__init__(self, conn, None, "foo",
+                                  lambda backend, parsexml: [parsexml])
+
+    def _XMLDesc(self, flags):
+        return self.xml
+
+    def _cleanup(self):
+        pass
+
+
+def test_xml_parse_counts():
+    obj = _FakeXMLObject()
+    def _counts():
+        return vmmLibvirtObject.get_parse_counts().get(
+                "_FakeXMLObject", (0, 0))
+    hits, misses = _counts()
+
+    xmlobj = obj.get_xmlobj()
+    assert xmlobj == ["<foo/>"]
+    assert _counts() == (hits, misses + 1)
+
+    # Refreshing to identical XML is a hit and keeps the parsed object
+    obj.ensure_latest_xml(nosignal=True)
+    obj.ensure_latest_xml(nosignal=True)
+    assert _counts() == (hits + 2, misses + 1)
+    assert obj.get_xmlobj() is xmlobj
+
+    # Changed XML is parsed again on the next access
+    obj.xml = "<bar/>"
+    obj.ensure_latest_xml(nosignal=True)
+    assert _counts() == (hits + 2, misses + 1)
+    assert obj.get_xmlobj() == ["<bar/>"]
+    assert _counts() == (hits + 2, misses + 2)
+    assert obj.get_xmlobj() is obj.get_xmlobj()
+    assert _counts() == (hits + 2, misses + 2)
+
+
+##############
+# _TickPacer #
+##############
+
+def test_tick_pacer_latency():
+    pacer = _TickPacer(is_remote=False)
+    assert pacer.get_interval(1, 60) == 1
+
+    # First tick sets the latency, later ones are averaged in
+    pacer.record_tick(100, 2.0, True)
+    assert pacer.last_tick == 100
+    assert pacer.latency == 2.0
+    assert pacer.get_interval(1, 60) == 8.0
+    pacer.record_tick(110, 1.0, True)
+    assert abs(pacer.latency - 1.7) < 0.0001
+
+    # Result is clamped to the user's min/max interval
+    assert pacer.get_interval(1, 5) == 5
+    assert pacer.get_interval(10, 60) == 10
+
+    pacer.reset()
+    assert pacer.last_tick is None
+    assert pacer.get_interval(1, 60) == 1
+
+
+def test_tick_pacer_backoff():
+    # Local connections never back off for idleness
+    pacer = _TickPacer(is_remote=False)
+    for idx in range(20):
+        pacer.record_tick(idx, 0, False)
+    assert pacer.idle_ticks == 20
+    assert pacer.get_interval(1, 60) == 1
+
+    # Remote ones double the interval every IDLE_TICKS idle ticks
+    pacer = _TickPacer(is_remote=True)
+    for idx in range(_TickPacer.IDLE_TICKS - 1):
+        pacer.record_tick(idx, 0, False)
+    assert pacer.get_interval(1, 60) == 1
+    pacer.record_tick(10, 0, False)
+    assert pacer.get_interval(1, 60) == 2
+    for idx in range(_TickPacer.IDLE_TICKS):
+        pacer.record_tick(idx, 0, False)
+    assert pacer.get_interval(1, 60) == 4
+
+    # Backoff is capped by MAX_BACKOFF and the max interval
+    for idx in range(_TickPacer.IDLE_TICKS * 20):
+        pacer.record_tick(idx, 0, False)
+    assert pacer.get_interval(1, 1000) == 2 ** _TickPacer.MAX_BACKOFF
+    assert pacer.get_interval(1, 60) == 60
+
+    # A change seen by a tick or an event resets the backoff
+    pacer.record_tick(200, 0, True)
+    assert pacer.idle_ticks == 0
+    assert pacer.get_interval(1, 60) == 1
+    for idx in range(_TickPacer.IDLE_TICKS):
+        pacer.record_tick(idx, 0, False)
+    pacer.note_change()
+    pacer.record_tick(300, 0, False)
+    assert pacer.idle_ticks == 0
+
+
+####################
+# vmmTickScheduler #
+####################
+
+def test_tick_scheduler_coalesce():
+    # Don't start any workers, so we can drive the queue directly
+    sched = tickscheduler.vmmTickScheduler(None, 1)
+    conn1 = _FakeConn("test:///1")
+    conn2 = _FakeConn("test:///2")
+
+    sched.add(conn1, False, {"pollvm": True, "stats_update": False})
+    sched.add(conn1, True, {"pollnet": True, "stats_update": True})
+    sched.add(conn2, False, {"pollvm": True})
+    assert sched.coalesced_count == 1
+    assert sched.get_coalesced_counts() == {"test:///1": 1}
+
+    # Flags of merged requests are OR-ed, and the higher prio wins
+    state, req = sched._next_request()
+    assert state.conn is conn1
+    assert req.prio == tickscheduler.PRIO_HIGH
+    assert req.kwargs == {"pollvm": True, "pollnet": True,
+                          "stats_update": True}
+
+    # A running connection isn't handed out again, new requests
+    # are queued behind the other connections
+    sched.add(conn1, False, {"pollpool": True})
+    state2, req2 = sched._next_request()
+    assert state2.conn is conn2
+    assert req2.kwargs == {"pollvm": True}
+    with sched._cond:
+        sched._finish(state)
+        sched._finish(state2)
+    state, req = sched._next_request()
+    assert state.conn is conn1
+    assert req.kwargs == {"pollpool": True}
+    with sched._cond:
+        sched._finish(state)
+    assert not sched._states
+
+
+def test_tick_scheduler_stale():
+    sched = tickscheduler.vmmTickScheduler(None, 1)
+    conn1 = _FakeConn("test:///1")
+    conn2 = _FakeConn("test:///2")
+
+    # Low priority ticks past their deadline are dropped,
+    # high priority ones never are
+    past = time.monotonic() - 10
+    sched.add(conn1, False, {"pollvm": True}, deadline=past)
+    sched.add(conn2, True, {"pollvm": True}, deadline=past)
+    state, req = sched._next_request()
+    assert state.conn is conn2
+    assert req.prio == tickscheduler.PRIO_HIGH
+    assert sched.expired_count == 1
+    assert conn1 not in sched._states
+
+
+def test_tick_scheduler_workers():
+    ticked = []
+    done = threading.Event()
+    def tick_cb(conn, kwargs):
+        ticked.append((conn.get_uri(), kwargs))
+        if len(ticked) == 2:
+            done.set()
+
+    sched = tickscheduler.vmmTickScheduler(tick_cb, 2)
+    sched.start()
+    try:
+        sched.add(_FakeConn("test:///1"), True, {"pollvm": True})
+        sched.add(_FakeConn("test:///2"), True, {"pollnet": True})
+        assert done.wait(10)
+    finally:
+        sched.stop()
+    assert sorted(ticked) == [("test:///1", {"pollvm": True}),
+                              ("test:///2", {"pollnet": True})]
+
+
+################
+# module_trace #
+################
+
+def test_api_stats():
+    stats = module_trace._APIStats()
+    stats.record(0.0005, True)
+    stats.record(0.003, False)
+    stats.record(0.003, False)
+    stats.record(20, False)
+
+    ret = stats.get_dict()
+    assert ret["count"] == 4
+    assert ret["main_thread"] == 1
+    assert ret["worker_threads"] == 3
+    assert ret["max_ms"] == 20000
+    assert abs(ret["total_ms"] - 20006.5) < 0.0001
+    assert abs(ret["avg_ms"] - 20006.5 / 4) < 0.0001
+    assert ret["histogram_ms"]["1"] == 1
+    assert ret["histogram_ms"]["5"] == 2
+    assert ret["histogram_ms"]["inf"] == 1
+    assert sum(ret["histogram_ms"].values()) == 4
+
+    assert module_trace._APIStats().get_dict()["avg_ms"] == 0
+
+
+def test_call_stats():
+    class _FakeVirConnect(object):
+        pass
+    class _FakeVirDomain(object):
+        def __init__(self, conn):
+            self._conn = conn
+    class _FakeVirSnapshot(object):
+        def __init__(self, dom):
+            self._dom = dom
+
+    virconn = _FakeVirConnect()
+    dom = _FakeVirDomain(virconn)
+    uris = {virconn: "test:///default"}
+    stats = module_trace._CallStats(uris)
+
+    # Calls are mapped to the URI through the object's connection
+    stats.record("virConnect.getInfo", virconn, 0.001, True)
+    stats.record("virDomain.info", dom, 0.001, False)
+    stats.record("virDomainSnapshot.getXMLDesc",
+                 _FakeVirSnapshot(dom), 0.001, False)
+    stats.record("virDomain.info", _FakeVirDomain(None), 0.001, False)
+    stats.record("open", None, 0.001, True)
+
+    ret = stats.get_dict()
+    unknown = module_trace._CallStats.UNKNOWN_URI
+    assert sorted(ret["test:///default"]) == ["virConnect.getInfo",
+            "virDomain.info", "virDomainSnapshot.getXMLDesc"]
+    assert ret[unknown]["virDomain.info"]["count"] == 1
+    assert ret[unknown]["open"]["main_thread"] == 1
+
+    stats.reset("test:///default")
+    assert list(stats.get_dict()) == [unknown]
+    stats.reset()
+    assert stats.get_dict() == {}
+
+
+def test_enable_stats(tmpdir, monkeypatch):
+    class virFake(object):
+        def ping(self):
+            return "pong"
+        def name(self):
+            return "fake"
+    def openFake():
+        return virFake()
+
+    module = types.ModuleType("fakelibvirt")
+    module.virFake = virFake
+    module.openFake = openFake
+    monkeypatch.setattr(module_trace, "STATS", None)
+    monkeypatch.setattr(module_trace, "_WRAPPED", set())
+    monkeypatch.setattr(module_trace, "TRACE", True)
+
+    # Nothing is wrapped or collected until requested
+    assert module_trace.get_stats() == {}
+    assert module.openFake is openFake
+
+    module_trace.enable_stats(module)
+    assert module.openFake is not openFake
+    wrapped = module.openFake
+    module_trace.enable_stats(module)
+    assert module.openFake is wrapped
+
+    conn = module.openFake()
+    module_trace.register_conn(conn, "fake:///")
+    assert conn.ping() == "pong"
+    assert conn.ping() == "pong"
+    assert conn.name() == "fake"
+
+    ret = module_trace.get_stats()
+    assert ret["fake:///"]["virFake.ping"]["count"] == 2
+    # Calls that don't hit the network aren't timed
+    assert "virFake.name" not in ret["fake:///"]
+    assert ret[module_trace._CallStats.UNKNOWN_URI]["openFake"]["count"] == 1
+
+    path = str(tmpdir.join("stats.json"))
+    module_trace.dump_stats(path)
+    with open(path) as f:
+        assert json.load(f) == ret
+    module_trace.reset_stats()
+    assert module_trace.get_stats() == {}
+
+
+#############
+# StatsRing #
+#############
+
+def _make_ring(capacity, count):
+    ring = StatsRing(["timestamp", "cpu"], capacity)
+    for idx in range(count):
+        ring.append({"timestamp": idx, "cpu": idx * 10})
+    return ring
+
+
+def test_stats_ring_append():
+    ring = _make_ring(4, 0)
+    assert len(ring) == 0
+    assert ring.capacity == 4
+    assert ring.get("cpu") == 0
+    assert list(ring.window("cpu", 4)) == []
+
+    # Objects with attributes work as well as dicts
+    class _Sample(object):
+        timestamp = 0
+        cpu = 0
+    ring.append(_Sample())
+    assert len(ring) == 1
+
+    # Wrap around a few times, only the newest samples are kept
+    ring = _make_ring(4, 11)
+    assert len(ring) == 4
+    assert [ring.get("cpu", idx) for idx in range(5)] == [100, 90, 80, 70, 0]
+    assert list(ring.window("timestamp", 4)) == [7, 8, 9, 10]
+    assert list(ring.window("timestamp", 2)) == [9, 10]
+    assert list(ring.window("timestamp", 100)) == [7, 8, 9, 10]
+
+    # The window is always contiguous, at every ring position
+    for count in range(1, 9):
+        ring = _make_ring(3, count)
+        expect = list(range(max(0, count - 3), count))
+        assert list(ring.window("timestamp", 3)) == expect
+
+
+def test_stats_ring_resize():
+    # Growing keeps all samples, and appends continue after them
+    ring = _make_ring(4, 6)
+    ring.resize(8)
+    assert ring.capacity == 8
+    assert len(ring) == 4
+    assert list(ring.window("timestamp", 8)) == [2, 3, 4, 5]
+    for idx in range(6, 12):
+        ring.append({"timestamp": idx, "cpu": 0})
+    assert list(ring.window("timestamp", 8)) == list(range(4, 12))
+
+    # Shrinking keeps the newest samples
+    ring.resize(3)
+    assert len(ring) == 3
+    assert list(ring.window("timestamp", 8)) == [9, 10, 11]
+    ring.append({"timestamp": 12, "cpu": 0})
+    assert list(ring.window("timestamp", 8)) == [10, 11, 12]
+
+    # Shrinking a partly filled ring
+    ring = _make_ring(10, 2)
+    ring.resize(5)
+    assert list(ring.window("timestamp", 5)) == [0, 1]
+    ring.resize(5)
+    ring.resize(0)
+    assert ring.capacity == 1
+    assert list(ring.window("timestamp", 5)) == [1]
+
+
+def test_stats_ring_get_vector():
+    ring = _make_ring(4, 6)
+    # Newest first, scaled by ceil, padded with zeroes
+    assert ring.get_vector("cpu", 2) == [0.5, 0.4]
+    assert ring.get_vector("cpu", 6, ceil=10) == [5, 4, 3, 2, 0, 0]
+    assert _make_ring(4, 0).get_vector("cpu", 2) == [0, 0]
+
+
+################
+# StatsRollups #
+################
+
+def test_rollup_tier():
+    tier = _RollupTier(["cpu"], 10, 5, ("min", "avg", "max"))
+    for timestamp in range(30):
+        tier.add(timestamp, {"cpu": timestamp}.get)
+
+    # Buckets are aggregated, the one being filled is included
+    assert tier.get_vector("cpu", "avg", 3, ceil=1) == [24.5, 14.5, 4.5]
+    assert tier.get_vector("cpu", "avg", 5, ceil=1) == [
+            24.5, 14.5, 4.5, 0, 0]
+    assert tier.get_vector("cpu", "min", 3, ceil=1) == [20, 10, 0]
+    assert tier.get_vector("cpu", "max", 3, ceil=1) == [29, 19, 9]
+
+    # Buckets without samples are filled in with zeroes
+    tier.add(60, {"cpu": 100}.get)
+    assert tier.get_vector("cpu", "avg", 5, ceil=1) == [100, 0, 0, 0, 24.5]
+
+    # step merges buckets into single points with the bucket's func
+    assert tier.get_vector("cpu", "avg", 4, step=2, ceil=1) == [50, 0]
+    assert tier.get_vector("cpu", "avg", 5, step=2, ceil=1) == [
+            50, 0, 24.5]
+    assert tier.get_vector("cpu", "min", 5, step=2, ceil=1) == [0, 0, 20]
+    assert tier.get_vector("cpu", "max", 5, step=2, ceil=1) == [
+            100, 0, 29]
+
+    # A gap longer than the tier only clears the tier
+    tier.add(1000, {"cpu": 10}.get)
+    assert tier.get_vector("cpu", "avg", 5, ceil=1) == [10, 0, 0, 0, 0]
+
+
+def test_stats_rollups():
+    names = ["timestamp", "cpu"]
+    raw = StatsRing(names, 700)
+    rollups = StatsRollups(["cpu"], 600)
+    assert rollups.window == 600
+    for timestamp in range(600):
+        sample = {"timestamp": timestamp, "cpu": 50}
+        raw.append(sample)
+        rollups.add(sample)
+
+    # Every tier covers the whole window with the average value
+    for points, expectlen in [
+            (1000, 600),  # raw samples
+            (100, 60),  # 10 second buckets
+            (20, 10),  # 1 minute buckets
+            (5, 5)]:  # 1 minute buckets, merged
+        ret = rollups.get_vector(raw, "cpu", points, 1)
+        assert ret == [0.5] * expectlen
+
+    # Raw samples are only used if the ring holds the whole window
+    small = StatsRing(names, 100)
+    assert len(rollups.get_vector(small, "cpu", 1000, 1)) == 60
+
+
+def test_stats_rollups_range():
+    raw = StatsRing(["timestamp", "cpu"], 700)
+    rollups = StatsRollups(["cpu"], 600)
+    for timestamp in range(600):
+        sample = {"timestamp": timestamp, "cpu": timestamp}
+        raw.append(sample)
+        rollups.add(sample)
+
+    # The 1 minute extremes are only kept by the 1 minute tier
+    assert rollups.get_vector(raw, "cpu", 20, 1, ceil=1, func="max") == [
+            599, 539, 479, 419, 359, 299, 239, 179, 119, 59]
+
+    # Points finer than a minute get the extremes of their minute
+    for points, perminute in [(1000, 60), (100, 6)]:
+        vmin, vmax = rollups.get_range_vectors(raw, "cpu", points, 1,
+                                               ceil=1)
+        assert len(vmin) == len(vmax) == 10 * perminute
+        assert vmin[0] == 540 and vmax[0] == 599
+        assert vmin[perminute] == 480 and vmax[perminute - 1] == 599
+        assert vmin[-1] == 0 and vmax[-1] == 59
+
+    # Coarser points get the extremes of all the minutes they span
+    vmin, vmax = rollups.get_range_vectors(raw, "cpu", 5, 1, ceil=1)
+    assert vmin == [480, 360, 240, 120, 0]
+    assert vmax == [599, 479, 359, 239, 119]
+
+
+#############
+# StatsFile #
+#############
+
+def _fill_stats_file(statsfile, start, count):
+    for idx in range(start, start + count):
+        statsfile.append({"timestamp": idx, "cpu": idx * 10.0})
+
+
+def test_stats_file_roundtrip(tmpdir):
+    path = str(tmpdir.join("stats"))
+    statsfile = StatsFile(path, ["timestamp", "cpu"], 10)
+    assert len(statsfile) == 0
+    assert statsfile.capacity == 10
+    assert statsfile.get_vector("cpu", 3) == [0, 0, 0]
+    _fill_stats_file(statsfile, 0, 4)
+    assert statsfile.get_vector("cpu", 5, ceil=10) == [3, 2, 1, 0, 0]
+    statsfile.close()
+
+    # Samples survive reopening the file
+    statsfile = StatsFile(path, ["timestamp", "cpu"], 10)
+    assert len(statsfile) == 4
+    assert statsfile.get_vector("timestamp", 4, ceil=1) == [3, 2, 1, 0]
+    _fill_stats_file(statsfile, 4, 1)
+    assert statsfile.get_vector("timestamp", 5, ceil=1) == [4, 3, 2, 1, 0]
+    statsfile.close()
+
+    # open_stats_file creates missing directories
+    path = str(tmpdir.join("newdir", "stats"))
+    statsfile = open_stats_file(path, ["timestamp"], 5)
+    assert os.path.exists(path)
+    statsfile.close()
+
+
+def test_stats_file_wraparound(tmpdir):
+    path = str(tmpdir.join("stats"))
+    statsfile = StatsFile(path, ["timestamp", "cpu"], 4)
+    _fill_stats_file(statsfile, 0, 11)
+    assert len(statsfile) == 4
+    assert statsfile.get_vector("timestamp", 6, ceil=1) == [
+            10, 9, 8, 7, 0, 0]
+    statsfile.close()
+
+    statsfile = StatsFile(path, ["timestamp", "cpu"], 4)
+    assert statsfile.get_vector("timestamp", 4, ceil=1) == [10, 9, 8, 7]
+    statsfile.close()
+
+
+def test_stats_file_downsample(tmpdir):
+    statsfile = StatsFile(str(tmpdir.join("stats")), ["timestamp"], 100)
+    _fill_stats_file(statsfile, 0, 10)
+    # Each point averages a bucket of samples, newest first, rather
+    # than picking single samples
+    assert statsfile.get_vector("timestamp", 5, ceil=1) == [
+            8.5, 6.5, 4.5, 2.5, 0.5]
+    # Uneven buckets, the oldest one is short
+    assert statsfile.get_vector("timestamp", 3, ceil=1) == [7.5, 3.5, 0.5]
+    statsfile.close()
+
+    # Long buckets, here wrapping around the end of the file, are
+    # averaged from a strided subset of their samples
+    statsfile = StatsFile(str(tmpdir.join("stats2")), ["timestamp"], 100)
+    _fill_stats_file(statsfile, 0, 230)
+    newer, older = statsfile.get_vector("timestamp", 2, ceil=1)
+    assert abs(newer - 204.5) <= StatsFile._BUCKET_SAMPLES / 4
+    assert abs(older - 154.5) <= StatsFile._BUCKET_SAMPLES / 4
+    # All views into the mapping were released, or this would fail
+    statsfile.close()
+
+
+def test_stats_file_resize(tmpdir):
+    path = str(tmpdir.join("stats"))
+    statsfile = StatsFile(path, ["timestamp", "cpu"], 4)
+    _fill_stats_file(statsfile, 0, 3)
+    statsfile.close()
+
+    # A different capacity or different metrics start a fresh file
+    statsfile = StatsFile(path, ["timestamp", "cpu"], 8)
+    assert len(statsfile) == 0
+    assert statsfile.capacity == 8
+    _fill_stats_file(statsfile, 0, 3)
+    statsfile.close()
+    statsfile = StatsFile(path, ["timestamp", "mem"], 8)
+    assert len(statsfile) == 0
+    statsfile.close()
+
+    # So does a corrupted header
+    with open(path, "r+b") as f:
+        f.write(b"garbage!")
+    statsfile = StatsFile(path, ["timestamp", "mem"], 8)
+    assert len(statsfile) == 0
+    statsfile.close()
+
+
+def test_update_history_file(tmpdir):
+    class _FakeConfig(object):
+        hours = 0
+        def get_stats_persist_hours(self):
+            return self.hours
+        def get_stats_update_interval(self):
+            return 60
+
+    config = _FakeConfig()
+    path = str(tmpdir.join("host-stats"))
+    names = ["timestamp", "cpuHostPercent", "notpersisted"]
+    assert update_history_file(config, None, path, names) is None
+
+    # Enabling the setting later takes effect on the next update
+    config.hours = 1
+    history = update_history_file(config, None, path, names)
+    assert history.capacity == 60
+    assert update_history_file(config, history, path, names) is history
+
+    config.hours = 2
+    newhistory = update_history_file(config, history, path, names)
+    assert newhistory is not history
+    assert newhistory.capacity == 120
+
+    config.hours = 0
+    assert update_history_file(config, newhistory, path, names) is None
+
+
+###################
+# metricsexporter #
+###################
+
+def _metrics_conn(uri, records):
+    statslist = types.SimpleNamespace(
+            get_record=lambda name: records.get(name, 0))
+    conn = _FakeConn(uri)
+    conn.statsmanager = types.SimpleNamespace(
+            get_vm_statslist=lambda vm: statslist)
+    conn.get_poll_interval = lambda: 2
+    conn.host_cpu_time_percentage = lambda: float("nan")
+    conn.stats_memory = lambda: 1024
+    conn.stats_memory_percentage = lambda: float("inf")
+    return conn
+
+
+def _scrape_unix(path, urlpath="/metrics"):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(b"GET %s HTTP/1.0\r\n\r\n" % urlpath.encode())
+        response = b""
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            response += data
+    finally:
+        sock.close()
+    headers, body = response.decode("utf-8").split("\r\n\r\n", 1)
+    return headers.splitlines()[0], body
+
+
+def test_metrics_format_value():
+    assert metricsexporter._format_value(True) == "1.0"
+    assert metricsexporter._format_value(0.5) == "0.5"
+    assert metricsexporter._format_value(float("nan")) == "NaN"
+    assert metricsexporter._format_value(float("inf")) == "+Inf"
+    assert metricsexporter._format_value(float("-inf")) == "-Inf"
+
+
+def test_metrics_exporter_unix_path_in_use(tmpdir):
+    # A stale socket is replaced, anything else at the path is left
+    # alone and the exporter isn't started
+    path = str(tmpdir.join("metrics.sock"))
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    metricsexporter.start("unix:" + path)
+    try:
+        assert metricsexporter.is_running()
+    finally:
+        metricsexporter.stop()
+    assert not os.path.exists(path)
+
+    with open(path, "w") as f:
+        f.write("data")
+    metricsexporter.start("unix:" + path)
+    assert not metricsexporter.is_running()
+    with open(path) as f:
+        assert f.read() == "data"
+
+
+def test_metrics_exporter_unix(tmpdir):
+    path = str(tmpdir.join("metrics.sock"))
+    uri = "test:///default"
+    vm = types.SimpleNamespace(get_name=lambda: "foo\"bar",
+                               get_uuid=lambda: "1234",
+                               is_active=lambda: True)
+    conn = _metrics_conn(uri, {"cpuHostPercent": 12.5,
+                               "curmem": 2,
+                               "diskRdKiB": float("-inf")})
+
+    metricsexporter.start("unix:" + path)
+    try:
+        assert metricsexporter.is_running()
+        metricsexporter.update_connection(conn, [vm])
+        status, body = _scrape_unix(path)
+    finally:
+        metricsexporter.stop()
+    assert not metricsexporter.is_running()
+    assert not os.path.exists(path)
+
+    assert status.split()[1] == "200"
+    lines = body.splitlines()
+    assert "# TYPE virt_manager_domain_up gauge" in lines
+    assert ("# TYPE virt_manager_domain_cpu_time_seconds_total counter"
+            in lines)
+    vmlabels = '{domain="foo\\"bar",uri="%s",uuid="1234"}' % uri
+    assert "virt_manager_domain_up%s 1.0" % vmlabels in lines
+    assert ("virt_manager_domain_cpu_host_percent%s 12.5" % vmlabels
+            in lines)
+    assert ("virt_manager_domain_memory_used_bytes%s 2048.0" % vmlabels
+            in lines)
+    assert ("virt_manager_domain_disk_read_bytes_total%s -Inf" % vmlabels
+            in lines)
+    connlabels = '{uri="%s"}' % uri
+    assert "virt_manager_connection_cpu_percent%s NaN" % connlabels in lines
+    assert ("virt_manager_connection_memory_used_percent%s +Inf" %
+            connlabels in lines)
+    assert ("virt_manager_connection_domains_running%s 1.0" % connlabels
+            in lines)
+    assert ("virt_manager_connection_poll_interval_seconds%s 2.0" %
+            connlabels in lines)
+    # python's repr spellings must never leak into the output
+    for line in lines:
+        if not line.startswith("#"):
+            assert line.rsplit(" ", 1)[1] not in ["nan", "inf", "-inf"]
+
+    # Unknown paths get a 404, removed connections disappear
+    metricsexporter.start("unix:" + path)
+    try:
+        metricsexporter.update_connection(conn, [vm])
+        status, body = _scrape_unix(path, "/foo")
+        assert status.split()[1] == "404"
+        metricsexporter.remove_connection(uri)
+        status, body = _scrape_unix(path)
+        assert status.split()[1] == "200"
+        assert "uri=" not in body
+    finally:
+        metricsexporter.stop()
+
+
+###################
+# vmmStatsManager #
+###################
+
+def test_stats_manager_watchers(monkeypatch):
+    config = types.SimpleNamespace(hours=0)
+    config.get_stats_persist_hours = lambda: config.hours
+    monkeypatch.setattr(vmmStatsManager, "config", config)
+    fetched = []
+    monkeypatch.setattr(vmmStatsManager, "_get_all_stats",
+        lambda self, conn, uuids: fetched.append(uuids) or {})
+    def _vm(uuid):
+        return types.SimpleNamespace(get_uuid=lambda: uuid)
+    vm1, vm2, vm3 = _vm("1"), _vm("2"), _vm("3")
+    owner1, owner2 = object(), object()
+
+    manager = vmmStatsManager()
+    # Nobody registered, all VMs are polled
+    assert manager._get_watched_uuids() is None
+    manager.cache_all_stats(None)
+    assert fetched.pop() is None
+    assert manager.polled_all_vms()
+
+    manager.set_watched_vms(owner1, [vm1, vm2])
+    manager.set_watched_vms(owner2, [vm2, vm3])
+    assert manager._get_watched_uuids() == set(["1", "2", "3"])
+    manager.set_watched_vms(owner2, [])
+    assert manager._get_watched_uuids() == set(["1", "2"])
+    manager.cache_all_stats(None)
+    assert fetched.pop() == set(["1", "2"])
+    assert not manager.polled_all_vms()
+    # Unwatched VMs keep their last sample, and aren't sampled at all
+    manager.refresh_vm_stats(vm3)
+    assert not manager._vm_stats_by_uuid
+
+    # Owners watching all VMs, the metrics exporter and the on disk
+    # history all need stats of every VM
+    manager.set_watched_vms(owner2, None)
+    assert manager._get_watched_uuids() is None
+    manager.unwatch_vms(owner2)
+    assert manager._get_watched_uuids() == set(["1", "2"])
+    monkeypatch.setattr(metricsexporter, "is_running", lambda: True)
+    assert manager._get_watched_uuids() is None
+    monkeypatch.setattr(metricsexporter, "is_running", lambda: False)
+    config.hours = 1
+    assert manager._get_watched_uuids() is None
+    config.hours = 0
+
+    manager.unwatch_vms(owner1)
+    manager.unwatch_vms(owner1)
+    assert manager._get_watched_uuids() is None
+    manager.cache_all_stats(None)
+    assert manager.polled_all_vms()
+
+
+def test_device_stats():
+    stats = _DeviceStats(("rd", "wr"), 1024.0)
+    stats.update(10, [("vda", 0, 0), ("vdb", 0, 0)])
+    assert stats.get_latest() == [("vda", [0, 0]), ("vdb", [0, 0])]
+
+    # Rates are per device, a new device starts at zero
+    stats.update(12, [("vda", 2048, 4096), ("vdc", 1024, 1024)])
+    assert stats.get_latest() == [("vda", [1, 2]), ("vdc", [0, 0])]
+
+    # Counter resets don't produce negative rates
+    stats.update(13, [("vda", 0, 0), ("vdc", 2048, 1024)])
+    assert stats.get_latest() == [("vda", [0, 0]), ("vdc", [1, 0])]
+
+
+def test_stats_manager_records(monkeypatch):
+    config = types.SimpleNamespace(
+        get_stats_persist_hours=lambda: 0,
+        get_stats_graph_window=lambda: 0,
+        get_stats_history_length=lambda: 10,
+        get_stats_update_interval=lambda: 1,
+        get_stats_enable_cpu_poll=lambda: True,
+        get_stats_enable_memory_poll=lambda: True,
+        get_stats_enable_disk_poll=lambda: True,
+        get_stats_enable_net_poll=lambda: True)
+    monkeypatch.setattr(vmmGObject, "config", config)
+    conn = types.SimpleNamespace(
+        host_active_processor_count=lambda: 4,
+        get_cache_dir=lambda: "/nonexistent",
+        support=types.SimpleNamespace(conn_mem_stats_period=lambda: False))
+    def _vm(uuid):
+        return types.SimpleNamespace(get_uuid=lambda: uuid,
+            get_name=lambda: uuid, is_active=lambda: True, conn=conn)
+    bulkvm, apivm = _vm("1"), _vm("2")
+
+    manager = vmmStatsManager()
+    stats = {"state.state": libvirt.VIR_DOMAIN_RUNNING,
+             "vcpu.current": 2, "cpu.time": 0,
+             "balloon.current": 1000, "balloon.unused": 250,
+             "block.rd.bytes": 2048, "block.wr.bytes": 4096,
+             "net.rx.bytes": 1024, "net.tx.bytes": 3072}
+    monkeypatch.setattr(manager, "_sample_vm_stats",
+                        lambda vm: dict(stats))
+    monkeypatch.setattr(manager, "_get_all_stats",
+                        lambda conn, uuids: {"1": dict(stats)})
+
+    # Bulk stats and the per VM APIs end up in the same record
+    for cputime in [0, 10 ** 9]:
+        stats["cpu.time"] = cputime
+        manager.cache_all_stats(None)
+        for vm in [bulkvm, apivm]:
+            manager.refresh_vm_stats(vm)
+
+    bulk = manager.get_vm_statslist(bulkvm)
+    api = manager.get_vm_statslist(apivm)
+    for name in ["cpuTimeAbs", "currMemPercent", "curmem",
+                 "diskRdKiB", "diskWrKiB", "netRxKiB", "netTxKiB"]:
+        assert bulk.get_record(name) == api.get_record(name)
+    assert bulk.get_record("currMemPercent") == 75
+    assert bulk.get_record("diskWrKiB") == 4
+    assert bulk.get_record("cpuGuestPercent") > 0
+
+
+#############
+# statsproc #
+#############
+
+class _FakeDomain(object):
+    def __init__(self, uuid):
+        self._uuid = uuid
+
+    def UUIDString(self):
+        return self._uuid
+
+
+class _FakeStatsBackend(object):
+    """
+    Reports cpu.time only when the CPU stats family is requested, and
+    records every bulk stats call
+    """
+    def __init__(self, uuids):
+        self.doms = [_FakeDomain(uuid) for uuid in uuids]
+        self.calls = []
+
+    def _stats(self, dom, statflags):
+        ret = {"state.state": 1}
+        if statflags & libvirt.VIR_DOMAIN_STATS_CPU_TOTAL:
+            ret["cpu.time"] = int(dom.UUIDString()) * 1000
+        return ret
+
+    def getAllDomainStats(self, statflags, flags):
+        self.calls.append(("all", statflags, None))
+        return [(dom, self._stats(dom, statflags)) for dom in self.doms]
+
+    def domainListGetStats(self, doms, statflags, flags):
+        self.calls.append(("list", statflags,
+                           [dom.UUIDString() for dom in doms]))
+        return [(dom, self._stats(dom, statflags)) for dom in doms]
+
+
+def test_fetch_domain_stats_subset():
+    state = libvirt.VIR_DOMAIN_STATS_STATE
+    statflags = state | libvirt.VIR_DOMAIN_STATS_CPU_TOTAL
+    backend = _FakeStatsBackend(["1", "2", "3"])
+
+    # Without a subset every domain gets full stats in one call
+    allstats = statsproc.fetch_domain_stats(backend, statflags)
+    assert backend.calls == [("all", statflags, None)]
+    assert sorted(allstats) == ["1", "2", "3"]
+    assert all("cpu.time" in stats for stats in allstats.values())
+
+    # With a subset, all domains get state stats, and only the
+    # watched ones get full stats
+    backend.calls = []
+    stats = statsproc.fetch_domain_stats(backend, statflags,
+                                         set(["2", "3", "4"]))
+    assert backend.calls == [("all", state, None),
+                             ("list", statflags, ["2", "3"])]
+    assert sorted(stats) == ["1", "2", "3"]
+    assert "cpu.time" not in stats["1"]
+    assert stats["1"]["state.state"] == 1
+    assert stats["2"] == allstats["2"]
+    assert stats["3"]["cpu.time"] == 3000
+
+    # Nothing watched, or only state stats requested, needs no
+    # domainListGetStats call
+    backend.calls = []
+    stats = statsproc.fetch_domain_stats(backend, statflags, set())
+    assert backend.calls == [("all", state, None)]
+    assert sorted(stats) == ["1", "2", "3"]
+    backend.calls = []
+    statsproc.fetch_domain_stats(backend, state, set(["1"]))
+    assert backend.calls == [("all", state, None)]
+
+
+def test_stats_process():
+    # A plain test:///path URI, so the helper's own connection
+    # sees the same VMs as ours
+    uri = "test://%s" % os.path.join(utils.DATADIR,
+            "testdriver", "testdefault.xml")
+    conn = libvirt.open(uri)
+    statflags = libvirt.VIR_DOMAIN_STATS_STATE
+    expected = statsproc.fetch_domain_stats(conn, statflags)
+    assert expected
+
+    proc = statsproc.vmmStatsProcess(uri)
+    try:
+        assert not proc.is_alive()
+        assert proc.fetch(statflags) == expected
+        assert proc.is_alive()
+        # Unchanged stats are only sent as an empty delta, and the
+        # snapshot is handed out without copying it
+        snapshot = proc.fetch(statflags)
+        assert snapshot == expected
+        assert proc.fetch(statflags) is snapshot
+
+        # A dead helper is restarted on the next fetch
+        proc._proc.kill()
+        proc._proc.wait()
+        assert not proc.is_alive()
+        assert proc.fetch(statflags) == expected
+    finally:
+        proc.stop()
+    assert not proc.is_alive()
+    conn.close()
+
+
+def test_stats_process_open_failed():
+    proc = statsproc.vmmStatsProcess("test:///idontexist.xml")
+    with pytest.raises(RuntimeError, match="failed to open"):
+        proc.fetch(libvirt.VIR_DOMAIN_STATS_STATE)
+    assert not proc.is_alive()
@@ -0,0 +1,161 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+"""
+Conformance tests for the XMLAPI backends. Every tests/data/xmlparse
+case is run through all available backends, which must return the
+same values and generate the same XML.
+"""
+
+import os
+
+import pytest
+
+import virtinst
+from virtinst import xmlapi
+from virtinst import xmlbuilder
+from virtinst import xmlutil
+
+from tests import utils
+
+
+DATADIR = utils.DATADIR + "/xmlparse/"
+_FIXTURES = sorted(f for f in os.listdir(DATADIR) if f.endswith(".xml"))
+
+
+####################
+# Helper functions #
+####################
+
+def _read_fixture(filename):
+    with open(DATADIR + filename) as f:
+        return f.read()
+
+
+def _compare_backends(cb):
+    """
+    Run cb(backend) for every XMLAPI backend and check all results
+    match the default backend's
+    """
+    backends = xmlapi.get_backends()
+    if len(backends) < 2:
+        pytest.skip("Only one XML backend is available")
+
+    expected = cb(xmlapi.XMLAPI)
+    for name, backend in sorted(backends.items()):
+        if backend is xmlapi.XMLAPI:
+            continue
+        assert cb(backend) == expected, "backend=%s" % name
+
+
+def _read_all_props(obj, prefix=""):
+    """
+    Return a list of (name, value) of every XMLProperty of obj and
+    its children
+    """
+    ret = []
+    for propname in sorted(obj._all_xml_props()):
+        ret.append((prefix + propname, getattr(obj, propname)))
+    for propname in sorted(obj._all_child_props()):
+        children = xmlutil.listify(getattr(obj, propname))
+        for idx, child in enumerate(children):
+            ret += _read_all_props(child,
+                                   "%s%s[%d]." % (prefix, propname, idx))
+    return ret
+
+
+##############
+# Test cases #
+##############
+
+@pytest.mark.parametrize("filename", _FIXTURES)
+def testBackendRoundtrip(filename):
+    xml = _read_fixture(filename)
+
+    def _cb(backend):
+        api = backend(xml)
+        return api.get_xml("."), api.count("./*")
+    _compare_backends(_cb)
+
+
+@pytest.mark.parametrize("filename", _FIXTURES)
+def testBackendEdits(filename):
+    """
+    Run the same low level edits on the raw document
+    """
+    xml = _read_fixture(filename)
+
+    def _cb(backend):
+        api = backend(xml)
+        reads = []
+        api.set_xpath_content("./@conformance", "a&b'\"<>")
+        api.set_xpath_content("./description", "foo")
+        api.set_xpath_content("./conformance/text", "foo <bar> & baz")
+        api.set_xpath_content("./conformance/flag", True)
+        api.set_xpath_content(
+                "./qemu:commandline/qemu:arg[@value='-foo']", True)
+        reads.append(api.get_xpath_content("./@conformance", False))
+        reads.append(api.get_xpath_content("./conformance/text", False))
+        reads.append(api.get_xpath_content("./conformance/flag", True))
+        reads.append(api.get_xml("./conformance"))
+
+        api.node_add_xml("<added a='1'>\n  <sub/>\n</added>",
+                         "./conformance")
+        api.node_replace_xml("./conformance/item", "<item name='y'/>")
+        api.set_xpath_content("./conformance/text", None)
+        api.node_force_remove("./*[1]")
+        api.node_clear("./conformance/added")
+        reads.append(api.count("./conformance/*"))
+        return reads, api.get_xml(".")
+    _compare_backends(_cb)
+
+
+@pytest.mark.parametrize("filename",
+        [f for f in _FIXTURES if "<domain" in _read_fixture(f)[:200]])
+def testBackendGuest(filename, monkeypatch):
+    """
+    Parse, read and alter the domain fixtures with Guest objects
+    """
+    conn = utils.URIs.open_testdefault_cached()
+    xml = _read_fixture(filename)
+
+    def _cb(backend):
+        monkeypatch.setattr(xmlbuilder, "XMLAPI", backend)
+        guest = virtinst.Guest(conn, parsexml=xml)
+        props = _read_all_props(guest)
+
+        guest.name = "conformance"
+        guest.description = "desc & <stuff>"
+        for dev in guest.devices.get_all()[::2]:
+            guest.remove_device(dev)
+        disk = virtinst.DeviceDisk(conn,
+                parsexml="<disk type='file' device='cdrom'>\n"
+                         "  <target dev='sdz' bus='scsi'/>\n</disk>\n")
+        guest.add_device(disk)
+        return props, guest.get_xml()
+    _compare_backends(_cb)
+
+
+def testLibxml2KeepBlanks():
+    """
+    gtksourceview flips libxml2's global keepBlanksDefault, which must
+    not change how we parse
+    """
+    backend = xmlapi.get_backends().get("libxml2")
+    if not backend:
+        pytest.skip("libxml2 backend is not available")
+    import libxml2
+
+    xml = _read_fixture(_FIXTURES[0])
+    origkeep = libxml2.keepBlanksDefault(0)
+    try:
+        api = backend(xml)
+        api.set_xpath_content("./description", "foo")
+        newxml = api.get_xml(".")
+    finally:
+        libxml2.keepBlanksDefault(origkeep)
+
+    expected = backend(xml)
+    expected.set_xpath_content("./description", "foo")
+    assert newxml == expected.get_xml(".")
+    assert "\n  <" in newxml
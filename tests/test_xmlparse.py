@@ -3,9 +3,12 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import os
+
 import pytest
 
 import virtinst
+from virtinst import guestsummary
 
 from tests import utils
 
@@ -1072,6 +1075,132 @@ def testReplaceChildParse():
     utils.diff_compare(guest.get_xml(), parsefile)
 
 
+def testXMLAPILookupCache():
+    """
+    Cached xpath lookups must not survive changes to the document
+    """
+    xml = ("<domain><name>foo</name><devices>"
+           "<disk><target dev='vda'/></disk>"
+           "<disk><target dev='vdb'/></disk>"
+           "</devices></domain>")
+    api = virtinst.xmlapi.XMLAPI(xml)
+    diskpath = "./devices/disk[1]/target/@dev"
+    assert api.get_xpath_content(diskpath, False) == "vda"
+    assert api.get_xpath_content(diskpath, False) == "vda"
+
+    gen = api.generation
+    api.node_force_remove("./devices/disk[1]")
+    assert api.generation > gen
+    assert api.get_xpath_content(diskpath, False) == "vdb"
+    assert api.get_xpath_content("./devices/disk[2]", True) is None
+
+    api.set_xpath_content("./name", "bar")
+    assert api.get_xpath_content("./name", False) == "bar"
+    api.set_xpath_content("./name", None)
+    assert api.get_xpath_content("./name", False) is None
+    api.set_xpath_content("./title", "newtitle")
+    assert api.get_xpath_content("./title", False) == "newtitle"
+
+
+def testLazyChildParse():
+    """
+    Child object lists are built on first use, make sure adding and
+    removing children before and after that keeps xpaths correct
+    """
+    conn = utils.URIs.open_testdefault_cached()
+    xml = open(DATADIR + "change-disk-in.xml").read()
+    ndisks = xml.count("<disk ")
+
+    # Add a disk before the parsed disks were ever accessed
+    guest = virtinst.Guest(conn, parsexml=xml)
+    assert guest.name
+    newdisk = virtinst.DeviceDisk(conn)
+    newdisk.device = "cdrom"
+    newdisk.target = "sdz"
+    guest.add_device(newdisk)
+    disks = guest.devices.disk
+    assert len(disks) == ndisks + 1
+    assert [d.get_xml_id() for d in disks] == [
+            "./devices/disk[%d]" % (idx + 1) for idx in range(ndisks + 1)]
+    assert disks[-1].target == "sdz"
+
+    # Remove one, the following disks are renumbered
+    target = disks[2].target
+    guest.remove_device(disks[1])
+    disks = guest.devices.disk
+    assert len(disks) == ndisks
+    assert disks[1].target == target
+    assert disks[1].get_xml_id() == "./devices/disk[2]"
+
+    # Never accessed children are kept as is in the output
+    guest2 = virtinst.Guest(conn, parsexml=xml)
+    guest2.name = "lazy"
+    assert guest2.get_xml().count("<disk ") == ndisks
+    assert len(guest2.devices.disk) == ndisks
+
+
+def testGuestSummary():
+    """
+    GuestSummary values must match the Guest properties they stand in for
+    """
+    conn = utils.URIs.open_testdefault_cached()
+    for filename in sorted(os.listdir(DATADIR)):
+        if not filename.endswith("-in.xml"):
+            continue
+        xml = open(DATADIR + filename).read()
+        if not xml.lstrip().startswith("<domain"):
+            continue
+
+        summary = virtinst.GuestSummary(conn, xml)
+        guest = virtinst.Guest(conn, parsexml=xml)
+        for propname in ["name", "uuid", "title", "description", "type"]:
+            assert getattr(summary, propname) == getattr(guest, propname)
+        for propname in ["os_type", "arch", "machine",
+                         "kernel", "initrd", "dtb"]:
+            assert getattr(summary, propname) == getattr(guest.os, propname)
+        assert (summary.os_id ==
+                guest._metadata.libosinfo.os_id)  # pylint: disable=protected-access
+
+        assert len(summary.disks) == len(guest.devices.disk)
+        for disk, guestdisk in zip(summary.disks, guest.devices.disk):
+            assert disk.get_source_path() == guestdisk.get_source_path()
+            assert disk.is_empty() == guestdisk.is_empty()
+            assert disk.read_only == guestdisk.read_only
+            assert disk.shareable == guestdisk.shareable
+            assert disk.driver_type == guestdisk.driver_type
+            assert disk.target == guestdisk.target
+        assert ([nic.macaddr for nic in summary.interfaces] ==
+                [nic.macaddr for nic in guest.devices.interface])
+
+    # The full Guest is built once, on demand
+    summary = virtinst.GuestSummary(conn,
+            open(DATADIR + "change-disk-in.xml").read())
+    assert summary._guest is None  # pylint: disable=protected-access
+    assert summary.get_guest() is summary.get_guest()
+    assert summary.get_guest().name == summary.name
+
+
+def testGuestSummaryChunks(monkeypatch):
+    """
+    Values split across parser feed chunks must come out whole
+    """
+    conn = utils.URIs.open_testdefault_cached()
+    xml = open(DATADIR + "change-disk-in.xml").read()
+    expected = virtinst.GuestSummary(conn, xml)
+
+    monkeypatch.setattr(guestsummary, "_FEED_CHUNK_SIZE", 7)
+    summary = virtinst.GuestSummary(conn, xml)
+    for propname in ["name", "uuid", "title", "description", "type",
+                     "os_type", "arch", "machine", "os_id"]:
+        assert getattr(summary, propname) == getattr(expected, propname)
+    assert ([(disk.target, disk.driver_type, disk.read_only)
+             for disk in summary.disks] ==
+            [(disk.target, disk.driver_type, disk.read_only)
+             for disk in expected.disks])
+    assert ([nic.macaddr for nic in summary.interfaces] ==
+            [nic.macaddr for nic in expected.interfaces])
+
+
 def testGuestXMLDeviceMatch():
     """
     Test Guest.find_device and Device.compare_device
@@ -136,6 +136,29 @@ def testManagerSaveCancelError(app):
     lib.utils.check(lambda: not run.sensitive)
 
 
+def testManagerManagedSaveState(app):
+    """
+    test-state-managedsave reports shutoff reason UNKNOWN, like managed
+    saved VMs after a daemon restart. Make sure bulk state polling
+    doesn't lose its Saved state
+    """
+    app.open(extra_opts=["--test-options=no-events",
+                         "--test-options=short-poll"])
+    manager = app.topwin
+    run = manager.find("Run", "push button")
+    shutdown = manager.find("Shut Down", "push button")
+
+    c = manager.find("test-state-managedsave", "table cell")
+    c.click()
+    # Let a few ticks refresh the state from bulk stats
+    app.sleep(2)
+    lib.utils.check(lambda: "Saved" in c.text)
+
+    # Run restores the managed save image
+    run.click()
+    lib.utils.check(lambda: shutdown.sensitive, timeout=5)
+
+
 def testManagerQEMUSetTime(app):
     """
     Fake qemu setTime behavior for code coverage
@@ -20,6 +20,8 @@ Source0: https://virt-manager.org/download/sources/%{name}/%{name}-%{version}.ta
 
 Requires: virt-manager-common = %{verrel}
 Requires: python3-gobject >= 3.31.3
+# graphwidgets caches rendered graphs in cairo surfaces
+Requires: python3-cairo
 Requires: gtk3 >= 3.22.0
 Requires: libvirt-glib >= 0.0.9
 Requires: gtk-vnc2
@@ -52,6 +54,8 @@ Suggests: python3-libguestfs
 BuildRequires: gettext
 BuildRequires: python3-devel
 BuildRequires: python3-docutils
+# The test suite checks the lxml XML backend against the libxml2 one
+BuildRequires: python3-lxml
 
 
 %description
@@ -440,6 +440,19 @@ class vmmConfig(object):
         self.conf.set("/stats/update-interval", interval)
     def on_stats_update_interval_changed(self, cb):
         return self.conf.notify_add("/stats/update-interval", cb)
+    def get_stats_update_interval_max(self):
+        interval = self.conf.get("/stats/update-interval-max")
+        return max(interval, self.get_stats_update_interval())
+    def set_stats_update_interval_max(self, interval):
+        self.conf.set("/stats/update-interval-max", interval)
+    def get_stats_out_of_process(self):
+        return self.conf.get("/stats/out-of-process")
+    def get_stats_persist_hours(self):
+        return self.conf.get("/stats/persist-hours")
+    def get_stats_graph_window(self):
+        return self.conf.get("/stats/graph-window")
+    def get_stats_metrics_address(self):
+        return self.conf.get("/stats/metrics-address")
 
 
     # Disable/Enable different stats polling
@@ -4,6 +4,7 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import heapq
 import os
 import threading
 import time
@@ -16,6 +17,8 @@ from virtinst import log
 from virtinst import pollhelpers
 
 from .lib import connectauth
+from .lib import metricsexporter
+from .lib import module_trace
 from .lib import testmock
 from .baseclass import vmmGObject
 from .lib.libvirtenummap import LibvirtEnumMap
@@ -23,12 +26,17 @@ from .object.domain import vmmDomain
 from .object.network import vmmNetwork
 from .object.nodedev import vmmNodeDevice
 from .object.storagepool import vmmStoragePool
-from .lib.statsmanager import vmmStatsManager
+from .lib.statsmanager import (StatsRing, update_history_file,
+        update_rollups, vmmStatsManager)
 
 
 class _ObjectList(vmmGObject):
     """
     Class that wraps our internal list of libvirt objects
+
+    Objects are indexed per class by name and UUID, so lookups are
+    a dict access. get_objects_for_class returns a cached tuple that
+    is only rebuilt after the object list changes.
     """
     # pylint: disable=not-context-manager
     # pylint doesn't know that lock() has 'with' support
@@ -37,12 +45,18 @@ class _ObjectList(vmmGObject):
     def __init__(self):
         vmmGObject.__init__(self)
 
-        self._objects = []
+        self._names = {}
+        self._uuids = {}
+        self._keys = {}
+        self._views = {}
         self._denylist = {}
         self._lock = threading.Lock()
 
     def _cleanup(self):
-        self._objects = []
+        self._names = {}
+        self._uuids = {}
+        self._keys = {}
+        self._views = {}
 
     def _denylist_key(self, obj):
         return str(obj.__class__) + obj.get_name()
@@ -89,10 +103,16 @@ class _ObjectList(vmmGObject):
         with self._lock:
             # Identity check is sufficient here, since we should never be
             # asked to remove an object that wasn't at one point in the list.
-            if obj not in self._objects:
+            keys = self._keys.pop(id(obj), None)
+            if keys is None:
                 return self.remove_denylist(obj)
 
-            self._objects.remove(obj)
+            name, uuid = keys
+            classobj = obj.__class__
+            del self._names[classobj][name]
+            if uuid:
+                self._uuids[classobj].pop(uuid, None)
+            self._views.pop(classobj, None)
             return True
 
     def add(self, obj):
@@ -102,40 +122,218 @@ class _ObjectList(vmmGObject):
         :param obj: vmmLibvirtObject to add
         :returns: True if object added, False if object already in the list
         """
+        classobj = obj.__class__
+        name = obj.get_name()
+        uuid = obj.get_uuid()
+
         with self._lock:
             # We don't look up based on identity here, to prevent tick()
             # races from adding the same domain twice
-            #
-            # We don't use lookup_object here since we need to hold the
-            # lock the whole time to prevent a 'time of check' issue
-            for checkobj in self._objects:
-                if (checkobj.__class__ == obj.__class__ and
-                    checkobj.get_name() == obj.get_name()):
-                    return False
-
-            self._objects.append(obj)
+            names = self._names.setdefault(classobj, {})
+            if name in names:
+                return False
+
+            names[name] = obj
+            if uuid:
+                self._uuids.setdefault(classobj, {})[uuid] = obj
+            self._keys[id(obj)] = (name, uuid)
+            self._views.pop(classobj, None)
             return True
 
-    def get_objects_for_class(self, classobj):
+    def reindex(self, obj):
         """
-        Return all objects over the passed vmmLibvirtObject class
+        Update the name index after obj was renamed
         """
         with self._lock:
-            return [o for o in self._objects if o.__class__ is classobj]
+            keys = self._keys.get(id(obj))
+            if keys is None:
+                return
+            oldname, uuid = keys
+            newname = obj.get_name()
+            if oldname == newname:
+                return
+
+            names = self._names[obj.__class__]
+            if names.get(oldname) is obj:
+                del names[oldname]
+            names[newname] = obj
+            self._keys[id(obj)] = (newname, uuid)
+            self._views.pop(obj.__class__, None)
+
+    def get_objects_for_class(self, classobj):
+        """
+        Return all objects over the passed vmmLibvirtObject class.
+        The returned tuple is shared between callers, and is replaced
+        rather than modified when the object list changes.
+        """
+        view = self._views.get(classobj)
+        if view is None:
+            with self._lock:
+                view = tuple(self._names.get(classobj, {}).values())
+                self._views[classobj] = view
+        return view
 
     def lookup_object(self, classobj, name):
         """
         Lookup an object with the passed classobj + name
         """
-        # Doesn't require locking, since get_objects_for_class covers us
-        for obj in self.get_objects_for_class(classobj):
-            if obj.get_name() == name:
-                return obj
-        return None
+        # Single dict lookups are atomic, no locking needed
+        return self._names.get(classobj, {}).get(name)
+
+    def lookup_object_by_uuid(self, classobj, uuid):
+        """
+        Lookup an object with the passed classobj + UUID
+        """
+        return self._uuids.get(classobj, {}).get(uuid)
 
     def all_objects(self):
         with self._lock:
-            return self._objects[:]
+            ret = []
+            for names in self._names.values():
+                ret.extend(names.values())
+            return ret
+
+
+class _ObjectInitPool(object):
+    """
+    Bounded pool of worker threads that run init_libvirt_state for
+    newly polled objects, so the initial XML and state fetching for
+    a big connection runs in parallel.
+
+    Objects are initialized in priority order, and workers pull them
+    in small chunks. Each finished chunk is handed to done_cb at once,
+    so the UI is populated progressively.
+    """
+    CHUNK_SIZE = 16
+
+    def __init__(self, conn, done_cb):
+        self._conn = conn
+        self._done_cb = done_cb
+        self._lock = threading.Lock()
+        self._heap = []
+        self._counter = 0
+        self._workers = 0
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+
+    def add(self, objs, prio_cb):
+        """
+        Queue objects for initialization. prio_cb(obj) returns a
+        sortable key, lowest is initialized first
+        """
+        with self._lock:
+            for obj in objs:
+                self._counter += 1
+                heapq.heappush(self._heap,
+                        (prio_cb(obj), self._counter, obj))
+
+            width = max(1, self._conn.get_init_workers())
+            while self._workers < width and self._workers < len(self._heap):
+                self._workers += 1
+                t = threading.Thread(target=self._worker,
+                        name="object init worker %d for %s" %
+                        (self._workers, self._conn.get_uri()))
+                t.daemon = True
+                t.start()
+
+    def _next_chunk(self):
+        with self._lock:
+            chunk = []
+            while self._heap and len(chunk) < self.CHUNK_SIZE:
+                chunk.append(heapq.heappop(self._heap)[2])
+            if not chunk:
+                self._workers -= 1
+            return chunk
+
+    def _worker(self):
+        while True:
+            chunk = self._next_chunk()
+            if not chunk:
+                return
+
+            results = []
+            for obj in chunk:
+                results.append((obj, obj.init_libvirt_state()))
+            self._done_cb(results)
+            chunk = None
+            results = None
+
+
+def _tick_snapshot(obj):
+    """
+    What the UI shows for an object, at the resolution it shows it.
+    Used to tell whether a tick changed anything, since an idle VM
+    gets a new but practically identical stats sample every tick.
+    """
+    if not obj.reports_stats():
+        return obj.run_status()
+    return (obj.run_status(),
+            int(obj.host_cpu_time_percentage()),
+            obj.stats_memory(),
+            int(obj.disk_read_rate()),
+            int(obj.disk_write_rate()),
+            int(obj.network_rx_rate()),
+            int(obj.network_tx_rate()))
+
+
+class _TickPacer(object):
+    """
+    Track how long a connection's stats ticks take and how often they
+    actually see any change, and derive the connection's poll interval
+    from that.
+
+    Slow connections are polled no faster than a few multiples of their
+    tick latency. Remote connections where nothing has changed for a
+    while are backed off exponentially, so a big fleet of idle hosts
+    doesn't keep the SSH links busy. Local connections are never backed
+    off for idleness. The result is clamped to the user's min/max
+    stats update interval.
+    """
+    LATENCY_FACTOR = 4
+    IDLE_TICKS = 5
+    MAX_BACKOFF = 8
+
+    def __init__(self, is_remote):
+        self._is_remote = is_remote
+        self.latency = 0.0
+        self.idle_ticks = 0
+        self.last_tick = None
+        self._pending_change = False
+
+    def reset(self):
+        self.latency = 0.0
+        self.idle_ticks = 0
+        self.last_tick = None
+        self._pending_change = False
+
+    def note_change(self):
+        """
+        Record a change that was noticed outside of tick, like an event
+        """
+        self._pending_change = True
+
+    def record_tick(self, start, duration, changed):
+        if self.last_tick is None:
+            self.latency = duration
+        else:
+            self.latency = (0.7 * self.latency) + (0.3 * duration)
+        self.last_tick = start
+
+        if changed or self._pending_change:
+            self.idle_ticks = 0
+        else:
+            self.idle_ticks += 1
+        self._pending_change = False
+
+    def get_interval(self, minval, maxval):
+        interval = max(minval, self.latency * self.LATENCY_FACTOR)
+        if self._is_remote and self.idle_ticks >= self.IDLE_TICKS:
+            backoff = min(self.idle_ticks // self.IDLE_TICKS,
+                          self.MAX_BACKOFF)
+            interval *= 2 ** backoff
+        return max(minval, min(interval, maxval))
 
 
 class vmmConnection(vmmGObject):
@@ -170,6 +368,8 @@ class vmmConnection(vmmGObject):
 
         self._init_object_count = None
         self._init_object_event = None
+        self._init_pool = _ObjectInitPool(self, self._new_objects_done)
+        self._init_priority_keys = {}
 
         self.using_domain_events = False
         self._domain_cb_ids = []
@@ -183,10 +383,15 @@ class vmmConnection(vmmGObject):
         self._xml_flags = {}
 
         self._objects = _ObjectList()
+        self._reconcilers = None
+        self._init_reconcilers()
         self.statsmanager = vmmStatsManager()
 
-        self._stats = []
+        self._stats = self._new_stats_ring()
+        self._stats_history = None
+        self._stats_rollups = None
         self._hostinfo = None
+        self._tick_pacer = _TickPacer(self._backend.is_remote())
 
         self.add_gsettings_handle(
             self._on_config_pretty_name_changed(
@@ -256,10 +461,23 @@ class vmmConnection(vmmGObject):
 
             time.sleep(.1)
 
+    def _init_reconcilers(self):
+        """
+        Poll state for each object type. These track which objects
+        we've seen across polls, keyed by UUID where possible
+        """
+        self._reconcilers = {}
+        for class_name in ["domain", "network", "pool", "nodedev"]:
+            self._reconcilers[class_name] = (
+                    pollhelpers.PollReconciler(class_name))
+
     def _init_virtconn(self):
         self._backend.cb_fetch_all_domains = (
             lambda: [obj.get_xmlobj(refresh_if_nec=False)
                      for obj in self.list_vms()])
+        self._backend.cb_fetch_all_domain_summaries = (
+            lambda: [obj.get_summary(refresh_if_nec=False)
+                     for obj in self.list_vms()])
         self._backend.cb_fetch_all_pools = (
             lambda: [obj.get_xmlobj(refresh_if_nec=False)
                      for obj in self.list_pools()])
@@ -504,6 +722,8 @@ class vmmConnection(vmmGObject):
 
     def get_vm_by_name(self, name):
         return self._objects.lookup_object(vmmDomain, name)
+    def get_vm_by_uuid(self, uuid):
+        return self._objects.lookup_object_by_uuid(vmmDomain, uuid)
     def list_vms(self):
         return self._objects.get_objects_for_class(vmmDomain)
 
@@ -600,6 +820,12 @@ class vmmConnection(vmmGObject):
                 # Reinsert handle into new obj
                 obj.change_name_backend(newobj)
 
+    def reindex_object(self, obj):
+        """
+        Called by vmmLibvirtObject after its name changed
+        """
+        self._objects.reindex(obj)
+
 
     #########################
     # Domain event handling #
@@ -619,7 +845,7 @@ class vmmConnection(vmmGObject):
         name = domain.name()
         log.debug("domain xmlmisc event: domain=%s event=%s args=%s",
                 name, eventstr, args)
-        obj = self.get_vm_by_name(name)
+        obj = self.get_vm_by_uuid(domain.UUIDString())
         if obj:
             self.idle_add(obj.recache_from_event_loop)
 
@@ -631,7 +857,8 @@ class vmmConnection(vmmGObject):
         log.debug("domain lifecycle event: domain=%s %s", name,
                 LibvirtEnumMap.domain_lifecycle_str(state, reason))
 
-        obj = self.get_vm_by_name(name)
+        self._tick_pacer.note_change()
+        obj = self.get_vm_by_uuid(domain.UUIDString())
 
         if obj:
             self.idle_add(obj.recache_from_event_loop)
@@ -646,7 +873,7 @@ class vmmConnection(vmmGObject):
         log.debug("domain agent lifecycle event: domain=%s %s", name,
                 LibvirtEnumMap.domain_agent_lifecycle_str(state, reason))
 
-        obj = self.get_vm_by_name(name)
+        obj = self.get_vm_by_uuid(domain.UUIDString())
 
         if obj:
             self.idle_add(obj.recache_from_event_loop)
@@ -660,6 +887,7 @@ class vmmConnection(vmmGObject):
         name = network.name()
         log.debug("network lifecycle event: network=%s %s",
                 name, LibvirtEnumMap.network_lifecycle_str(state, reason))
+        self._tick_pacer.note_change()
         obj = self.get_net_by_name(name)
 
         if obj:
@@ -676,6 +904,7 @@ class vmmConnection(vmmGObject):
         log.debug("storage pool lifecycle event: pool=%s %s",
             name, LibvirtEnumMap.storage_lifecycle_str(state, reason))
 
+        self._tick_pacer.note_change()
         obj = self.get_pool_by_name(name)
 
         if obj:
@@ -706,6 +935,7 @@ class vmmConnection(vmmGObject):
         log.debug("node device lifecycle event: nodedev=%s %s",
             name, LibvirtEnumMap.nodedev_lifecycle_str(state, reason))
 
+        self._tick_pacer.note_change()
         self.schedule_priority_tick(pollnodedev=True, force=True)
 
     def _node_device_update_event(self, conn, dev, userdata):
@@ -856,7 +1086,14 @@ class vmmConnection(vmmGObject):
             self._storage_pool_cb_ids = []
             self._node_device_cb_ids = []
 
-        self._stats = []
+        self._stats = self._new_stats_ring()
+        if self._stats_history is not None:
+            self._stats_history.close()
+        self._stats_history = None
+        self._stats_rollups = None
+        metricsexporter.remove_connection(self.get_uri())
+        self._tick_pacer.reset()
+        self._init_pool.clear()
 
         if self._init_object_event:
             self._init_object_event.clear()  # pragma: no cover
@@ -870,6 +1107,7 @@ class vmmConnection(vmmGObject):
                 log.debug("Failed to cleanup %s: %s", obj, e)
         self._objects.cleanup()
         self._objects = _ObjectList()
+        self._init_reconcilers()
 
         closeret = self._backend.close()
         if closeret == 1:
@@ -884,7 +1122,9 @@ class vmmConnection(vmmGObject):
         self.close()
 
         self._objects = None
+        self._init_pool = None
         self._backend.cb_fetch_all_domains = None
+        self._backend.cb_fetch_all_domain_summaries = None
         self._backend.cb_fetch_all_pools = None
         self._backend.cb_fetch_all_nodedevs = None
         self._backend.cb_fetch_all_vols = None
@@ -920,6 +1160,8 @@ class vmmConnection(vmmGObject):
                             "fake session error not authorized"]
                 raise lerr
             self._backend.open(cb, data)
+            module_trace.register_conn(
+                    self._backend.get_conn_for_api_arg(), self.get_uri())
             return True, None
         except Exception as e:
             exc = e
@@ -1062,12 +1304,21 @@ class vmmConnection(vmmGObject):
                 log.debug("Blacklisting %s=%s", class_name, obj.get_name())
                 count = self._objects.add_denylist(obj)
                 log.debug("Object added in denylist, count=%d", count)
+                # Forget about the object so the next poll retries it
+                self._reconcilers[class_name].discard(obj)
+                return
+
+            if not self._reconcilers[class_name].tracks(obj):
+                log.debug("%s=%s disappeared while initializing",
+                    class_name, obj.get_name())
+                obj.cleanup()
                 return
 
             self._objects.remove_denylist(obj)
             if not self._objects.add(obj):
                 log.debug("New %s=%s requested, but it's already tracked.",
                     class_name, obj.get_name())
+                self._reconcilers[class_name].discard(obj)
                 obj.cleanup()
                 return
 
@@ -1089,6 +1340,50 @@ class vmmConnection(vmmGObject):
                 if self._init_object_count <= 0:
                     self._init_object_event.set()
 
+    def _new_objects_done(self, results):
+        """
+        Called from an init pool worker when a chunk of new objects
+        is initialized
+        """
+        def cb():
+            for obj, initialize_failed in results:
+                self._new_object_cb(obj, initialize_failed)
+        self.idle_add(cb)
+
+    def prioritize_init(self, keys, owner=None):
+        """
+        Request that objects matching the passed names or UUIDs are
+        initialized before any others when the connection is populated.
+        Used for VMs requested on the command line or shown in the UI.
+
+        :param owner: If passed, keys replace the set previously
+            registered by the same owner, like the manager's visible
+            and selected rows. Otherwise keys are added permanently.
+        """
+        if owner is None:
+            self._init_priority_keys.setdefault(None, set()).update(keys)
+        else:
+            self._init_priority_keys[owner] = set(keys)
+
+    def _is_init_priority(self, obj):
+        for keys in self._init_priority_keys.values():
+            if obj.get_name() in keys or obj.get_uuid() in keys:
+                return True
+        return False
+
+    def _init_priority(self, obj):
+        # Prioritized domains, then the rest of the domains sorted
+        # by name, then other objects.
+        if obj.is_domain():
+            prio = 1
+            if self._is_init_priority(obj):
+                prio = 0
+        elif obj.is_nodedev():
+            prio = 3
+        else:
+            prio = 2
+        return prio, obj.get_name()
+
     def _poll(self, initial_poll,
             pollvm, pollnet, pollpool, pollnodedev):
         """
@@ -1098,77 +1393,85 @@ class vmmConnection(vmmGObject):
         gone_objects = []
         preexisting_objects = []
 
+        def _renamed_cb(obj, newname):
+            # True if we renamed the object ourselves via define_name,
+            # otherwise it's replaced with a fresh object
+            return obj.get_name() == newname
+
         def _process_objects(ptype):
             if ptype == "nets":
                 dopoll = pollnet
                 objs = self.list_nets()
                 cls = vmmNetwork
-                pollcb = pollhelpers.fetch_nets
+                reconciler = self._reconcilers["network"]
+                pollcb = pollhelpers.reconcile_nets
             elif ptype == "pools":
                 dopoll = pollpool
                 objs = self.list_pools()
                 cls = vmmStoragePool
-                pollcb = pollhelpers.fetch_pools
+                reconciler = self._reconcilers["pool"]
+                pollcb = pollhelpers.reconcile_pools
             elif ptype == "nodedevs":
                 dopoll = pollnodedev
                 objs = self.list_nodedevs()
                 cls = vmmNodeDevice
-                pollcb = pollhelpers.fetch_nodedevs
+                reconciler = self._reconcilers["nodedev"]
+                pollcb = pollhelpers.reconcile_nodedevs
             else:
                 dopoll = pollvm
                 objs = self.list_vms()
                 cls = vmmDomain
-                pollcb = pollhelpers.fetch_vms
-
+                reconciler = self._reconcilers["domain"]
+                pollcb = pollhelpers.reconcile_vms
 
-            keymap = dict((o.get_name(), o) for o in objs)
             def cb(obj, name):
                 return cls(self, obj, name)
+            gone, new = [], []
             if dopoll:
-                gone, new, master = pollcb(self._backend, keymap, cb)
-            else:
-                gone, new, master = [], [], list(keymap.values())
+                delta = pollcb(self._backend, reconciler, cb, _renamed_cb)
+                gone, new = delta.gone, delta.new
+                for obj, oldname, newname in delta.renamed:
+                    log.debug("%s=%s renamed to %s",
+                        obj.class_name(), oldname, newname)
+                    self._objects.reindex(obj)
 
             if initial_poll:
                 self._init_object_count += len(new)
 
             gone_objects.extend(gone)
-            preexisting_objects.extend([o for o in master if o not in new])
-            new = [n for n in new if not self._objects.in_denylist(n)]
-            return new
+            if gone:
+                goneids = set(id(o) for o in gone)
+                objs = [o for o in objs if id(o) not in goneids]
+            preexisting_objects.extend(objs)
+            allowed = []
+            for obj in new:
+                if not self._objects.in_denylist(obj):
+                    allowed.append(obj)
+                    continue
+                # Never initialized, so don't leave it tracked, otherwise
+                # it's later reported as gone without ever being added
+                reconciler.discard(obj)
+            return allowed
 
         new_vms = _process_objects("vms")
         new_nets = _process_objects("nets")
         new_pools = _process_objects("pools")
         new_nodedevs = _process_objects("nodedevs")
 
-        # Kick off one thread per object type to handle the initial
-        # XML fetching. Going any more fine grained then this probably
-        # won't be that useful due to libvirt's locking structure.
-        #
-        # Would prefer to start refreshing some objects before all polling
-        # is complete, but we need init_object_count to be fully accurate
-        # before we start initializing objects
+        # New objects are initialized by the connection's init pool.
+        # We need init_object_count to be fully accurate before we start
+        # initializing objects, so they are only queued after all
+        # polling is complete.
 
         if initial_poll and self._init_object_count == 0:
             # If the connection doesn't have any objects, new_object_cb
             # is never called and the event is never set, so let's do it here
             self._init_object_event.set()
 
-        for newlist in [new_vms, new_nets, new_pools, new_nodedevs]:
-            if not newlist:
-                continue
-
-            def cb(lst):
-                for obj in lst:
-                    obj.connect_once("initialized", self._new_object_cb)
-                    obj.init_libvirt_state()
-
-            self._start_thread(cb,
-                "refreshing xml for new %s" % newlist[0].class_name(),
-                args=(newlist,))
+        new_objects = new_vms + new_nets + new_pools + new_nodedevs
+        self._init_pool.add(new_objects, self._init_priority)
 
-        return gone_objects, preexisting_objects
+        return gone_objects, preexisting_objects, new_objects
 
     def _tick(self, stats_update=False,
              pollvm=False, pollnet=False,
@@ -1179,6 +1482,7 @@ class vmmConnection(vmmGObject):
 
         :param force: Perform the requested polling even if async events
             are in use.
+        :returns: True if any polled state changed
         """
         if self._closing:
             return  # pragma: no cover
@@ -1205,9 +1509,10 @@ class vmmConnection(vmmGObject):
         if stats_update:
             self.statsmanager.cache_all_stats(self)
 
-        gone_objects, preexisting_objects = self._poll(
+        gone_objects, preexisting_objects, new_objects = self._poll(
             initial_poll, pollvm, pollnet, pollpool, pollnodedev)
         self.idle_add(self._gone_object_signals, gone_objects)
+        changed = bool(gone_objects or new_objects)
 
         # Only tick() pre-existing objects, since new objects will be
         # initialized asynchronously and tick() would be redundant
@@ -1230,7 +1535,10 @@ class vmmConnection(vmmGObject):
                     e.err = [libvirt.VIR_ERR_SYSTEM_ERROR]
                     raise e
 
+                before = _tick_snapshot(obj)
                 obj.tick(stats_update=stats_update)
+                if before != _tick_snapshot(obj):
+                    changed = True
             except Exception as e:
                 log.exception("Tick for %s failed", obj)
                 if (isinstance(e, libvirt.libvirtError) and
@@ -1244,19 +1552,30 @@ class vmmConnection(vmmGObject):
                             "Ignoring.")
 
         if stats_update:
-            self._recalculate_stats(
-                [o for o in preexisting_objects if o.reports_stats()])
+            statsobjs = [o for o in preexisting_objects if o.reports_stats()]
+            self._recalculate_stats(statsobjs)
+            metricsexporter.update_connection(self, statsobjs)
             self.idle_emit("resources-sampled")
+        return changed
+
+    _STATS_NAMES = ["timestamp", "memory", "memoryPercent", "cpuTime",
+                    "cpuHostPercent", "diskRdRate", "diskWrRate",
+                    "netRxRate", "netTxRate", "diskMaxRate", "netMaxRate"]
+
+    def _new_stats_ring(self):
+        return StatsRing(self._STATS_NAMES,
+                         self.config.get_stats_history_length() + 1)
 
     def _recalculate_stats(self, vms):
         if not self._backend.is_open():
             return  # pragma: no cover
+        if not self.statsmanager.polled_all_vms():
+            # Unwatched VMs kept their last sample, so the totals would
+            # be stale. Everything that shows host totals watches all VMs
+            return
 
         now = time.time()
-        expected = self.config.get_stats_history_length()
-        current = len(self._stats)
-        if current > expected:
-            del self._stats[expected:current]  # pragma: no cover
+        self._stats.resize(self.config.get_stats_history_length() + 1)
 
         mem = 0
         cpuTime = 0
@@ -1285,7 +1604,7 @@ class vmmConnection(vmmGObject):
         pcentMem = mem * 100.0 / self.host_memory_size()
 
         if len(self._stats) > 0:
-            prevTimestamp = self._stats[0]["timestamp"]
+            prevTimestamp = self._stats.get("timestamp")
             host_cpus = self.host_active_processor_count()
 
             pcentHostCpu = ((cpuTime) * 100.0 /
@@ -1309,7 +1628,19 @@ class vmmConnection(vmmGObject):
             "netMaxRate": netMaxRate,
         }
 
-        self._stats.insert(0, newStats)
+        self._stats.append(newStats)
+
+        self._stats_history = update_history_file(self.config,
+                self._stats_history,
+                os.path.join(self.get_cache_dir(), "host-stats"),
+                self._STATS_NAMES)
+        if self._stats_history is not None:
+            self._stats_history.append(newStats)
+
+        self._stats_rollups = update_rollups(self.config,
+                self._stats_rollups, self._STATS_NAMES)
+        if self._stats_rollups:
+            self._stats_rollups.add(newStats)
 
 
     def schedule_priority_tick(self, **kwargs):
@@ -1317,43 +1648,73 @@ class vmmConnection(vmmGObject):
         vmmEngine.get_instance().schedule_priority_tick(self, kwargs)
 
     def tick_from_engine(self, *args, **kwargs):
+        start = time.monotonic()
         try:
-            self._tick(*args, **kwargs)
+            changed = self._tick(*args, **kwargs)
         except Exception:
             self._schedule_close()
             raise
 
+        # Only the periodic stats ticks feed the poll interval, event
+        # triggered ticks are too small to be representative
+        if kwargs.get("stats_update") and changed is not None:
+            self._tick_pacer.record_tick(
+                    start, time.monotonic() - start, changed)
+
+    def get_poll_interval(self):
+        """
+        Return the stats poll interval in seconds for this connection,
+        adapted to its tick latency and activity
+        """
+        return self._tick_pacer.get_interval(
+                self.config.get_stats_update_interval(),
+                self.config.get_stats_update_interval_max())
+
+    def tick_is_due(self, now):
+        """
+        Return True if the periodic stats tick should run at time.monotonic()
+        value `now`. Allow some slack since the engine timer fires at
+        the base interval
+        """
+        last = self._tick_pacer.last_tick
+        if last is None:
+            return True
+        slack = self.config.get_stats_update_interval() / 2.0
+        return now - last >= self.get_poll_interval() - slack
+
 
     ########################
     # Stats getter methods #
     ########################
 
     def _get_record_helper(self, record_name):
-        if len(self._stats) == 0:
-            return 0
-        return self._stats[0][record_name]
+        return self._stats.get(record_name)
 
-    def _vector_helper(self, record_name, limit, ceil=100.0):
-        vector = []
+    def _vector_helper(self, record_name, limit, ceil=100.0,
+                       history=False, width=None):
         statslen = self.config.get_stats_history_length() + 1
         if limit is not None:
             statslen = min(statslen, limit)  # pragma: no cover
-
-        for i in range(statslen):
-            if i < len(self._stats):
-                vector.append(self._stats[i][record_name] / ceil)
-            else:
-                vector.append(0)
-
-        return vector
-
-    def stats_memory_vector(self, limit=None):
-        return self._vector_helper("memoryPercent", limit)
-    def host_cpu_time_vector(self, limit=None):
-        return self._vector_helper("cpuHostPercent", limit)
+        if history and self._stats_rollups:
+            return self._stats_rollups.get_vector(self._stats, record_name,
+                    width or statslen,
+                    self.config.get_stats_update_interval(), ceil)
+        if history and self._stats_history is not None:
+            return self._stats_history.get_vector(
+                    record_name, statslen, ceil)
+        return self._stats.get_vector(record_name, statslen, ceil)
+
+    def stats_memory_vector(self, limit=None, history=False, width=None):
+        return self._vector_helper("memoryPercent", limit,
+                                   history=history, width=width)
+    def host_cpu_time_vector(self, limit=None, history=False, width=None):
+        return self._vector_helper("cpuHostPercent", limit,
+                                   history=history, width=width)
 
     def stats_memory(self):
         return self._get_record_helper("memory")
+    def stats_memory_percentage(self):
+        return self._get_record_helper("memoryPercent")
     def host_cpu_time_percentage(self):
         return self._get_record_helper("cpuHostPercent")
     def guest_cpu_time_percentage(self):
@@ -1397,6 +1758,9 @@ class vmmConnection(vmmGObject):
     def _config_pretty_name_changed_cb(self):
         self.emit("state-changed")
 
+    def get_init_workers(self):
+        return self.config.get_perconn(self.get_uri(), "/init-workers")
+
     def set_details_window_size(self, w, h):
         self.config.set_perconn(self.get_uri(), "/window-size", (w, h))
     def get_details_window_size(self):
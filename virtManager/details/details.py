@@ -12,6 +12,7 @@ import libvirt
 
 import virtinst
 from virtinst import log
+from virtinst import xmlutil
 
 from ..lib import uiutil
 from ..addhardware import vmmAddHardware
@@ -1889,17 +1890,60 @@ class vmmDetails(vmmGObjectUI):
         self.widget("overview-network-traffic-text").set_markup(net_txt)
         self.widget("overview-disk-usage-text").set_markup(dsk_txt)
 
-        self._graph_cpu.set_property("data_array",
-                                          self.vm.guest_cpu_time_vector())
-        self._graph_memory.set_property("data_array",
-                                             self.vm.stats_memory_vector())
-
-        d1, d2 = self.vm.disk_io_vectors()
+        # Per vCPU, disk and NIC usage, so a hot device stands out on
+        # VMs with many of them
+        lines = []
+        vcpus = self.vm.vcpu_usage_breakdown()
+        if vcpus:
+            lines.append(", ".join(
+                _("vCPU %(vcpu)s: %(usage)d %%") %
+                {"vcpu": vcpu, "usage": usage} for vcpu, usage in vcpus))
+        for dev, rd, wr in self.vm.disk_io_breakdown():
+            lines.append("%s: %s" % (xmlutil.xml_escape(dev),
+                         _dsk_rx_tx_text(rd, wr, "KiB/s")))
+        for dev, rx, tx in self.vm.network_traffic_breakdown():
+            lines.append("%s: %s" % (xmlutil.xml_escape(dev),
+                         _net_rx_tx_text(rx, tx, "KiB/s")))
+        self.widget("overview-device-breakdown-frame").set_visible(
+                bool(lines))
+        self.widget("overview-device-breakdown-text").set_markup(
+                "\n".join(lines))
+
+        # With on disk stats history or a graph window enabled, the
+        # graphs span all of it, at most one point per pixel
+        for graph, vector, ranges in [
+                (self._graph_cpu, self.vm.guest_cpu_time_vector,
+                 self.vm.guest_cpu_time_range_vectors),
+                (self._graph_memory, self.vm.stats_memory_vector,
+                 self.vm.stats_memory_range_vectors)]:
+            self._set_graph_data(graph,
+                    vector(history=True, width=graph.get_max_points()),
+                    ranges(graph.get_max_points()))
+
+        d1, d2 = self.vm.disk_io_vectors(history=True,
+                width=self._graph_disk.get_max_points())
         self._graph_disk.set_property("data_array", d1 + d2)
 
-        n1, n2 = self.vm.network_traffic_vectors()
+        n1, n2 = self.vm.network_traffic_vectors(history=True,
+                width=self._graph_network.get_max_points())
         self._graph_network.set_property("data_array", n1 + n2)
 
+    def _set_graph_data(self, graph, avg, ranges):
+        """
+        Draw the 1 minute peaks from the stats rollups as a band behind
+        the average, if there are any
+        """
+        if not ranges:
+            graph.set_property("num_sets", 1)
+            graph.set_property("rgb", [])
+            graph.set_property("data_array", avg)
+            return
+
+        peaks = [max(peak, val) for peak, val in zip(ranges[1], avg)]
+        graph.set_property("num_sets", 2)
+        graph.set_property("rgb", [0.75, 0.75, 0.75, 0, 0, 0])
+        graph.set_property("data_array", peaks + avg)
+
     def _cpu_secure_is_available(self):
         domcaps = self.vm.get_domain_capabilities()
         features = domcaps.get_cpu_security_features()
@@ -5,7 +5,7 @@
 # See the COPYING file in the top-level directory.
 
 import queue
-import threading
+import time
 
 from gi.repository import Gio
 from gi.repository import GLib
@@ -16,11 +16,13 @@ from virtinst import log
 from .baseclass import vmmGObject
 from .createconn import vmmCreateConn
 from .connmanager import vmmConnectionManager
+from .lib import metricsexporter
 from .lib.inspection import vmmInspection
+from .lib.tickscheduler import vmmTickScheduler
 from .systray import vmmSystray
 
-(PRIO_HIGH,
- PRIO_LOW) = range(1, 3)
+# Max number of connections that are ticked in parallel
+TICK_WORKERS = 4
 
 
 def _show_startup_error(fn):
@@ -68,13 +70,8 @@ class vmmEngine(vmmGObject):
         self._init_gtk_application()
 
         self._timer = None
-        self._tick_counter = 0
-        self._tick_thread_slow = False
-        self._tick_thread = threading.Thread(name="Tick thread",
-                                            target=self._handle_tick_queue,
-                                            args=())
-        self._tick_thread.daemon = True
-        self._tick_queue = queue.PriorityQueue(100)
+        self._tick_scheduler = vmmTickScheduler(
+                self._handle_conn_tick, TICK_WORKERS)
 
 
     @property
@@ -84,7 +81,7 @@ class vmmEngine(vmmGObject):
 
     def _cleanup(self):
         # self._timer should be automatically cleaned up
-        pass
+        self._tick_scheduler.stop()
 
 
     #################
@@ -97,13 +94,15 @@ class vmmEngine(vmmGObject):
         """
         vmmSystray.get_instance()
         vmmInspection.get_instance()
+        if self.config.get_stats_metrics_address():
+            metricsexporter.start(self.config.get_stats_metrics_address())
 
         self.add_gsettings_handle(
             self.config.on_stats_update_interval_changed(
                 self._timer_changed_cb))
 
         self._schedule_timer()
-        self._tick_thread.start()
+        self._tick_scheduler.start()
         self._tick()
 
         uris = list(self._connobjs.keys())
@@ -266,42 +265,41 @@ class vmmEngine(vmmGObject):
         self._timer = self.timeout_add(interval, self._tick)
 
     def _add_obj_to_tick_queue(self, obj, isprio, **kwargs):
-        if self._tick_queue.full():  # pragma: no cover
-            if not self._tick_thread_slow:
-                log.debug("Tick is slow, not running at requested rate.")
-                self._tick_thread_slow = True
-            return
-
-        self._tick_counter += 1
-        self._tick_queue.put((isprio and PRIO_HIGH or PRIO_LOW,
-                              self._tick_counter,
-                              obj, kwargs))
+        deadline = None
+        if not isprio:
+            # A timer tick that hasn't started by the time the next
+            # one is due is stale
+            deadline = (time.monotonic() +
+                        self.config.get_stats_update_interval())
+        self._tick_scheduler.add(obj, isprio, kwargs, deadline)
 
     def schedule_priority_tick(self, conn, kwargs):
         # Called directly from connection
         self._add_obj_to_tick_queue(conn, True, **kwargs)
 
     def _tick(self):
+        # The timer runs at the minimum interval, connections that
+        # adapted to a longer poll interval skip ticks until they are due
+        now = time.monotonic()
         for conn in self._connobjs.values():
+            if not conn.tick_is_due(now):
+                continue
             self._add_obj_to_tick_queue(conn, False,
                                         stats_update=True, pollvm=True)
         return 1
 
-    def _handle_tick_queue(self):
-        while True:
-            ignore1, ignore2, conn, kwargs = self._tick_queue.get()
-            try:
-                conn.tick_from_engine(**kwargs)
-            except Exception:  # pragma: no cover
-                # Don't attempt to show any UI error here, since it
-                # can cause dialogs to appear from nowhere if say
-                # libvirtd is shut down
-                log.debug("Error polling connection %s",
-                        conn.get_uri(), exc_info=True)
-
-            # Need to clear reference to make leak check happy
-            conn = None
-            self._tick_queue.task_done()
+    def _handle_conn_tick(self, conn, kwargs):
+        """
+        Run from a tick scheduler worker thread
+        """
+        try:
+            conn.tick_from_engine(**kwargs)
+        except Exception:  # pragma: no cover
+            # Don't attempt to show any UI error here, since it
+            # can cause dialogs to appear from nowhere if say
+            # libvirtd is shut down
+            log.debug("Error polling connection %s",
+                    conn.get_uri(), exc_info=True)
 
 
     #####################################
@@ -354,7 +352,13 @@ class vmmEngine(vmmGObject):
 
         def _do_exit():
             try:
+                log.debug("Tick requests coalesced=%s expired=%s, "
+                          "per connection: %s",
+                          self._tick_scheduler.coalesced_count,
+                          self._tick_scheduler.expired_count,
+                          self._tick_scheduler.get_coalesced_counts())
                 vmmConnectionManager.get_instance().cleanup()
+                metricsexporter.stop()
                 self.emit("app-closing")
                 self.cleanup()
 
@@ -467,6 +471,9 @@ class vmmEngine(vmmGObject):
 
         conn_is_new = uri not in self._connobjs
         conn = vmmConnectionManager.get_instance().add_conn(uri)
+        if domain:
+            # Fetch the requested VM first when populating the conn
+            conn.prioritize_init([domain])
         if conn.is_active():
             self.idle_add(self._launch_cli_window,
                 uri, show_window, domain)
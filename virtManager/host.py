@@ -56,6 +56,7 @@ class vmmHost(vmmGObjectUI):
 
         self.builder.connect_signals({
             "on_menu_file_view_manager_activate": self._view_manager_cb,
+            "on_menu_file_libvirt_stats_activate": self._libvirt_stats_cb,
             "on_menu_file_quit_activate": self._exit_app_cb,
             "on_menu_file_close_activate": self.close,
             "on_vmm_host_delete_event": self.close,
@@ -89,6 +90,9 @@ class vmmHost(vmmGObjectUI):
             return  # pragma: no cover
 
         vmmEngine.get_instance().increment_window_counter()
+        # The host graphs sum up the stats of all VMs
+        if self.conn.statsmanager:
+            self.conn.statsmanager.set_watched_vms(self, None)
 
     def close(self, src=None, event=None):
         dummy = src
@@ -98,6 +102,8 @@ class vmmHost(vmmGObjectUI):
             return
 
         self.topwin.hide()
+        if self.conn.statsmanager:
+            self.conn.statsmanager.unwatch_vms(self)
         vmmEngine.get_instance().decrement_window_counter()
 
         return 1
@@ -157,8 +163,10 @@ class vmmHost(vmmGObjectUI):
         vm_memory = uiutil.pretty_mem(self.conn.stats_memory())
         host_memory = uiutil.pretty_mem(self.conn.host_memory_size())
 
-        cpu_vector = self.conn.host_cpu_time_vector()
-        memory_vector = self.conn.stats_memory_vector()
+        cpu_vector = self.conn.host_cpu_time_vector(history=True,
+                width=self._cpu_usage_graph.get_max_points())
+        memory_vector = self.conn.stats_memory_vector(history=True,
+                width=self._memory_usage_graph.get_max_points())
         cpu_vector.reverse()
         memory_vector.reverse()
 
@@ -171,6 +179,11 @@ class vmmHost(vmmGObjectUI):
         self._cpu_usage_graph.set_property("data_array", cpu_vector)
         self._memory_usage_graph.set_property("data_array", memory_vector)
 
+        # Adapted per connection to its latency and activity
+        self.widget("overview-poll-interval").set_text(
+                _("%(interval).1f seconds") %
+                {"interval": self.conn.get_poll_interval()})
+
     def _refresh_conn_state(self):
         conn_active = self.conn.is_active()
 
@@ -194,6 +207,10 @@ class vmmHost(vmmGObjectUI):
         from .manager import vmmManager
         vmmManager.get_instance(self).show()
 
+    def _libvirt_stats_cb(self, src):
+        from .libvirtstats import vmmLibvirtStats
+        vmmLibvirtStats.show_instance(self, self.conn)
+
     def _exit_app_cb(self, src):
         vmmEngine.get_instance().exit_app()
 
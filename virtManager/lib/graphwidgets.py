@@ -3,6 +3,10 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import weakref
+
+import cairo
+
 from gi.repository import GObject
 from gi.repository import Gtk
 
@@ -96,6 +100,10 @@ class CellRendererSparkline(Gtk.CellRenderer):
         'reversed': (GObject.TYPE_BOOLEAN, "Reverse data",
                      "Process data from back to front.",
                      0, GObject.PARAM_READWRITE),
+        'cache_key': (GObject.TYPE_PYOBJECT, "Cache key",
+                      "(row object, data version) to cache the rendered "
+                      "graph under, or None to not cache",
+                      GObject.PARAM_READWRITE),
     }
 
     def __init__(self):
@@ -106,6 +114,17 @@ class CellRendererSparkline(Gtk.CellRenderer):
         self.filled = True
         self.reversed = False
         self.rgb = None
+        self.cache_key = None
+        # row object -> [data version, data array, cairo surface, size]
+        self._cache = weakref.WeakKeyDictionary()
+
+    def is_cached(self, cache_key):
+        """
+        Return True if a graph for cache_key was rendered before, in
+        which case data_array doesn't need to be set for it
+        """
+        entry = self._cache.get(cache_key[0])
+        return entry is not None and entry[0] == cache_key[1]
 
     def do_render(self, cr, widget, background_area, cell_area,
                   flags):
@@ -120,6 +139,37 @@ class CellRendererSparkline(Gtk.CellRenderer):
         ignore = background_area
         ignore = flags
 
+        if self.cache_key is None:
+            self._draw(cr, self.data_array, cell_area.x, cell_area.y,
+                       cell_area.width, cell_area.height)
+            return
+
+        # Rendered graphs are cached per row object as cairo surfaces,
+        # and only redrawn when the row's data version or the cell size
+        # changes, so scrolling and hovering just paint the surface
+        rowobj, version = self.cache_key
+        size = (cell_area.width, cell_area.height)
+        entry = self._cache.get(rowobj)
+        if entry is None or entry[0] != version:
+            entry = [version, list(self.data_array), None, None]
+            self._cache[rowobj] = entry
+
+        surface = entry[2]
+        if surface is None or entry[3] != size:
+            # Similar surfaces inherit the target's device scale, so
+            # the cache stays sharp on HiDPI screens
+            surface = cr.get_target().create_similar(
+                    cairo.CONTENT_COLOR_ALPHA, *size)
+            self._draw(cairo.Context(surface), entry[1], 0, 0, *size)
+            entry[2] = surface
+            entry[3] = size
+
+        cr.set_source_surface(surface, cell_area.x, cell_area.y)
+        cr.rectangle(cell_area.x, cell_area.y,
+                     cell_area.width, cell_area.height)
+        cr.fill()
+
+    def _draw(self, cr, data_array, x, y, width, height):
         # Indent of the gray border around the graph
         BORDER_PADDING = 2
         # Indent of graph from border
@@ -131,25 +181,25 @@ class CellRendererSparkline(Gtk.CellRenderer):
         xalign = self.get_property("xalign")
 
         # Set up graphing bounds
-        graph_x      = (cell_area.x + GRAPH_PAD)
-        graph_y      = (cell_area.y + GRAPH_PAD)
-        graph_width  = (cell_area.width - (GRAPH_PAD * 2))
-        graph_height = (cell_area.height - (GRAPH_PAD * 2))
+        graph_x      = (x + GRAPH_PAD)
+        graph_y      = (y + GRAPH_PAD)
+        graph_width  = (width - (GRAPH_PAD * 2))
+        graph_height = (height - (GRAPH_PAD * 2))
 
-        pixels_per_point = (graph_width // max(1, len(self.data_array) - 1))
+        pixels_per_point = (graph_width // max(1, len(data_array) - 1))
 
         # Graph width needs to be some multiple of the amount of data points
         # we have
-        graph_width = (pixels_per_point * max(1, len(self.data_array) - 1))
+        graph_width = (pixels_per_point * max(1, len(data_array) - 1))
 
         # Recalculate border width based on the amount we are graphing
         border_width = graph_width + (GRAPH_INDENT * 2)
 
         # Align the widget
-        empty_space = cell_area.width - border_width - (BORDER_PADDING * 2)
+        empty_space = width - border_width - (BORDER_PADDING * 2)
         if empty_space:
             xalign_space = int(empty_space * xalign)
-            cell_area.x += xalign_space
+            x += xalign_space
             graph_x += xalign_space
 
         cr.set_line_width(3)
@@ -158,18 +208,18 @@ class CellRendererSparkline(Gtk.CellRenderer):
 
         # Draw gray graph border
         cr.set_source_rgb(0.8828125, 0.8671875, 0.8671875)
-        cr.rectangle(cell_area.x + BORDER_PADDING,
-                     cell_area.y + BORDER_PADDING,
+        cr.rectangle(x + BORDER_PADDING,
+                     y + BORDER_PADDING,
                      border_width,
-                     cell_area.height - (BORDER_PADDING * 2))
+                     height - (BORDER_PADDING * 2))
         cr.stroke()
 
         # Fill in basecolor box inside graph outline
         cr.set_source_rgb(BASECOLOR.red, BASECOLOR.green, BASECOLOR.blue)
-        cr.rectangle(cell_area.x + BORDER_PADDING,
-                     cell_area.y + BORDER_PADDING,
+        cr.rectangle(x + BORDER_PADDING,
+                     y + BORDER_PADDING,
                      border_width,
-                     cell_area.height - (BORDER_PADDING * 2))
+                     height - (BORDER_PADDING * 2))
         cr.fill()
 
         def get_y(index):
@@ -177,9 +227,9 @@ class CellRendererSparkline(Gtk.CellRenderer):
 
             n = index
             if self.reversed:
-                n = (len(self.data_array) - index - 1)
+                n = (len(data_array) - index - 1)
 
-            val = self.data_array[n]
+            val = data_array[n]
             y = baseline_y - (graph_height * val)
 
             y = max(graph_y, y)
@@ -187,31 +237,24 @@ class CellRendererSparkline(Gtk.CellRenderer):
             return y
 
         points = []
-        for index in range(0, len(self.data_array)):
-            x = int(((index * pixels_per_point) + graph_x))
-            y = int(get_y(index))
+        for index in range(0, len(data_array)):
+            px = int(((index * pixels_per_point) + graph_x))
+            py = int(get_y(index))
 
-            points.append((x, y))
-
-
-        cell_area.x = graph_x
-        cell_area.y = graph_y
-        cell_area.width = graph_width
-        cell_area.height = graph_height
+            points.append((px, py))
 
         # Set color to dark blue for the actual sparkline
         cr.set_line_width(2)
         cr.set_source_rgb(0.421875, 0.640625, 0.73046875)
-        draw_line(cr, cell_area.y, cell_area.height, points)
+        draw_line(cr, graph_y, graph_height, points)
 
         # Set color to light blue for the fill
         cr.set_source_rgba(0.71484375, 0.84765625, 0.89453125, .5)
 
         draw_fill(cr,
-                  cell_area.x, cell_area.y,
-                  cell_area.width, cell_area.height,
+                  graph_x, graph_y,
+                  graph_width, graph_height,
                   points)
-        return
 
     def do_get_size(self, widget, cell_area=None):
         ignore = widget
@@ -275,24 +318,52 @@ class Sparkline(Gtk.DrawingArea):
         self.filled = True
         self.reversed = False
         self.rgb = []
+        # Rendered graph, reused until the data, properties, style or
+        # size change
+        self._surface = None
+        self._surface_size = None
 
         ctxt = self.get_style_context()
         ctxt.add_class(Gtk.STYLE_CLASS_ENTRY)
 
     def set_data_array(self, val):
         self._data_array = val
+        self._surface = None
         self.queue_draw()
     def get_data_array(self):
         return self._data_array
     data_array = property(get_data_array, set_data_array)
 
+    def get_max_points(self):
+        """
+        Return the number of points per data set worth drawing at the
+        current width, or None if the widget isn't allocated yet
+        """
+        width = self.get_allocated_width()
+        if width <= 1:
+            return None
+        return width
 
-    def do_draw(self, cr):
-        cr.save()
 
+    def do_style_updated(self):
+        self._surface = None
+        Gtk.DrawingArea.do_style_updated(self)
+
+    def do_draw(self, cr):
         window = self.get_window()
-        w = window.get_width()
-        h = window.get_height()
+        size = (window.get_width(), window.get_height())
+        if self._surface is None or self._surface_size != size:
+            self._surface = cr.get_target().create_similar(
+                    cairo.CONTENT_COLOR_ALPHA, *size)
+            self._surface_size = size
+            self._draw(cairo.Context(self._surface), *size)
+
+        cr.set_source_surface(self._surface, 0, 0)
+        cr.paint()
+        return 0
+
+    def _draw(self, cr, w, h):
+        cr.save()
 
         points_per_set = (len(self.data_array) // self.num_sets)
         pixels_per_point = (float(w) /
@@ -335,7 +406,7 @@ class Sparkline(Gtk.DrawingArea):
             if len(self.rgb) == (self.num_sets * 3):
                 cr.set_source_rgb(self.rgb[(dataset * 3)],
                                         self.rgb[(dataset * 3) + 1],
-                                        self.rgb[(dataset * 1) + 2])
+                                        self.rgb[(dataset * 3) + 2])
             points = []
             for index in range(0, points_per_set):
                 x = index * pixels_per_point
@@ -357,8 +428,6 @@ class Sparkline(Gtk.DrawingArea):
 
         cr.restore()
 
-        return 0
-
     def do_size_request(self, requisition):  # pragma: no cover
         width = len(self.data_array) / self.num_sets
         height = 20
@@ -376,6 +445,7 @@ class Sparkline(Gtk.DrawingArea):
     def do_set_property(self, param_spec, value):
         name = self._sanitize_param_spec_name(param_spec.name)
         setattr(self, name, value)
+        self._surface = None
 
     # These make pylint happy
     def set_property(self, *args, **kwargs):
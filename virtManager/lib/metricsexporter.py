@@ -0,0 +1,271 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+# Optional local endpoint serving the latest stats samples in the
+# Prometheus text exposition format. Samples are converted to text in
+# the connection tick threads right after they are collected, and
+# requests are served from a separate thread, so scraping makes no
+# libvirt calls and never touches the GTK main loop.
+
+import http.server
+import math
+import os
+import socketserver
+import stat
+import threading
+
+from virtinst import log
+
+
+# (metric name, type, help, stats record name, scale)
+_DOMAIN_METRICS = [
+    ("virt_manager_domain_up", "gauge",
+     "Whether the domain is running", None, 1),
+    ("virt_manager_domain_cpu_host_percent", "gauge",
+     "Domain CPU usage as percentage of all host CPUs",
+     "cpuHostPercent", 1),
+    ("virt_manager_domain_cpu_guest_percent", "gauge",
+     "Domain CPU usage as percentage of its vCPUs",
+     "cpuGuestPercent", 1),
+    ("virt_manager_domain_cpu_time_seconds_total", "counter",
+     "Domain CPU time", "cpuTimeAbs", 1e-9),
+    ("virt_manager_domain_memory_used_bytes", "gauge",
+     "Memory used by the domain guest OS", "curmem", 1024),
+    ("virt_manager_domain_memory_used_percent", "gauge",
+     "Memory used by the domain guest OS as percentage of its balloon",
+     "currMemPercent", 1),
+    ("virt_manager_domain_disk_read_bytes_total", "counter",
+     "Bytes read from all domain disks", "diskRdKiB", 1024),
+    ("virt_manager_domain_disk_write_bytes_total", "counter",
+     "Bytes written to all domain disks", "diskWrKiB", 1024),
+    ("virt_manager_domain_network_receive_bytes_total", "counter",
+     "Bytes received by all domain interfaces", "netRxKiB", 1024),
+    ("virt_manager_domain_network_transmit_bytes_total", "counter",
+     "Bytes transmitted by all domain interfaces", "netTxKiB", 1024),
+]
+
+# (metric name, type, help, vmmConnection stats accessor, scale)
+_CONN_METRICS = [
+    ("virt_manager_connection_cpu_percent", "gauge",
+     "CPU usage of all running domains as percentage of the host CPUs",
+     "host_cpu_time_percentage", 1),
+    ("virt_manager_connection_memory_used_bytes", "gauge",
+     "Memory used by all running domains", "stats_memory", 1024),
+    ("virt_manager_connection_memory_used_percent", "gauge",
+     "Memory used by all running domains as percentage of host memory",
+     "stats_memory_percentage", 1),
+    ("virt_manager_connection_domains_running", "gauge",
+     "Number of running domains", None, 1),
+    ("virt_manager_connection_poll_interval_seconds", "gauge",
+     "Current stats poll interval", None, 1),
+]
+
+_EXPORTER = None
+
+
+def _escape(value):
+    return (value.replace("\\", "\\\\").replace("\"", "\\\"").
+            replace("\n", "\\n"))
+
+
+def _labels(**kwargs):
+    return "{%s}" % ",".join('%s="%s"' % (key, _escape(str(val)))
+                             for key, val in sorted(kwargs.items()))
+
+
+def _format_value(value):
+    # The exposition format spells these differently than python's repr
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return value > 0 and "+Inf" or "-Inf"
+    return repr(value)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ["/", "/metrics"]:
+            self.send_error(404)
+            return
+
+        body = self.server.exporter.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # client_address is an empty string for unix sockets
+        return str(self.client_address or "local")
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class _TCPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn,
+                  socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _is_socket(path):
+    """
+    Whether path is a unix socket. Raises an error if something other
+    than a socket is in the way, which we must never delete
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return False
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError("%s exists and is not a socket" % path)
+    return True
+
+
+class _MetricsExporter(object):
+    """
+    Holds the latest rendered samples of every connection, and the
+    server thread that serves them
+    """
+    def __init__(self, address):
+        self._lock = threading.Lock()
+        # uri -> metric name -> list of sample lines
+        self._samples = {}
+        self._unixpath = None
+
+        if address.startswith("unix:") or address.startswith("/"):
+            self._unixpath = address.split(":", 1)[-1]
+            # Remove the socket left behind by a crashed instance
+            if _is_socket(self._unixpath):
+                os.unlink(self._unixpath)
+            self._server = _UnixServer(self._unixpath, _Handler)
+        else:
+            host, port = address.rsplit(":", 1)
+            self._server = _TCPServer((host.strip("[]") or "127.0.0.1",
+                                       int(port)), _Handler)
+        self._server.exporter = self
+
+        self._thread = threading.Thread(name="metrics exporter",
+                                        target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if not self._unixpath:
+            return
+        try:
+            if _is_socket(self._unixpath):
+                os.unlink(self._unixpath)
+        except Exception as e:
+            log.warning("Not removing metrics socket: %s", e)
+
+    def set_samples(self, uri, samples):
+        with self._lock:
+            if samples is None:
+                self._samples.pop(uri, None)
+            else:
+                self._samples[uri] = samples
+
+    def render(self):
+        with self._lock:
+            allsamples = list(self._samples.values())
+
+        lines = []
+        for name, mtype, helpstr, dummy1, dummy2 in (
+                _DOMAIN_METRICS + _CONN_METRICS):
+            lines.append("# HELP %s %s" % (name, helpstr))
+            lines.append("# TYPE %s %s" % (name, mtype))
+            for samples in allsamples:
+                lines.extend(samples.get(name, []))
+        return "\n".join(lines) + "\n"
+
+
+def _build_samples(conn, vms):
+    uri = conn.get_uri()
+    samples = dict((metric[0], []) for metric in
+                   _DOMAIN_METRICS + _CONN_METRICS)
+
+    running = 0
+    for vm in vms:
+        statslist = conn.statsmanager.get_vm_statslist(vm)
+        labels = _labels(uri=uri, domain=vm.get_name(), uuid=vm.get_uuid())
+        active = vm.is_active()
+        running += int(active)
+        for name, dummy1, dummy2, record, scale in _DOMAIN_METRICS:
+            value = active if record is None else (
+                    statslist.get_record(record) * scale)
+            samples[name].append("%s%s %s" % (name, labels,
+                                                 _format_value(value)))
+
+    labels = _labels(uri=uri)
+    values = {
+        "virt_manager_connection_domains_running": running,
+        "virt_manager_connection_poll_interval_seconds":
+            conn.get_poll_interval(),
+    }
+    for name, dummy1, dummy2, accessor, scale in _CONN_METRICS:
+        if accessor is not None:
+            value = getattr(conn, accessor)() * scale
+        else:
+            value = values[name]
+        samples[name].append("%s%s %s" % (name, labels,
+                                                 _format_value(value)))
+    return samples
+
+
+###############
+# Public APIs #
+###############
+
+def start(address):
+    """
+    Start serving metrics on address, which is either host:port for
+    HTTP over TCP, or unix:/path for HTTP over a unix socket
+    """
+    global _EXPORTER
+    if _EXPORTER:
+        return
+    try:
+        _EXPORTER = _MetricsExporter(address)
+        log.debug("Serving metrics on %s", address)
+    except Exception as e:
+        log.warning("Error starting metrics exporter on %s: %s",
+                    address, e)
+
+
+def stop():
+    global _EXPORTER
+    if _EXPORTER:
+        _EXPORTER.stop()
+        _EXPORTER = None
+
+
+def is_running():
+    return bool(_EXPORTER)
+
+
+def update_connection(conn, vms):
+    """
+    Publish the latest stats samples of conn and its VMs. Called from
+    the connection's tick thread after every stats update
+    """
+    exporter = _EXPORTER
+    if not exporter:
+        return
+    try:
+        exporter.set_samples(conn.get_uri(), _build_samples(conn, vms))
+    except Exception:  # pragma: no cover
+        log.debug("Error building metrics for %s", conn, exc_info=True)
+
+
+def remove_connection(uri):
+    exporter = _EXPORTER
+    if exporter:
+        exporter.set_samples(uri, None)
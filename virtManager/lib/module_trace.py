@@ -7,51 +7,227 @@
 # This module provides a simple way to trace any activity on a specific
 # python class or module. The trace output is logged using the regular
 # logging infrastructure. Invoke this with virt-manager --trace-libvirt
+#
+# The same wrappers can also collect per-connection call counts and
+# latency histograms for every libvirt API, see enable_stats(). Nothing
+# is wrapped unless tracing or stats collection is requested.
 
+import json
 import re
+import sys
 import threading
 import time
 import traceback
+import weakref
 from types import FunctionType
 
 from virtinst import log
 
 
 CHECK_MAINLOOP = False
+TRACE = True
+STATS = None
+
+# virConnect -> URI, filled in even if stats aren't collected yet, so
+# collection can be started after connections are open
+_CONN_URIS = weakref.WeakKeyDictionary()
+# Names of modules already wrapped by wrap_module
+_WRAPPED = set()
+
+
+def _is_non_network_call(name):
+    # These APIs don't hit the network, so we might not want to see them.
+    return (name.endswith(".name") or
+        name.endswith(".UUIDString") or
+        name.endswith(".__init__") or
+        name.endswith(".__del__") or
+        name.endswith(".connect") or
+        name.startswith("libvirtError"))
+
+
+class _APIStats(object):
+    """
+    Call counts and latency histogram for a single API
+    """
+    # Upper bucket bounds in milliseconds, the last bucket is unbounded
+    BUCKETS_MS = [1, 5, 10, 50, 100, 500, 1000, 5000]
+    __slots__ = ["main_count", "worker_count", "total", "max", "buckets"]
+
+    def __init__(self):
+        self.main_count = 0
+        self.worker_count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(self.BUCKETS_MS) + 1)
+
+    def record(self, elapsed, is_main_thread):
+        if is_main_thread:
+            self.main_count += 1
+        else:
+            self.worker_count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+        ms = elapsed * 1000
+        idx = 0
+        for bound in self.BUCKETS_MS:
+            if ms <= bound:
+                break
+            idx += 1
+        self.buckets[idx] += 1
+
+    def get_dict(self):
+        count = self.main_count + self.worker_count
+        return {
+            "count": count,
+            "main_thread": self.main_count,
+            "worker_threads": self.worker_count,
+            "total_ms": self.total * 1000,
+            "avg_ms": count and (self.total * 1000 / count) or 0,
+            "max_ms": self.max * 1000,
+            "histogram_ms": dict(zip(
+                [str(b) for b in self.BUCKETS_MS] + ["inf"],
+                self.buckets)),
+        }
+
+
+class _CallStats(object):
+    """
+    Per-connection, per-API call statistics. Calls are mapped to the
+    URI of the virConnect they run against, which needs to be passed
+    to register_conn when the connection is opened.
+    """
+    UNKNOWN_URI = "(unregistered)"
+
+    def __init__(self, uris):
+        self._lock = threading.Lock()
+        self._uris = uris
+        self._stats = {}
+
+    def _lookup_uri(self, obj):
+        # virDomain, virNetwork, ... keep a reference to their virConnect
+        # as _conn, snapshots only to their virDomain
+        for conn in [obj, getattr(obj, "_conn", None),
+                     getattr(getattr(obj, "_dom", None), "_conn", None)]:
+            if conn is None:
+                continue
+            uri = self._uris.get(conn)
+            if uri:
+                return uri
+        return self.UNKNOWN_URI
+
+    def record(self, name, obj, elapsed, is_main_thread):
+        with self._lock:
+            uri = self.UNKNOWN_URI
+            if obj is not None:
+                uri = self._lookup_uri(obj)
+            apis = self._stats.setdefault(uri, {})
+            stats = apis.get(name)
+            if stats is None:
+                stats = _APIStats()
+                apis[name] = stats
+            stats.record(elapsed, is_main_thread)
+
+    def get_dict(self):
+        with self._lock:
+            return dict((uri, dict((name, stats.get_dict())
+                                   for name, stats in apis.items()))
+                        for uri, apis in self._stats.items())
 
+    def reset(self, uri=None):
+        with self._lock:
+            if uri is None:
+                self._stats = {}
+            else:
+                self._stats.pop(uri, None)
 
-def generate_wrapper(origfunc, name):
+
+def enable_stats(module):
+    """
+    Start collecting per-API call stats for every function and class
+    method in module. Wraps module if it isn't already, so until this
+    is called libvirt calls don't pay for any bookkeeping
+    """
+    global STATS
+    if STATS is None:
+        STATS = _CallStats(_CONN_URIS)
+    if module.__name__ not in _WRAPPED:
+        wrap_module(module, mainloop=False, regex=None, trace=False)
+
+
+def register_conn(virconn, uri):
+    """
+    Associate a libvirt virConnect with its URI for stats collection
+    """
+    _CONN_URIS[virconn] = uri
+
+
+def get_stats():
+    """
+    Return a dict of uri -> {apiname: stats dict}. Empty if stats
+    collection isn't enabled
+    """
+    if not STATS:
+        return {}
+    return STATS.get_dict()
+
+
+def reset_stats(uri=None):
+    """
+    Drop collected stats for uri, or for all connections if uri is None
+    """
+    if STATS:
+        STATS.reset(uri)
+
+
+def dump_stats(path):
+    """
+    Write the collected stats as JSON to path. '-' means stdout
+    """
+    content = json.dumps(get_stats(), indent=2, sort_keys=True) + "\n"
+    if path == "-":
+        sys.stdout.write(content)
+        sys.stdout.flush()
+        return
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def generate_wrapper(origfunc, name, ismethod=False):
     # This could be used as generic infrastructure, but it has hacks for
     # identifying places where libvirt hits the network from the main thread,
     # which causes UI blocking on slow network connections.
+    is_non_network_libvirt_call = _is_non_network_call(name)
 
     def newfunc(*args, **kwargs):
         threadname = threading.current_thread().name
-        is_main_thread = (threading.current_thread().name == "MainThread")
-
-        # These APIs don't hit the network, so we might not want to see them.
-        is_non_network_libvirt_call = (name.endswith(".name") or
-            name.endswith(".UUIDString") or
-            name.endswith(".__init__") or
-            name.endswith(".__del__") or
-            name.endswith(".connect") or
-            name.startswith("libvirtError"))
+        is_main_thread = (threadname == "MainThread")
 
-        if (not is_non_network_libvirt_call and
+        if (TRACE and not is_non_network_libvirt_call and
             (is_main_thread or not CHECK_MAINLOOP)):
             tb = ""
             if is_main_thread:
                 tb = "\n%s" % "".join(traceback.format_stack())
             log.debug("TRACE %s: thread=%s: %s %s %s%s",
                           time.time(), threadname, name, args, kwargs, tb)
-        return origfunc(*args, **kwargs)
+
+        if not STATS or is_non_network_libvirt_call:
+            return origfunc(*args, **kwargs)
+
+        start = time.monotonic()
+        try:
+            return origfunc(*args, **kwargs)
+        finally:
+            STATS.record(name, ismethod and args and args[0] or None,
+                         time.monotonic() - start, is_main_thread)
 
     return newfunc
 
 
 def wrap_func(module, funcobj):
     name = funcobj.__name__
-    log.debug("wrapfunc %s %s", funcobj, name)
+    if TRACE:
+        log.debug("wrapfunc %s %s", funcobj, name)
 
     newfunc = generate_wrapper(funcobj, name)
     setattr(module, name, newfunc)
@@ -60,14 +236,16 @@ def wrap_func(module, funcobj):
 def wrap_method(classobj, methodobj):
     name = methodobj.__name__
     fullname = classobj.__name__ + "." + name
-    log.debug("wrapmeth %s", fullname)
+    if TRACE:
+        log.debug("wrapmeth %s", fullname)
 
-    newfunc = generate_wrapper(methodobj, fullname)
+    newfunc = generate_wrapper(methodobj, fullname, ismethod=True)
     setattr(classobj, name, newfunc)
 
 
 def wrap_class(classobj):
-    log.debug("wrapclas %s %s", classobj, classobj.__name__)
+    if TRACE:
+        log.debug("wrapclas %s %s", classobj, classobj.__name__)
 
     for name in dir(classobj):
         obj = getattr(classobj, name)
@@ -75,9 +253,19 @@ def wrap_class(classobj):
             wrap_method(classobj, obj)
 
 
-def wrap_module(module, mainloop, regex):
+def wrap_module(module, mainloop, regex, trace=True):
+    """
+    Wrap every function and class method in module
+
+    :param mainloop: Only trace calls from the main thread
+    :param trace: If False, don't log any calls, the wrappers only
+        collect stats, see enable_stats()
+    """
     global CHECK_MAINLOOP
+    global TRACE
     CHECK_MAINLOOP = mainloop
+    TRACE = trace
+    _WRAPPED.add(module.__name__)
     for name in dir(module):
         if regex and not re.match(regex, name):
             continue  # pragma: no cover
@@ -3,20 +3,363 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
-import re
+import array
+import os
 import time
 
 import libvirt
 
 from virtinst import log
+from virtinst.uri import MagicURI
 
 from ..baseclass import vmmGObject
+from . import metricsexporter
+from .statsproc import fetch_domain_stats, vmmStatsProcess
+from .statsstore import open_stats_file
+
+
+class StatsRing(object):
+    """
+    Fixed capacity ring buffer of stats samples, stored column wise with
+    one array('d') per metric.
+
+    Each column is twice the capacity, and every sample is written at
+    both idx and idx + capacity. That way the newest N samples are always
+    a contiguous slice, so window() can hand out a memoryview without
+    copying, and append() is O(1).
+    """
+    __slots__ = ["_names", "_columns", "_capacity", "_pos", "_len"]
+
+    def __init__(self, names, capacity):
+        self._names = list(names)
+        self._capacity = max(1, capacity)
+        self._columns = dict((name, array.array("d",
+                              bytes(16 * self._capacity)))
+                             for name in self._names)
+        self._pos = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def _get_capacity(self):
+        return self._capacity
+    capacity = property(_get_capacity)
+
+    def resize(self, capacity):
+        """
+        Change the capacity, keeping the newest samples
+        """
+        capacity = max(1, capacity)
+        if capacity == self._capacity:
+            return
+        count = min(self._len, capacity)
+        columns = {}
+        for name in self._names:
+            values = self.window(name, count).tolist()
+            columns[name] = array.array("d", values +
+                    [0.0] * (capacity - count) + values +
+                    [0.0] * (capacity - count))
+
+        self._columns = columns
+        self._capacity = capacity
+        self._pos = count % capacity
+        self._len = count
+
+    def append(self, values):
+        """
+        Append a sample. values is a dict or object with an attribute
+        for every metric name
+        """
+        pos = self._pos
+        mirror = pos + self._capacity
+        getter = (values.get if isinstance(values, dict) else
+                  lambda n: getattr(values, n))
+        for name, column in self._columns.items():
+            column[pos] = column[mirror] = getter(name)
+        self._pos = (pos + 1) % self._capacity
+        self._len = min(self._len + 1, self._capacity)
+
+    def get(self, name, idx=0):
+        """
+        Return the value of metric name for the idx'th newest sample,
+        or 0 if there isn't one
+        """
+        if idx >= self._len:
+            return 0
+        return self._columns[name][(self._pos - 1 - idx) % self._capacity]
+
+    def window(self, name, count):
+        """
+        Return a memoryview over the newest count samples of metric name,
+        ordered oldest to newest. The view is only valid until the next
+        append()
+        """
+        count = min(count, self._len)
+        start = (self._pos - count) % self._capacity
+        return memoryview(self._columns[name])[start:start + count]
+
+    def get_vector(self, name, length, ceil=100.0):
+        """
+        Return a list of the newest samples of metric name divided by
+        ceil, newest first, padded with zeroes to length
+        """
+        view = self.window(name, length)
+        ret = [val / ceil for val in view[::-1]]
+        if len(ret) < length:
+            ret.extend([0] * (length - len(ret)))
+        return ret
+
+
+# Metrics that are kept in the optional on disk stats history
+PERSIST_NAMES = ["timestamp", "cpuHostPercent", "cpuGuestPercent",
+                 "currMemPercent", "memoryPercent",
+                 "diskRdRate", "diskWrRate", "netRxRate", "netTxRate"]
+
+
+def _average(values):
+    return sum(values) / len(values)
+
+
+class _RollupTier(object):
+    """
+    Downsampled stats history, rolled up into fixed width time buckets.
+    Every bucket stores the requested aggregates ("min", "avg", "max")
+    of each metric.
+    """
+    __slots__ = ["width", "funcs", "_names", "_ring", "_empty",
+                 "_bucket", "_acc", "_count"]
+
+    _MERGE = {"min": min, "avg": _average, "max": max}
+
+    def __init__(self, names, width, capacity, funcs):
+        self.width = width
+        self.funcs = funcs
+        self._names = names
+        columns = ["%s_%s" % (name, func)
+                   for name in names for func in funcs]
+        self._ring = StatsRing(columns, capacity)
+        self._empty = dict((column, 0.0) for column in columns)
+        self._bucket = None
+        self._acc = {}
+        self._count = 0
+
+    def _get_capacity(self):
+        return self._ring.capacity
+    capacity = property(_get_capacity)
+
+    def _get_current(self, name, func):
+        vmin, total, vmax = self._acc[name]
+        if func == "min":
+            return vmin
+        if func == "max":
+            return vmax
+        return total / self._count
+
+    def _flush(self):
+        if not self._count:
+            return
+        values = {}
+        for name in self._names:
+            for func in self.funcs:
+                values["%s_%s" % (name, func)] = self._get_current(name, func)
+        self._ring.append(values)
+        self._acc = {}
+        self._count = 0
+
+    def add(self, timestamp, getter):
+        bucket = int(timestamp // self.width)
+        if bucket != self._bucket:
+            self._flush()
+            if self._bucket is not None and bucket > self._bucket + 1:
+                # No samples for a while, keep the time axis intact
+                gap = min(bucket - self._bucket - 1, self.capacity)
+                for dummy in range(gap):
+                    self._ring.append(self._empty)
+            self._bucket = bucket
+
+        for name in self._names:
+            val = getter(name)
+            acc = self._acc.get(name)
+            if acc is None:
+                self._acc[name] = [val, val, val]
+                continue
+            acc[0] = min(acc[0], val)
+            acc[1] += val
+            acc[2] = max(acc[2], val)
+        self._count += 1
+
+    def get_vector(self, name, func, buckets, step=1, ceil=100.0):
+        """
+        Return the newest `buckets` buckets of metric name divided by
+        ceil, newest first, including the one still being filled.
+        Every `step` buckets are merged into a single point, with the
+        same aggregate func that built them.
+        """
+        values = list(self._ring.window("%s_%s" % (name, func), buckets))
+        if self._count:
+            values.append(self._get_current(name, func))
+        values.reverse()
+        values = values[:buckets]
+
+        merge = self._MERGE[func]
+        points = -(-buckets // step)
+        ret = [merge(values[idx:idx + step]) / ceil
+               for idx in range(0, len(values), step)]
+        if len(ret) < points:
+            ret.extend([0] * (points - len(ret)))
+        return ret
+
+
+class StatsRollups(object):
+    """
+    Multi resolution stats history for long graph windows: 10 second
+    averages and 1 minute min/avg/max, next to the raw samples kept by
+    the caller. Graphs ask for as many points as they have pixels, and
+    get them from the finest resolution that fits, so drawing a day of
+    history costs the same as drawing two minutes.
+    """
+    # (bucket width in seconds, max buckets, aggregates)
+    TIERS = [
+        (10, 360, ("avg",)),
+        (60, None, ("min", "avg", "max")),
+    ]
+
+    def __init__(self, names, window):
+        self._names = list(names)
+        self.window = window
+        self._tiers = []
+        for width, maxbuckets, funcs in self.TIERS:
+            capacity = -(-window // width)
+            if maxbuckets:
+                capacity = min(capacity, maxbuckets)
+            self._tiers.append(
+                    _RollupTier(self._names, width, capacity, funcs))
+
+    def add(self, values):
+        """
+        Add a raw sample. values is a dict or object with an attribute
+        for timestamp and every metric name
+        """
+        getter = (values.get if isinstance(values, dict) else
+                  lambda n: getattr(values, n))
+        timestamp = getter("timestamp")
+        for tier in self._tiers:
+            tier.add(timestamp, getter)
+
+    def _pick_source(self, raw, points, interval, func):
+        """
+        Return (tier, buckets, step, seconds per point) for the finest
+        resolution that covers the window with at most `points` points.
+        tier is None for the raw samples
+        """
+        rawlen = int(-(-self.window // interval))
+        if func == "avg" and rawlen <= min(points, raw.capacity):
+            return None, rawlen, 1, interval
+
+        tiers = [t for t in self._tiers if func in t.funcs]
+        for tier in tiers:
+            buckets = -(-self.window // tier.width)
+            if buckets <= min(points, tier.capacity):
+                return tier, buckets, 1, tier.width
+
+        # Even the coarsest tier has more buckets than we have points
+        tier = tiers[-1]
+        buckets = -(-self.window // tier.width)
+        step = -(-buckets // max(1, points))
+        return tier, buckets, step, tier.width * step
+
+    def get_vector(self, raw, name, points, interval,
+                   ceil=100.0, func="avg"):
+        """
+        Return at most `points` values of metric name, covering the whole
+        window, newest first
+
+        :param raw: StatsRing of the raw samples
+        :param interval: Seconds between raw samples
+        :param func: "avg", or "min"/"max" for the 1 minute extremes
+        """
+        tier, buckets, step, dummy = self._pick_source(
+                raw, points, interval, func)
+        if tier is None:
+            return raw.get_vector(name, buckets, ceil)
+        return tier.get_vector(name, func, buckets, step, ceil)
+
+    def get_range_vectors(self, raw, name, points, interval, ceil=100.0):
+        """
+        Return (min, max) vectors of metric name from the 1 minute
+        extremes, with one point per point of get_vector(), so they can
+        be drawn around it. A point finer than a minute gets the
+        extremes of the minute it falls in, a coarser one those of all
+        the minutes it spans.
+        """
+        dummy, buckets, step, width = self._pick_source(
+                raw, points, interval, "avg")
+        count = -(-buckets // step)
+        tier = [t for t in self._tiers if "max" in t.funcs][-1]
+        tierbuckets = min(-(-self.window // tier.width), tier.capacity)
+
+        ret = []
+        for func in ("min", "max"):
+            values = tier.get_vector(name, func, tierbuckets, ceil=ceil)
+            merge = _RollupTier._MERGE[func]
+            vector = []
+            for idx in range(count):
+                lo = min(int(idx * width // tier.width), len(values) - 1)
+                hi = max(lo + 1, int((idx + 1) * width // tier.width))
+                vector.append(merge(values[lo:hi]))
+            ret.append(vector)
+        return tuple(ret)
+
+
+# Metrics that are kept in the multi resolution rollups
+ROLLUP_NAMES = ["cpuHostPercent", "cpuGuestPercent",
+                "currMemPercent", "memoryPercent",
+                "diskRdRate", "diskWrRate", "netRxRate", "netTxRate"]
+
+
+def update_rollups(config, rollups, names):
+    """
+    Return the stats rollups for the configured graph window, reusing
+    rollups if it still matches. Returns None if rollups are disabled
+    """
+    window = config.get_stats_graph_window()
+    if not window:
+        return None
+    if rollups and rollups.window == window:
+        return rollups
+    return StatsRollups([n for n in ROLLUP_NAMES if n in names], window)
+
+
+def update_history_file(config, history, path, names):
+    """
+    Return the on disk stats history at path, sized for the configured
+    number of hours, reusing history if it still matches. Returns None
+    if on disk history is disabled or couldn't be opened
+    """
+    hours = config.get_stats_persist_hours()
+    capacity = int(hours * 3600 // config.get_stats_update_interval())
+    # StatsFile has a __len__, so an empty one is falsy
+    if history is not None and history.capacity == capacity:
+        return history
+    if history is not None:
+        history.close()
+    if not capacity:
+        return None
+    return open_stats_file(path, [n for n in PERSIST_NAMES if n in names],
+                           capacity)
 
 
 class _VMStatsRecord(object):
     """
     Tracks a set of VM stats for a single timestamp
     """
+    __slots__ = ["timestamp", "cpuTime", "cpuTimeAbs",
+                 "cpuHostPercent", "cpuGuestPercent",
+                 "curmem", "currMemPercent",
+                 "diskRdKiB", "diskWrKiB", "netRxKiB", "netTxKiB",
+                 "diskRdRate", "diskWrRate", "netRxRate", "netTxRate"]
+
     def __init__(self, timestamp,
                  cpuTime, cpuTimeAbs,
                  cpuHostPercent, cpuGuestPercent,
@@ -42,13 +385,67 @@ class _VMStatsRecord(object):
         self.netTxRate = None
 
 
+class _DeviceStats(object):
+    """
+    Latest rates of per device counters, like the read and write bytes
+    of every disk of a VM
+    """
+    def __init__(self, fields, scale):
+        self._fields = fields
+        self._scale = scale
+        self._prev = ()
+        self._timestamp = None
+        self._latest = []
+
+    def update(self, timestamp, devices):
+        """
+        :param devices: Sequence of (name, counter1, ...) with one counter
+            per field, as in the compact stats block.devices
+        """
+        prev = dict((dev[0], dev[1:]) for dev in self._prev)
+        timediff = 0
+        if self._timestamp is not None:
+            timediff = timestamp - self._timestamp
+
+        self._latest = []
+        for dev in devices:
+            old = prev.get(dev[0])
+            rates = []
+            for cur, oldval in zip(dev[1:], old or dev[1:]):
+                rate = 0.0
+                if old is not None and timediff > 0:
+                    rate = max(0.0, (cur - oldval) / self._scale / timediff)
+                rates.append(rate)
+            self._latest.append((dev[0], rates))
+        self._prev = devices
+        self._timestamp = timestamp
+
+    def get_latest(self):
+        """
+        Return a list of (device name, [rate per field]) of the newest
+        sample
+        """
+        return self._latest
+
+
 class _VMStatsList(vmmGObject):
     """
-    Tracks a list of VMStatsRecords for a single VM
+    Tracks the stats history for a single VM
     """
-    def __init__(self):
+    def __init__(self, historypath):
         vmmGObject.__init__(self)
-        self._stats = []
+        self._stats = StatsRing(_VMStatsRecord.__slots__,
+                                self._get_capacity())
+        self._historypath = historypath
+        self._history = None
+        self._rollups = None
+        self.version = 0
+
+        # Per vCPU usage in percent, per disk and NIC rates in KiB/s.
+        # Only filled from bulk stats
+        self.vcpu_stats = _DeviceStats(("usage",), 1e7)
+        self.disk_stats = _DeviceStats(("rd", "wr"), 1024.0)
+        self.net_stats = _DeviceStats(("rx", "tx"), 1024.0)
 
         self.diskRdMaxRate = 10.0
         self.diskWrMaxRate = 10.0
@@ -60,21 +457,22 @@ class _VMStatsList(vmmGObject):
         self.stats_net_skip = []
 
     def _cleanup(self):
-        pass
+        if self._history is not None:
+            self._history.close()
+            self._history = None
+
+    def _get_capacity(self):
+        return self.config.get_stats_history_length() + 1
 
     def append_stats(self, newstats):
-        expected = self.config.get_stats_history_length()
-        current = len(self._stats)
-        if current > expected:  # pragma: no cover
-            del(self._stats[expected:current])
+        self._stats.resize(self._get_capacity())
 
         def _calculate_rate(record_name):
             ret = 0.0
-            if self._stats:
-                oldstats = self._stats[0]
+            if len(self._stats):
                 ratediff = (getattr(newstats, record_name) -
-                            getattr(oldstats, record_name))
-                timediff = newstats.timestamp - oldstats.timestamp
+                            self._stats.get(record_name))
+                timediff = newstats.timestamp - self._stats.get("timestamp")
                 ret = float(ratediff) / float(timediff)
             return max(ret, 0.0)
 
@@ -88,29 +486,71 @@ class _VMStatsList(vmmGObject):
         self.netRxMaxRate = max(newstats.netRxRate, self.netRxMaxRate)
         self.netTxMaxRate = max(newstats.netTxRate, self.netTxMaxRate)
 
-        self._stats.insert(0, newstats)
+        self._stats.append(newstats)
+        self.version += 1
+        self._history = update_history_file(self.config, self._history,
+                self._historypath, _VMStatsRecord.__slots__)
+        if self._history is not None:
+            self._history.append(newstats)
+
+        self._rollups = update_rollups(self.config, self._rollups,
+                                       _VMStatsRecord.__slots__)
+        if self._rollups:
+            self._rollups.add(newstats)
+
+    def append_device_stats(self, timestamp, vcpus, disks, nets):
+        """
+        Record the per device counters of the compact bulk stats
+        vcpu.times, block.devices and net.devices
+        """
+        self.vcpu_stats.update(timestamp,
+                [(str(idx), cputime) for idx, cputime in enumerate(vcpus)])
+        self.disk_stats.update(timestamp, disks)
+        self.net_stats.update(timestamp, nets)
 
     def get_record(self, record_name):
-        if not self._stats:
-            return 0
-        return getattr(self._stats[0], record_name)
-
-    def get_vector(self, record_name, limit, ceil=100.0):
-        vector = []
+        return self._stats.get(record_name)
+
+    def get_vector(self, record_name, limit, ceil=100.0, history=False,
+                   width=None):
+        """
+        :param history: If True and on disk history is enabled, spread
+            the returned points over the whole on disk history rather
+            than the newest in memory samples. If a graph window is
+            configured, cover that from the stats rollups instead
+        :param width: Max number of points for history graphs, usually
+            the graph's pixel width
+        """
         statslen = self.config.get_stats_history_length() + 1
         if limit is not None:
             statslen = min(statslen, limit)
+        if history and self._rollups:
+            return self._rollups.get_vector(self._stats, record_name,
+                    width or statslen,
+                    self.config.get_stats_update_interval(), ceil)
+        if history and self._history is not None:
+            return self._history.get_vector(record_name, statslen, ceil)
+        return self._stats.get_vector(record_name, statslen, ceil)
+
+    def get_range_vectors(self, record_name, width, ceil=100.0):
+        """
+        Return (min, max) vectors from the 1 minute extremes, aligned to
+        get_vector(history=True, width=width), or None if the stats
+        rollups are disabled
+        """
+        if not self._rollups:
+            return None
+        statslen = self.config.get_stats_history_length() + 1
+        return self._rollups.get_range_vectors(self._stats, record_name,
+                width or statslen,
+                self.config.get_stats_update_interval(), ceil)
 
-        for i in range(statslen):
-            if i < len(self._stats):
-                vector.append(getattr(self._stats[i], record_name) / ceil)
-            else:
-                vector.append(0)
-        return vector
-
-    def get_in_out_vector(self, name1, name2, limit, ceil):
-        return (self.get_vector(name1, limit, ceil=ceil),
-                self.get_vector(name2, limit, ceil=ceil))
+    def get_in_out_vector(self, name1, name2, limit, ceil, history=False,
+                          width=None):
+        return (self.get_vector(name1, limit, ceil=ceil,
+                                history=history, width=width),
+                self.get_vector(name2, limit, ceil=ceil,
+                                history=history, width=width))
 
 
 class vmmStatsManager(vmmGObject):
@@ -120,9 +560,17 @@ class vmmStatsManager(vmmGObject):
     def __init__(self):
         vmmGObject.__init__(self)
         self._vm_stats = {}
+        self._vm_stats_by_uuid = {}
         self._latest_all_stats = {}
+        self._latest_all_stats_timestamp = None
+        # owner -> set of watched VM UUIDs, or None for all VMs
+        self._watchers = {}
+        # UUIDs of VMs that got full stats in the last poll, or None
+        self._polled_uuids = None
 
         self._all_stats_supported = True
+        self._stats_proc = None
+        self._stats_proc_failed = False
         self._net_stats_supported = True
         self._disk_stats_supported = True
         self._disk_stats_lxc_supported = True
@@ -132,7 +580,12 @@ class vmmStatsManager(vmmGObject):
     def _cleanup(self):
         for statslist in self._vm_stats.values():
             statslist.cleanup()
+        self._vm_stats_by_uuid = {}
         self._latest_all_stats = None
+        self._watchers = {}
+        if self._stats_proc:
+            self._stats_proc.stop()
+            self._stats_proc = None
 
 
     ######################
@@ -146,50 +599,6 @@ class vmmStatsManager(vmmGObject):
         cpuTimeAbs = info[4]
         return state, guestcpus, cpuTimeAbs
 
-    def _sample_cpu_stats(self, vm, allstats):
-        timestamp = time.time()
-        if (not vm.is_active() or
-            not self.config.get_stats_enable_cpu_poll()):
-            return 0, 0, 0, 0, timestamp
-
-        cpuTime = 0
-        cpuHostPercent = 0
-        cpuGuestPercent = 0
-        prevTimestamp = self.get_vm_statslist(vm).get_record("timestamp")
-        prevCpuTime = self.get_vm_statslist(vm).get_record("cpuTimeAbs")
-
-        if allstats:
-            state = allstats.get("state.state", 0)
-            guestcpus = allstats.get("vcpu.current", 0)
-            cpuTimeAbs = allstats.get("cpu.time", 0)
-            timestamp = allstats.get("virt-manager.timestamp")
-        else:
-            state, guestcpus, cpuTimeAbs = self._old_cpu_stats_helper(vm)
-
-        is_offline = (state in [libvirt.VIR_DOMAIN_SHUTOFF,
-                                libvirt.VIR_DOMAIN_CRASHED])
-        if is_offline:
-            guestcpus = 0
-            cpuTimeAbs = 0
-
-        cpuTime = cpuTimeAbs - prevCpuTime
-        if not is_offline:
-            hostcpus = vm.conn.host_active_processor_count()
-
-            pcentbase = (
-                    ((cpuTime) * 100.0) /
-                    ((timestamp - prevTimestamp) * 1000.0 * 1000.0 * 1000.0))
-            cpuHostPercent = pcentbase / hostcpus
-            # Under RHEL-5.9 using a XEN HV guestcpus can be 0 during shutdown
-            # so play safe and check it.
-            cpuGuestPercent = guestcpus > 0 and pcentbase / guestcpus or 0
-
-        cpuHostPercent = max(0.0, min(100.0, cpuHostPercent))
-        cpuGuestPercent = max(0.0, min(100.0, cpuGuestPercent))
-
-        return cpuTime, cpuTimeAbs, cpuHostPercent, cpuGuestPercent, timestamp
-
-
     ######################
     # net stats handling #
     ######################
@@ -218,24 +627,10 @@ class vmmStatsManager(vmmGObject):
 
         return 0, 0  # pragma: no cover
 
-    def _sample_net_stats(self, vm, allstats):
+    def _sample_net_stats(self, vm):
         rx = 0
         tx = 0
         statslist = self.get_vm_statslist(vm)
-        if (not self._net_stats_supported or
-            not vm.is_active() or
-            not self.config.get_stats_enable_net_poll()):
-            statslist.stats_net_skip = []
-            return rx, tx
-
-        if allstats:
-            for key in allstats.keys():  # pragma: no cover
-                if re.match(r"net.[0-9]+.rx.bytes", key):
-                    rx += allstats[key]
-                if re.match(r"net.[0-9]+.tx.bytes", key):
-                    tx += allstats[key]
-            return rx, tx
-
         for iface in vm.get_interface_devices_norefresh():
             dev = iface.target_dev
             if not dev:
@@ -278,23 +673,10 @@ class vmmStatsManager(vmmGObject):
 
         return 0, 0  # pragma: no cover
 
-    def _sample_disk_stats(self, vm, allstats):
+    def _sample_disk_stats(self, vm):
         rd = 0
         wr = 0
         statslist = self.get_vm_statslist(vm)
-        if (not self._disk_stats_supported or
-            not vm.is_active() or
-            not self.config.get_stats_enable_disk_poll()):
-            statslist.stats_disk_skip = []
-            return rd, wr
-
-        if allstats:
-            for key in allstats.keys():
-                if re.match(r"block.[0-9]+.rd.bytes", key):
-                    rd += allstats[key]
-                if re.match(r"block.[0-9]+.wr.bytes", key):
-                    wr += allstats[key]
-            return rd, wr
 
         # LXC has a special blockStats method
         if vm.conn.is_lxc() and self._disk_stats_lxc_supported:
@@ -326,6 +708,11 @@ class vmmStatsManager(vmmGObject):
     # memory stats handling #
     #########################
 
+    def _ensure_mem_stats_period(self, vm, statslist):
+        if statslist.mem_stats_period_is_set is False:
+            self._set_mem_stats_period(vm)
+            statslist.mem_stats_period_is_set = True
+
     def _set_mem_stats_period(self, vm):
         # QEMU requires to explicitly enable memory stats polling per VM
         # if we want fine grained memory stats
@@ -360,42 +747,144 @@ class vmmStatsManager(vmmGObject):
 
         return totalmem, curmem
 
-    def _sample_mem_stats(self, vm, allstats):
-        statslist = self.get_vm_statslist(vm)
-        if (not self._mem_stats_supported or
-            not vm.is_active() or
-            not self.config.get_stats_enable_memory_poll()):
-            statslist.mem_stats_period_is_set = False
-            return 0, 0
+    def _sample_vm_stats(self, vm):
+        """
+        Fetch the counters of a VM we have no bulk stats for with the
+        per VM APIs, in the format of a compact getAllDomainStats row
+        """
+        stats = {}
+        if not vm.is_active():
+            return stats
 
-        if statslist.mem_stats_period_is_set is False:
-            self._set_mem_stats_period(vm)
-            statslist.mem_stats_period_is_set = True
-
-        if allstats:
-            totalmem = allstats.get("balloon.current", 1)
-            curmem = max(0,
-                    totalmem - allstats.get("balloon.unused", totalmem))
-        else:
+        if self.config.get_stats_enable_cpu_poll():
+            (stats["state.state"], stats["vcpu.current"],
+             stats["cpu.time"]) = self._old_cpu_stats_helper(vm)
+        if (self._mem_stats_supported and
+            self.config.get_stats_enable_memory_poll()):
             totalmem, curmem = self._old_mem_stats_helper(vm)
+            stats["balloon.current"] = totalmem
+            stats["balloon.unused"] = totalmem - curmem
+        if (self._disk_stats_supported and
+            self.config.get_stats_enable_disk_poll()):
+            (stats["block.rd.bytes"],
+             stats["block.wr.bytes"]) = self._sample_disk_stats(vm)
+        if (self._net_stats_supported and
+            self.config.get_stats_enable_net_poll()):
+            (stats["net.rx.bytes"],
+             stats["net.tx.bytes"]) = self._sample_net_stats(vm)
+        return stats
+
+    def _make_record(self, vm, statslist, stats, timestamp):
+        """
+        Compute a VM's stats record from its counters, given in the
+        format of a compact getAllDomainStats row, whether they come
+        from bulk stats or _sample_vm_stats. Returns the
+        _VMStatsRecord and the per device (vcpus, disks, nets) stats
+        """
+        active = vm.is_active()
 
-        currMemPercent = (curmem / float(totalmem)) * 100
-        currMemPercent = max(0.0, min(currMemPercent, 100.0))
+        cpuTime = 0
+        cpuTimeAbs = 0
+        cpuHostPercent = 0
+        cpuGuestPercent = 0
+        vcpus = ()
+        if active and self.config.get_stats_enable_cpu_poll():
+            state = stats.get("state.state", 0)
+            guestcpus = stats.get("vcpu.current", 0)
+            vcpus = stats.get("vcpu.times", ())
+            is_offline = (state in [libvirt.VIR_DOMAIN_SHUTOFF,
+                                    libvirt.VIR_DOMAIN_CRASHED])
+            if not is_offline:
+                cpuTimeAbs = stats.get("cpu.time", 0)
+
+            cpuTime = cpuTimeAbs - statslist.get_record("cpuTimeAbs")
+            if not is_offline:
+                hostcpus = vm.conn.host_active_processor_count()
+                pcentbase = (
+                        ((cpuTime) * 100.0) /
+                        ((timestamp - statslist.get_record("timestamp")) *
+                         1000.0 * 1000.0 * 1000.0))
+                cpuHostPercent = pcentbase / hostcpus
+                # Under RHEL-5.9 using a XEN HV guestcpus can be 0 during
+                # shutdown so play safe and check it.
+                cpuGuestPercent = (guestcpus > 0 and
+                                   pcentbase / guestcpus or 0)
+        cpuHostPercent = max(0.0, min(100.0, cpuHostPercent))
+        cpuGuestPercent = max(0.0, min(100.0, cpuGuestPercent))
+
+        curmem = 0
+        currMemPercent = 0
+        if (not active or
+            not self._mem_stats_supported or
+            not self.config.get_stats_enable_memory_poll()):
+            statslist.mem_stats_period_is_set = False
+        else:
+            self._ensure_mem_stats_period(vm, statslist)
+            totalmem = stats.get("balloon.current", 1) or 1
+            curmem = max(0, totalmem - stats.get("balloon.unused", totalmem))
+            currMemPercent = (curmem / float(totalmem)) * 100
+            currMemPercent = max(0.0, min(currMemPercent, 100.0))
+
+        rd = wr = 0
+        disks = ()
+        if (not active or
+            not self._disk_stats_supported or
+            not self.config.get_stats_enable_disk_poll()):
+            statslist.stats_disk_skip = []
+        else:
+            rd = stats.get("block.rd.bytes", 0)
+            wr = stats.get("block.wr.bytes", 0)
+            disks = stats.get("block.devices", ())
+
+        rx = tx = 0
+        nets = ()
+        if (not active or
+            not self._net_stats_supported or
+            not self.config.get_stats_enable_net_poll()):
+            statslist.stats_net_skip = []
+        else:
+            rx = stats.get("net.rx.bytes", 0)
+            tx = stats.get("net.tx.bytes", 0)
+            nets = stats.get("net.devices", ())
 
-        return currMemPercent, curmem
+        record = _VMStatsRecord(
+                timestamp, cpuTime, cpuTimeAbs,
+                cpuHostPercent, cpuGuestPercent,
+                curmem, currMemPercent,
+                int(rd), int(wr), int(rx), int(tx))
+        return record, (vcpus, disks, nets)
 
 
     ####################
     # alltats handling #
     ####################
 
-    def _get_all_stats(self, conn):
+    def _get_watched_uuids(self):
+        """
+        Return the set of UUIDs of VMs that need full stats, or None
+        if all VMs do
+        """
+        watchers = list(self._watchers.values())
+        if not watchers or None in watchers:
+            return None
+        # Metrics are exported for every VM, and the on disk history
+        # records host totals, which sum up every VM
+        if (metricsexporter.is_running() or
+            self.config.get_stats_persist_hours()):
+            return None
+        ret = set()
+        for uuids in watchers:
+            ret.update(uuids)
+        return ret
+
+    def _get_all_stats(self, conn, uuids):
         if not self._all_stats_supported:
             return {}
 
-        statflags = 0
+        # State stats are always requested, vmmDomain uses them to
+        # refresh run state without a per domain info() call
+        statflags = libvirt.VIR_DOMAIN_STATS_STATE
         if self.config.get_stats_enable_cpu_poll():
-            statflags |= libvirt.VIR_DOMAIN_STATS_STATE
             statflags |= libvirt.VIR_DOMAIN_STATS_CPU_TOTAL
             statflags |= libvirt.VIR_DOMAIN_STATS_VCPU
         if self.config.get_stats_enable_memory_poll():
@@ -404,18 +893,18 @@ class vmmStatsManager(vmmGObject):
             statflags |= libvirt.VIR_DOMAIN_STATS_BLOCK
         if self.config.get_stats_enable_net_poll():
             statflags |= libvirt.VIR_DOMAIN_STATS_INTERFACE
-        if statflags == 0:
-            return {}  # pragma: no cover
 
         ret = {}
         try:
-            timestamp = time.time()
-            rawallstats = conn.get_backend().getAllDomainStats(statflags, 0)
-
-            # Reformat the output to be a bit more friendly
-            for dom, domallstats in rawallstats:
-                domallstats["virt-manager.timestamp"] = timestamp
-                ret[dom.UUIDString()] = domallstats
+            allstats = None
+            if self._use_stats_process(conn):
+                allstats = self._fetch_stats_process(conn, statflags, uuids)
+            if allstats is None:
+                allstats = fetch_domain_stats(conn.get_backend(),
+                                              statflags, uuids)
+            # The stats process hands out its snapshot dict without
+            # copying it, so it must not be modified here
+            ret = allstats
         except libvirt.libvirtError as err:
             if conn.support.is_error_nosupport(err):
                 log.debug("conn does not support getAllDomainStats()")
@@ -425,31 +914,119 @@ class vmmStatsManager(vmmGObject):
         return ret
 
 
+    def _use_stats_process(self, conn):
+        if self._stats_proc_failed:
+            return False
+        if not self.config.get_stats_out_of_process():
+            return False
+        # The test driver's state is private to every connection, and
+        # magic test URIs are faked in process, so a second connection
+        # from the helper wouldn't see the same VMs
+        if conn.is_test() or MagicURI.uri_is_magic(conn.get_uri()):
+            return False
+        # The helper can't answer SSH or auth prompts, and a slow
+        # remote link would block the tick waiting on the helper
+        if conn.is_remote():
+            return False
+        return True
+
+    def _fetch_stats_process(self, conn, statflags, uuids):
+        """
+        Fetch stats from the helper process. Returns None if the helper
+        isn't usable, after which we permanently fall back to in process
+        polling for this connection.
+        """
+        if not self._stats_proc:
+            log.debug("Starting stats process for %s", conn.get_uri())
+            self._stats_proc = vmmStatsProcess(conn.get_uri())
+        try:
+            return self._stats_proc.fetch(statflags, uuids)
+        except libvirt.libvirtError:
+            raise
+        except Exception as e:
+            log.debug("Stats process for %s failed, falling back to "
+                      "in process polling: %s", conn.get_uri(), e)
+            self._stats_proc.stop()
+            self._stats_proc = None
+            self._stats_proc_failed = True
+            return None
+
+
     ##############
     # Public API #
     ##############
 
     def refresh_vm_stats(self, vm):
-        domallstats = self._latest_all_stats.get(vm.get_uuid(), None)
-
-        (cpuTime, cpuTimeAbs, cpuHostPercent, cpuGuestPercent, timestamp) = \
-                self._sample_cpu_stats(vm, domallstats)
-        currMemPercent, curmem = self._sample_mem_stats(vm, domallstats)
-        diskRdBytes, diskWrBytes = self._sample_disk_stats(vm, domallstats)
-        netRxBytes, netTxBytes = self._sample_net_stats(vm, domallstats)
+        if (self._polled_uuids is not None and
+            vm.get_uuid() not in self._polled_uuids):
+            # Nobody is showing this VM's stats, keep the last sample
+            # until it's watched again, rather than sampling it per VM
+            return
 
-        newstats = _VMStatsRecord(
-                timestamp, cpuTime, cpuTimeAbs,
-                cpuHostPercent, cpuGuestPercent,
-                curmem, currMemPercent,
-                diskRdBytes, diskWrBytes,
-                netRxBytes, netTxBytes)
-        self.get_vm_statslist(vm).append_stats(newstats)
+        statslist = self.get_vm_statslist(vm)
+        stats = self._latest_all_stats.get(vm.get_uuid(), None)
+        if stats is not None:
+            timestamp = self._latest_all_stats_timestamp
+        else:
+            timestamp = time.time()
+            stats = self._sample_vm_stats(vm)
+
+        newstats, devstats = self._make_record(vm, statslist, stats,
+                                               timestamp)
+        statslist.append_stats(newstats)
+        statslist.append_device_stats(timestamp, *devstats)
+
+    def polled_all_vms(self):
+        """
+        Whether the last poll refreshed the stats of every VM
+        """
+        return self._polled_uuids is None
+
+    def set_watched_vms(self, owner, vms):
+        """
+        Register the VMs whose stats owner currently displays, None
+        meaning all VMs. Once any owner is registered, only the VMs
+        watched by some owner get full stats, the rest only get their
+        run state refreshed.
+        """
+        watchers = self._watchers.copy()
+        watchers[owner] = (None if vms is None else
+                           frozenset(vm.get_uuid() for vm in vms))
+        # Replace rather than update, the tick thread reads this
+        self._watchers = watchers
+
+    def unwatch_vms(self, owner):
+        watchers = self._watchers.copy()
+        watchers.pop(owner, None)
+        self._watchers = watchers
 
     def cache_all_stats(self, conn):
-        self._latest_all_stats = self._get_all_stats(conn)
+        uuids = self._get_watched_uuids()
+        self._polled_uuids = uuids
+        timestamp = time.time()
+        allstats = self._get_all_stats(conn, uuids)
+        self._latest_all_stats = allstats
+        self._latest_all_stats_timestamp = timestamp
+
+    def get_vm_state(self, vm):
+        """
+        Return the (state, reason) of the VM from the last bulk stats
+        call, or None if it isn't available and the caller needs to
+        fall back to per domain APIs
+        """
+        domallstats = self._latest_all_stats.get(vm.get_uuid(), None)
+        if not domallstats or "state.state" not in domallstats:
+            return None
+        return (domallstats["state.state"],
+                domallstats.get("state.reason", 0))
 
     def get_vm_statslist(self, vm):
         if vm.get_name() not in self._vm_stats:
-            self._vm_stats[vm.get_name()] = _VMStatsList()
+            # Like vm.get_cache_dir(), but the directory is only created
+            # once on disk history is enabled
+            historypath = os.path.join(vm.conn.get_cache_dir(),
+                                       vm.get_uuid(), "stats")
+            statslist = _VMStatsList(historypath)
+            self._vm_stats[vm.get_name()] = statslist
+            self._vm_stats_by_uuid[vm.get_uuid()] = statslist
         return self._vm_stats[vm.get_name()]
@@ -0,0 +1,280 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+# Helpers for running the getAllDomainStats polling of a connection in
+# a separate process. The helper opens its own read-only connection,
+# polls and reduces the stats there, and only sends compact per domain
+# deltas back to the GUI process, which keeps the GTK process' GIL free
+# of the bulk stats handling on big hosts.
+#
+# The helper is started as its own entry point:
+#
+#   python3 -m virtManager.lib.statsproc --fd FD URI
+#
+# where FD is one end of a socketpair. It doesn't use multiprocessing's
+# process launching, since that re-runs the parent's __main__, which is
+# the virt-manager script.
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+from multiprocessing.connection import Connection
+
+import libvirt
+
+
+# Stats we copy verbatim from getAllDomainStats output
+_PLAIN_KEYS = [
+    "state.state",
+    "state.reason",
+    "vcpu.current",
+    "cpu.time",
+    "balloon.current",
+    "balloon.unused",
+]
+
+
+def compact_domain_stats(rawstats):
+    """
+    Reduce a single domain's getAllDomainStats dict to the values the
+    stats manager consumes. Per device block and net byte counters are
+    summed up into block.rd.bytes, net.rx.bytes, etc. The per device
+    values are kept as block.devices and net.devices tuples of
+    (name, read/rx bytes, write/tx bytes), and the per vCPU times as
+    the vcpu.times tuple.
+    """
+    ret = dict((key, rawstats[key]) for key in _PLAIN_KEYS
+               if key in rawstats)
+
+    # Plain suffix checks rather than regexes, this runs for every
+    # key of every domain on every tick, and most keys are skipped
+    # after the first check
+    vcpus = {}
+    devices = {"block": {}, "net": {}}
+    def _get_dev(rawkey):
+        parts = rawkey.split(".", 2)
+        if len(parts) != 3 or parts[0] not in devices:
+            return None, None
+        devs = devices[parts[0]]
+        if parts[1] not in devs:
+            devs[parts[1]] = [parts[1], 0, 0]
+        return devs[parts[1]], parts[2]
+
+    for rawkey, value in rawstats.items():
+        if rawkey.endswith(".bytes"):
+            dev, field = _get_dev(rawkey)
+            if field in ("rd.bytes", "rx.bytes"):
+                dev[1] = value
+            elif field in ("wr.bytes", "tx.bytes"):
+                dev[2] = value
+        elif rawkey.endswith(".name"):
+            dev, field = _get_dev(rawkey)
+            if dev:
+                dev[0] = value
+        elif rawkey.startswith("vcpu.") and rawkey.endswith(".time"):
+            vcpus[int(rawkey[5:-5])] = value
+
+    ret["vcpu.times"] = tuple(vcpus[idx] for idx in sorted(vcpus))
+    for prefix, inkey, outkey in [
+            ("block", "block.rd.bytes", "block.wr.bytes"),
+            ("net", "net.rx.bytes", "net.tx.bytes")]:
+        devs = tuple(tuple(devices[prefix][idx]) for idx in
+                     sorted(devices[prefix], key=int))
+        ret[prefix + ".devices"] = devs
+        ret[inkey] = sum(dev[1] for dev in devs)
+        ret[outkey] = sum(dev[2] for dev in devs)
+    return ret
+
+
+def fetch_domain_stats(conn, statflags, uuids=None):
+    """
+    Poll stats of all domains of conn, and return a dict of
+    uuid -> compact stats. If uuids is not None, only the domains
+    listed there get the statflags stat families, via one
+    domainListGetStats call, all others only get state stats.
+    """
+    if uuids is None:
+        return dict((dom.UUIDString(), compact_domain_stats(domallstats))
+                    for dom, domallstats in
+                    conn.getAllDomainStats(statflags, 0))
+
+    ret = {}
+    doms = []
+    for dom, domallstats in conn.getAllDomainStats(
+            libvirt.VIR_DOMAIN_STATS_STATE, 0):
+        uuid = dom.UUIDString()
+        ret[uuid] = compact_domain_stats(domallstats)
+        if uuid in uuids:
+            doms.append(dom)
+
+    if doms and statflags != libvirt.VIR_DOMAIN_STATS_STATE:
+        for dom, domallstats in conn.domainListGetStats(doms, statflags, 0):
+            ret[dom.UUIDString()] = compact_domain_stats(domallstats)
+    return ret
+
+
+def _helper_main(uri, pipe):
+    """
+    Entry point of the helper process. Each received message is a
+    (statflags, uuids) tuple of fetch_domain_stats arguments, and is
+    answered with one of
+
+    * ("delta", changed, gone): changed is a dict of uuid -> compact
+      stats for domains whose stats differ from the previous reply,
+      gone is a list of UUIDs that disappeared since then
+    * ("error", message, error code): the libvirt call failed
+    * ("open-failed", message): the helper couldn't open the connection
+      and exits
+    """
+    try:
+        conn = libvirt.openReadOnly(uri)
+    except libvirt.libvirtError as e:
+        try:
+            pipe.recv()
+            pipe.send(("open-failed", str(e)))
+        except (EOFError, OSError):
+            pass
+        return
+
+    last = {}
+    while True:
+        try:
+            msg = pipe.recv()
+        except (EOFError, OSError):
+            break
+        if msg is None:
+            break
+
+        statflags, uuids = msg
+        try:
+            snapshot = fetch_domain_stats(conn, statflags, uuids)
+        except libvirt.libvirtError as e:
+            pipe.send(("error", str(e), e.get_error_code()))
+            continue
+
+        changed = dict((uuid, stats) for uuid, stats in snapshot.items()
+                       if last.get(uuid) != stats)
+        gone = [uuid for uuid in last if uuid not in snapshot]
+        last = snapshot
+        pipe.send(("delta", changed, gone))
+
+    conn.close()
+
+
+class vmmStatsProcess(object):
+    """
+    GUI side handle for a stats helper process of a single connection.
+    The process is started on first use, and restarted if it died.
+    Only use this for local URIs: the helper has no way to answer
+    SSH or auth prompts.
+    """
+    TIMEOUT = 10
+
+    def __init__(self, uri):
+        self._uri = uri
+        self._proc = None
+        self._pipe = None
+        self._snapshot = {}
+
+    def _start(self):
+        parentsock, childsock = socket.socketpair()
+        childfd = childsock.fileno()
+
+        # virtManager is installed outside of the default python path,
+        # see the virt-manager script, so pass our location along
+        topdir = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        env = os.environ.copy()
+        env["PYTHONPATH"] = os.pathsep.join(
+            [topdir] + [p for p in [env.get("PYTHONPATH")] if p])
+
+        cmd = [sys.executable, "-m", "virtManager.lib.statsproc",
+               "--fd", str(childfd), self._uri]
+        try:
+            proc = subprocess.Popen(cmd, env=env, pass_fds=[childfd],
+                                    stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.DEVNULL)
+        except Exception:
+            parentsock.close()
+            raise
+        finally:
+            childsock.close()
+
+        self._proc = proc
+        self._pipe = Connection(parentsock.detach())
+        self._snapshot = {}
+
+    def is_alive(self):
+        return bool(self._proc and self._proc.poll() is None)
+
+    def stop(self):
+        if self._pipe:
+            try:
+                self._pipe.send(None)
+            except (EOFError, OSError):  # pragma: no cover
+                pass
+            self._pipe.close()
+        if self._proc:
+            try:
+                self._proc.wait(1)
+            except subprocess.TimeoutExpired:  # pragma: no cover
+                self._proc.kill()
+                self._proc.wait()
+        self._proc = None
+        self._pipe = None
+        self._snapshot = {}
+
+    def fetch(self, statflags, uuids=None):
+        """
+        Poll stats via the helper process and return a dict of
+        uuid -> compact stats for all domains. statflags and uuids are
+        passed to fetch_domain_stats. The dict is updated in place by
+        the next fetch, so callers must treat it as read only
+
+        :raises libvirt.libvirtError: If the libvirt call failed in
+            the helper
+        :raises RuntimeError: If the helper process is unusable
+        """
+        if not self.is_alive():
+            self.stop()
+            self._start()
+
+        try:
+            self._pipe.send((statflags, uuids))
+            if not self._pipe.poll(self.TIMEOUT):
+                raise RuntimeError("Timed out waiting for stats process")
+            msg = self._pipe.recv()
+        except Exception:
+            self.stop()
+            raise
+
+        if msg[0] == "open-failed":
+            self.stop()
+            raise RuntimeError(
+                    "Stats process failed to open %s: %s" % (self._uri, msg[1]))
+        if msg[0] == "error":
+            err = libvirt.libvirtError(msg[1])
+            err.err = [msg[2]]
+            raise err
+
+        dummy, changed, gone = msg
+        for uuid in gone:
+            self._snapshot.pop(uuid, None)
+        self._snapshot.update(changed)
+        return self._snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="virt-manager stats helper process")
+    parser.add_argument("--fd", type=int, required=True,
+            help="Socket to receive requests and send replies on")
+    parser.add_argument("uri")
+    options = parser.parse_args()
+    _helper_main(options.uri, Connection(options.fd))
+
+
+if __name__ == "__main__":
+    main()
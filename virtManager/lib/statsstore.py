@@ -0,0 +1,170 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import mmap
+import os
+import struct
+import zlib
+
+from virtinst import log
+
+
+class StatsFile(object):
+    """
+    Fixed size, memory mapped ring file of stats samples, used to keep
+    long stats history across restarts without holding it in memory.
+
+    The file is a small header followed by one column of doubles per
+    metric. Appending a sample writes one value per column plus the
+    header, so it's cheap enough to do every tick, and reads only touch
+    the pages of the samples that are actually requested.
+    """
+    MAGIC = b"VMMSTATS"
+    VERSION = 1
+    # magic, version, ncols, capacity, names crc, pos, count
+    _HEADER_FMT = "<8sIIIIQQ"
+    HEADER_SIZE = 64
+    # Most samples averaged into a single get_vector point
+    _BUCKET_SAMPLES = 16
+
+    def __init__(self, path, names, capacity):
+        self._path = path
+        self._names = list(names)
+        self._capacity = max(1, capacity)
+        self._offsets = dict((name, self.HEADER_SIZE + idx * self._capacity * 8)
+                             for idx, name in enumerate(self._names))
+        self._pos = 0
+        self._count = 0
+        self._file = None
+        self._mmap = None
+        self._open()
+
+    def _names_crc(self):
+        return zlib.crc32(",".join(self._names).encode("utf-8"))
+
+    def _open(self):
+        size = self.HEADER_SIZE + len(self._names) * self._capacity * 8
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._file = os.fdopen(fd, "r+b")
+
+        reset = os.fstat(fd).st_size != size
+        if reset:
+            self._file.truncate(size)
+        self._mmap = mmap.mmap(fd, size)
+
+        if not reset:
+            (magic, version, ncols, capacity, crc, pos, count) = \
+                struct.unpack_from(self._HEADER_FMT, self._mmap, 0)
+            reset = (magic != self.MAGIC or
+                     version != self.VERSION or
+                     ncols != len(self._names) or
+                     capacity != self._capacity or
+                     crc != self._names_crc() or
+                     pos >= capacity or count > capacity)
+            if not reset:
+                self._pos = pos
+                self._count = count
+        if reset:
+            log.debug("Initializing stats file %s", self._path)
+            self._mmap[:] = bytes(size)
+            self._write_header()
+
+    def _write_header(self):
+        struct.pack_into(self._HEADER_FMT, self._mmap, 0,
+                         self.MAGIC, self.VERSION, len(self._names),
+                         self._capacity, self._names_crc(),
+                         self._pos, self._count)
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return self._count
+
+    def _get_capacity(self):
+        return self._capacity
+    capacity = property(_get_capacity)
+
+    def append(self, values):
+        """
+        Append a sample. values is a dict or object with an attribute
+        for every metric name
+        """
+        getter = (values.get if isinstance(values, dict) else
+                  lambda n: getattr(values, n))
+        offset = self._pos * 8
+        for name in self._names:
+            struct.pack_into("<d", self._mmap,
+                             self._offsets[name] + offset, getter(name))
+
+        self._pos = (self._pos + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+        self._write_header()
+
+    def _bucket_average(self, column, start, length):
+        """
+        Average length samples of column starting at physical index
+        start, wrapping around the end of the ring. Long buckets are
+        sampled at a stride, so a read never touches more than
+        _BUCKET_SAMPLES values per point
+        """
+        stride = max(1, length // self._BUCKET_SAMPLES)
+        end = start + length
+        if end <= self._capacity:
+            parts = [column[start:end:stride]]
+        else:
+            parts = [column[start::stride],
+                     column[:end - self._capacity:stride]]
+
+        total = 0.0
+        count = 0
+        for part in parts:
+            total += sum(part)
+            count += len(part)
+            part.release()
+        return total / count
+
+    def get_vector(self, name, points, ceil=100.0):
+        """
+        Return up to `points` values of metric name divided by ceil,
+        newest first, covering all stored samples. If there are more
+        samples than points, each point is the average of a bucket of
+        consecutive samples. The result is padded with zeroes to `points`.
+        """
+        step = max(1, -(-self._count // max(1, points)))
+        ret = []
+        column = memoryview(self._mmap)[
+            self._offsets[name]:
+            self._offsets[name] + self._capacity * 8].cast("d")
+        try:
+            # Bucket idx covers the idx * step'th to (idx + 1) * step'th
+            # newest samples, which are stored just before self._pos
+            for newest in range(0, self._count, step):
+                length = min(step, self._count - newest)
+                start = (self._pos - newest - length) % self._capacity
+                ret.append(self._bucket_average(column, start, length) /
+                           ceil)
+        finally:
+            column.release()
+
+        if len(ret) < points:
+            ret.extend([0] * (points - len(ret)))
+        return ret
+
+
+def open_stats_file(path, names, capacity):
+    """
+    Open or create the stats file at path. Returns None on error, the
+    on disk history is optional
+    """
+    try:
+        os.makedirs(os.path.dirname(path), 0o755, exist_ok=True)
+        return StatsFile(path, names, capacity)
+    except Exception as e:  # pragma: no cover
+        log.debug("Error opening stats file %s: %s", path, e)
+        return None
@@ -0,0 +1,210 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import collections
+import threading
+import time
+
+
+(PRIO_HIGH,
+ PRIO_LOW) = range(1, 3)
+
+
+class _TickRequest(object):
+    """
+    A single requested tick for a connection
+    """
+    __slots__ = ["prio", "kwargs", "deadline"]
+
+    def __init__(self, prio, kwargs, deadline):
+        self.prio = prio
+        self.kwargs = kwargs
+        self.deadline = deadline
+
+    def is_stale(self, now):
+        return (self.prio == PRIO_LOW and
+                self.deadline is not None and
+                now > self.deadline)
+
+    def merge(self, prio, kwargs, deadline):
+        """
+        Fold another tick request into this one. Poll flags are OR-ed
+        together, and the higher priority wins.
+        """
+        for key, value in kwargs.items():
+            if isinstance(value, bool):
+                value = bool(self.kwargs.get(key)) or value
+            self.kwargs[key] = value
+
+        if prio < self.prio:
+            self.prio = prio
+        if self.prio == PRIO_HIGH:
+            self.deadline = None
+        elif deadline is not None:
+            self.deadline = max(self.deadline or 0, deadline)
+
+
+class _ConnTickState(object):
+    """
+    The pending tick request for a single connection. A connection is
+    only ever ticked by one worker at a time, and all requests that
+    arrive while it waits are merged into a single pending tick.
+    """
+    __slots__ = ["conn", "pending", "running"]
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.pending = None
+        self.running = False
+
+    def pop_next(self):
+        req = self.pending
+        self.pending = None
+        return req
+
+
+class vmmTickScheduler(object):
+    """
+    Runs connection ticks on a bounded pool of worker threads.
+
+    Each connection has its own queue of pending ticks and is only
+    ticked by one worker at a time. Connections with pending work are
+    serviced round robin, so one slow connection only ever occupies
+    a single worker and can't starve the others.
+
+    Requests for a connection that is already waiting for a tick are
+    coalesced into the pending one, so an event storm turns into a
+    single libvirt poll. Low priority ticks are the periodic timer
+    ticks: one that misses its deadline is dropped, since the next timer
+    tick will replace it anyways.
+    """
+    def __init__(self, tick_cb, max_workers):
+        self._tick_cb = tick_cb
+        self._max_workers = max_workers
+        self._workers = []
+
+        self._cond = threading.Condition(threading.Lock())
+        self._states = {}
+        self._ready = collections.deque()
+        self._stopping = False
+
+        self.coalesced_count = 0
+        self.expired_count = 0
+        self._coalesced_per_uri = collections.Counter()
+
+    def start(self):
+        for idx in range(self._max_workers):
+            t = threading.Thread(name="Tick worker %d" % (idx + 1),
+                                 target=self._worker_loop, args=())
+            t.daemon = True
+            t.start()
+            self._workers.append(t)
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._states = {}
+            self._ready.clear()
+            self._cond.notify_all()
+
+
+    ##################
+    # Queue handling #
+    ##################
+
+    def _get_state(self, conn):
+        state = self._states.get(conn)
+        if state is None:
+            state = _ConnTickState(conn)
+            self._states[conn] = state
+        return state
+
+    def _mark_ready(self, state):
+        if state.running or not state.pending:
+            return
+        if state in self._ready:
+            return
+        self._ready.append(state)
+        self._cond.notify()
+
+    def add(self, conn, isprio, kwargs, deadline=None):
+        """
+        Queue a tick for the passed connection
+
+        :param isprio: If True, queue a high priority tick. These are
+            never dropped
+        :param deadline: time.monotonic() value after which a low
+            priority tick is considered stale and is dropped
+        """
+        prio = isprio and PRIO_HIGH or PRIO_LOW
+        with self._cond:
+            if self._stopping:
+                return  # pragma: no cover
+
+            state = self._get_state(conn)
+            if state.pending:
+                state.pending.merge(prio, kwargs, deadline)
+                self.coalesced_count += 1
+                self._coalesced_per_uri[conn.get_uri()] += 1
+                return
+
+            state.pending = _TickRequest(prio, dict(kwargs), deadline)
+            self._mark_ready(state)
+
+    def get_coalesced_counts(self):
+        """
+        Return a dict of uri -> number of tick requests that were
+        merged into an already pending tick
+        """
+        with self._cond:
+            return dict(self._coalesced_per_uri)
+
+    def _next_request(self):
+        """
+        Block until a connection has pending work, and return its
+        state and the request to run
+        """
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None, None
+                if not self._ready:
+                    self._cond.wait()
+                    continue
+
+                state = self._ready.popleft()
+                req = state.pop_next()
+                if req.is_stale(time.monotonic()):
+                    self.expired_count += 1
+                    self._finish(state)
+                    continue
+
+                state.running = True
+                return state, req
+
+    def _finish(self, state):
+        """
+        Called with the lock held after a connection tick completed
+        """
+        state.running = False
+        if state.pending:
+            # Back of the line, so other connections get a turn
+            self._mark_ready(state)
+        elif self._states.get(state.conn) is state:
+            # Drop idle state so we don't hold a connection reference
+            del self._states[state.conn]
+
+    def _worker_loop(self):
+        while True:
+            state, req = self._next_request()
+            if state is None:
+                return
+
+            try:
+                self._tick_cb(state.conn, req.kwargs)
+            finally:
+                with self._cond:
+                    self._finish(state)
+                # Need to clear reference to make leak check happy
+                state = None
+                req = None
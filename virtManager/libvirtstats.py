@@ -0,0 +1,159 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+from gi.repository import Gtk
+
+from virtinst import log
+
+from .lib import module_trace
+from .baseclass import vmmGObjectUI
+from .object.libvirtobject import vmmLibvirtObject
+
+
+(_COL_NAME,
+ _COL_COUNT,
+ _COL_MAIN,
+ _COL_WORKER,
+ _COL_AVG,
+ _COL_MAX,
+ _COL_TOTAL,
+ _COL_HISTOGRAM) = range(8)
+
+
+class vmmLibvirtStats(vmmGObjectUI):
+    """
+    Debug dialog listing per-API libvirt call counts and latencies
+    for a single connection, as collected by module_trace
+    """
+    @classmethod
+    def show_instance(cls, parentobj, conn):
+        try:
+            uri = conn.get_uri()
+            if cls._instances is None:
+                cls._instances = {}
+            if uri not in cls._instances:
+                cls._instances[uri] = vmmLibvirtStats(conn)
+            cls._instances[uri].show(parentobj.topwin)
+        except Exception as e:  # pragma: no cover
+            parentobj.err.show_err(
+                    _("Error launching libvirt stats dialog: %s") % str(e))
+
+    def __init__(self, conn):
+        vmmGObjectUI.__init__(self, "libvirtstats.ui", "vmm-libvirt-stats")
+        self.conn = conn
+
+        self.builder.connect_signals({
+            "on_vmm_libvirt_stats_delete_event": self.close,
+            "on_stats_close_clicked": self.close,
+            "on_stats_refresh_clicked": self._refresh_cb,
+            "on_stats_reset_clicked": self._reset_cb,
+            "on_stats_collect_clicked": self._collect_cb,
+        })
+
+        self._init_ui()
+        self._cleanup_on_conn_removed()
+
+    def _init_ui(self):
+        model = Gtk.ListStore(str, int, int, int, float, float, float, str)
+        statslist = self.widget("stats-list")
+        statslist.set_model(model)
+
+        def _add_col(label, idx, fmt=None):
+            col = Gtk.TreeViewColumn(label)
+            txt = Gtk.CellRendererText()
+            col.pack_start(txt, True)
+            col.set_sort_column_id(idx)
+            if fmt:
+                def _data_func(_col, cell, _model, _iter, data):
+                    cell.set_property("text", fmt % _model[_iter][data])
+                col.set_cell_data_func(txt, _data_func, idx)
+            else:
+                col.add_attribute(txt, "text", idx)
+            statslist.append_column(col)
+
+        _add_col(_("API"), _COL_NAME)
+        _add_col(_("Calls"), _COL_COUNT)
+        _add_col(_("Main thread"), _COL_MAIN)
+        _add_col(_("Workers"), _COL_WORKER)
+        _add_col(_("Avg ms"), _COL_AVG, "%.2f")
+        _add_col(_("Max ms"), _COL_MAX, "%.2f")
+        _add_col(_("Total ms"), _COL_TOTAL, "%.1f")
+        _add_col(_("Histogram (ms: calls)"), _COL_HISTOGRAM)
+        model.set_sort_column_id(_COL_TOTAL, Gtk.SortType.DESCENDING)
+
+    def show(self, parent):
+        log.debug("Showing libvirt stats for %s", self.conn)
+        self._refresh()
+        self.topwin.set_transient_for(parent)
+        self.topwin.present()
+
+    def close(self, ignore1=None, ignore2=None):
+        log.debug("Closing libvirt stats for %s", self.conn)
+        self.topwin.hide()
+        return 1
+
+    def _cleanup(self):
+        self.conn = None
+
+
+    ###########
+    # Helpers #
+    ###########
+
+    def _refresh(self):
+        apis = module_trace.get_stats().get(self.conn.get_uri(), {})
+        model = self.widget("stats-list").get_model()
+        model.clear()
+
+        calls = 0
+        maincalls = 0
+        total = 0.0
+        for name, stats in apis.items():
+            histogram = ", ".join(
+                    "%s: %d" % (bound, count) for bound, count in
+                    stats["histogram_ms"].items() if count)
+            model.append([name, stats["count"], stats["main_thread"],
+                          stats["worker_threads"], stats["avg_ms"],
+                          stats["max_ms"], stats["total_ms"], histogram])
+            calls += stats["count"]
+            maincalls += stats["main_thread"]
+            total += stats["total_ms"]
+
+        collecting = module_trace.STATS is not None
+        self.widget("stats-collect").set_visible(not collecting)
+        self.widget("stats-reset").set_sensitive(collecting)
+        if not collecting:
+            summary = _("Libvirt API statistics are not being collected.")
+        else:
+            summary = (_("%(calls)d calls, %(maincalls)d from the main "
+                         "thread, %(total).1f ms total") %
+                       {"calls": calls, "maincalls": maincalls,
+                        "total": total})
+
+        parses = vmmLibvirtObject.get_parse_counts()
+        if parses:
+            summary += "\n" + _("XML refreshes (reused/parsed): %s") % (
+                    ", ".join("%s %d/%d" % (name, hits, misses) for
+                              name, (hits, misses) in sorted(parses.items())))
+        self.widget("stats-summary").set_text(summary)
+
+
+    #############
+    # Listeners #
+    #############
+
+    def _refresh_cb(self, src):
+        ignore = src
+        self._refresh()
+
+    def _collect_cb(self, src):
+        ignore = src
+        import libvirt
+        log.debug("Starting libvirt API stats collection")
+        module_trace.enable_stats(libvirt)
+        self._refresh()
+
+    def _reset_cb(self, src):
+        ignore = src
+        module_trace.reset_stats(self.conn.get_uri())
+        self._refresh()
@@ -33,7 +33,13 @@ ROW_IS_CONN_CONNECTED,
 ROW_IS_VM,
 ROW_IS_VM_RUNNING,
 ROW_COLOR,
-ROW_INSPECTION_OS_ICON) = range(11)
+ROW_INSPECTION_OS_ICON,
+ROW_SORT_NAME,
+ROW_SORT_GUEST_CPU,
+ROW_SORT_HOST_CPU,
+ROW_SORT_MEM,
+ROW_SORT_DISK,
+ROW_SORT_NETWORK) = range(17)
 
 # Columns in the tree view
 (COL_NAME,
@@ -43,6 +49,16 @@ COL_MEM,
 COL_DISK,
 COL_NETWORK) = range(6)
 
+# Hidden model column holding the sort key of each tree view column
+_SORT_COLUMNS = {
+    COL_NAME: ROW_SORT_NAME,
+    COL_GUEST_CPU: ROW_SORT_GUEST_CPU,
+    COL_HOST_CPU: ROW_SORT_HOST_CPU,
+    COL_MEM: ROW_SORT_MEM,
+    COL_DISK: ROW_SORT_DISK,
+    COL_NETWORK: ROW_SORT_NETWORK,
+}
+
 
 def _style_get_prop(widget, propname):
     value = GObject.Value()
@@ -51,10 +67,6 @@ def _style_get_prop(widget, propname):
     return value.get_int()
 
 
-def _cmp(a, b):
-    return ((a > b) - (a < b))
-
-
 def _get_inspection_icon_pixbuf(vm, w, h):
     # libguestfs gives us the PNG data as a string.
     png_data = vm.inspection.icon
@@ -154,10 +166,33 @@ class vmmManager(vmmGObjectUI):
         self.update_current_selection()
         self.widget("vm-list").get_selection().connect(
             "changed", self.update_current_selection)
+        self.widget("vm-list").get_selection().connect(
+            "changed", self._queue_visible_update)
 
         self.max_disk_rate = 10.0
         self.max_net_rate = 10.0
 
+        # Row updates are collected here and applied in one batch per
+        # stats tick. Maps handle -> True if the row cells need to be
+        # rebuilt, False if only the graphs need a redraw
+        self._dirty_rows = {}
+        self._flush_queued = False
+        # handle -> Gtk.TreeRowReference, to avoid walking the model
+        self._row_refs = {}
+
+        # Only VMs with visible rows need full stats polling
+        self._visible_queued = False
+        vmlist = self.widget("vm-list")
+        vmlist.connect("row-expanded", self._queue_visible_update)
+        vmlist.connect("row-collapsed", self._queue_visible_update)
+        vmlist.get_vadjustment().connect("value-changed",
+                                         self._queue_visible_update)
+        vmlist.get_vadjustment().connect("changed",
+                                         self._queue_visible_update)
+        self.model.connect("rows-reordered", self._queue_visible_update)
+        self.model.connect("sort-column-changed",
+                           self._queue_visible_update)
+
         # Initialize stat polling columns based on global polling
         # preferences (we want signal handlers for this)
         self._config_polling_change_cb(COL_GUEST_CPU)
@@ -188,6 +223,7 @@ class vmmManager(vmmGObjectUI):
             self.prev_position = None
 
         vmmEngine.get_instance().increment_window_counter()
+        self._queue_visible_update()
 
     def close(self, src_ignore=None, src2_ignore=None):
         if not self.is_visible():
@@ -196,6 +232,7 @@ class vmmManager(vmmGObjectUI):
         log.debug("Closing manager")
         self.prev_position = self.topwin.get_position()
         self.topwin.hide()
+        self._queue_visible_update()
         vmmEngine.get_instance().decrement_window_counter()
 
         return 1
@@ -215,6 +252,8 @@ class vmmManager(vmmGObjectUI):
         self.connmenu.destroy()
         self.connmenu = None
         self.connmenu_items = None
+        self._dirty_rows = {}
+        self._row_refs = {}
 
         if self._window_size:
             self.config.set_manager_window_size(*self._window_size)
@@ -318,6 +357,12 @@ class vmmManager(vmmGObjectUI):
         rowtypes.insert(ROW_IS_VM_RUNNING, bool)  # if VM is running
         rowtypes.insert(ROW_COLOR, str)  # row markup color string
         rowtypes.insert(ROW_INSPECTION_OS_ICON, GdkPixbuf.Pixbuf)  # OS icon
+        rowtypes.insert(ROW_SORT_NAME, str)  # lowercase name sort key
+        rowtypes.insert(ROW_SORT_GUEST_CPU, float)  # stats sort keys
+        rowtypes.insert(ROW_SORT_HOST_CPU, float)
+        rowtypes.insert(ROW_SORT_MEM, float)
+        rowtypes.insert(ROW_SORT_DISK, float)
+        rowtypes.insert(ROW_SORT_NETWORK, float)
 
         model = Gtk.TreeStore(*rowtypes)
         vmlist.set_model(model)
@@ -330,7 +375,7 @@ class vmmManager(vmmGObjectUI):
         nameCol.set_expand(True)
         nameCol.set_sizing(Gtk.TreeViewColumnSizing.AUTOSIZE)
         nameCol.set_spacing(6)
-        nameCol.set_sort_column_id(COL_NAME)
+        nameCol.set_sort_column_id(_SORT_COLUMNS[COL_NAME])
 
         vmlist.append_column(nameCol)
 
@@ -372,7 +417,7 @@ class vmmManager(vmmGObjectUI):
             col.pack_start(img, True)
             col.add_attribute(img, 'visible', ROW_IS_VM)
 
-            col.set_sort_column_id(colnum)
+            col.set_sort_column_id(_SORT_COLUMNS[colnum])
             vmlist.append_column(col)
             return col
 
@@ -382,13 +427,10 @@ class vmmManager(vmmGObjectUI):
         self.diskcol = make_stats_column(_("Disk I/O"), COL_DISK)
         self.netcol = make_stats_column(_("Network I/O"), COL_NETWORK)
 
-        model.set_sort_func(COL_NAME, self.vmlist_name_sorter)
-        model.set_sort_func(COL_GUEST_CPU, self.vmlist_guest_cpu_usage_sorter)
-        model.set_sort_func(COL_HOST_CPU, self.vmlist_host_cpu_usage_sorter)
-        model.set_sort_func(COL_MEM, self.vmlist_memory_usage_sorter)
-        model.set_sort_func(COL_DISK, self.vmlist_disk_io_sorter)
-        model.set_sort_func(COL_NETWORK, self.vmlist_network_usage_sorter)
-        model.set_sort_column_id(COL_NAME, Gtk.SortType.ASCENDING)
+        # Sorting uses GTK's native comparison of the hidden sort key
+        # columns, which are updated once per stats sample
+        model.set_sort_column_id(_SORT_COLUMNS[COL_NAME],
+                                 Gtk.SortType.ASCENDING)
 
 
     ##################
@@ -419,6 +461,12 @@ class vmmManager(vmmGObjectUI):
         return handle.conn
 
     def get_row(self, conn_or_vm):
+        ref = self._row_refs.get(conn_or_vm)
+        if ref and ref.valid():
+            row = self.model[ref.get_path()]
+            if row[ROW_HANDLE] == conn_or_vm:
+                return row
+
         def _walk(model, rowiter, obj):
             while rowiter:
                 row = model[rowiter]
@@ -432,7 +480,14 @@ class vmmManager(vmmGObjectUI):
 
         if not len(self.model):
             return None
-        return _walk(self.model, self.model.get_iter_first(), conn_or_vm)
+        row = _walk(self.model, self.model.get_iter_first(), conn_or_vm)
+        if row:
+            self._add_row_ref(conn_or_vm, row)
+        return row
+
+    def _add_row_ref(self, handle, row):
+        self._row_refs[handle] = Gtk.TreeRowReference.new(
+                self.model, row.path)
 
 
     ####################
@@ -552,7 +607,9 @@ class vmmManager(vmmGObjectUI):
     def vm_added(self, conn, vm):
         vm_row = self._build_row(None, vm)
         conn_row = self.get_row(conn)
-        self.model.append(conn_row.iter, vm_row)
+        rowiter = self.model.append(conn_row.iter, vm_row)
+        self._add_row_ref(vm, self.model[rowiter])
+        self._queue_visible_update()
 
         vm.connect("state-changed", self.vm_changed)
         vm.connect("resources-sampled", self.vm_row_updated)
@@ -568,6 +625,8 @@ class vmmManager(vmmGObjectUI):
             if self.model[rowiter][ROW_HANDLE] == vm:
                 self.model.remove(rowiter)
                 break
+        self._row_refs.pop(vm, None)
+        self._dirty_rows.pop(vm, None)
 
     def _build_conn_hint(self, conn):
         hint = conn.get_uri()
@@ -630,6 +689,10 @@ class vmmManager(vmmGObjectUI):
         row.insert(ROW_IS_VM_RUNNING, bool(vm) and vm.is_active())
         row.insert(ROW_COLOR, color)
         row.insert(ROW_INSPECTION_OS_ICON, os_icon)
+        row.insert(ROW_SORT_NAME, name.lower())
+        sortvals = self._build_sort_values(conn or vm)
+        for col in sorted(sortvals):
+            row.insert(col, sortvals[col])
 
         return row
 
@@ -640,7 +703,9 @@ class vmmManager(vmmGObjectUI):
             return  # pragma: no cover
 
         conn_row = self._build_row(conn, None)
-        self.model.append(None, conn_row)
+        rowiter = self.model.append(None, conn_row)
+        self._add_row_ref(conn, self.model[rowiter])
+        self._queue_visible_update()
 
         conn.connect("vm-added", self.vm_added)
         conn.connect("vm-removed", self.vm_removed)
@@ -655,6 +720,9 @@ class vmmManager(vmmGObjectUI):
         while child is not None:  # pragma: no cover
             # vm-removed signals should handle this, this is a fallback
             # in case something goes wrong
+            handle = self.model[child][ROW_HANDLE]
+            self._row_refs.pop(handle, None)
+            self._dirty_rows.pop(handle, None)
             self.model.remove(child)
             child = self.model.iter_children(row.iter)
 
@@ -668,6 +736,8 @@ class vmmManager(vmmGObjectUI):
             return
 
         self._remove_child_rows(conn_row)
+        self._row_refs.pop(conn_row[ROW_HANDLE], None)
+        self._dirty_rows.pop(conn_row[ROW_HANDLE], None)
         self.model.remove(conn_row.iter)
 
 
@@ -675,37 +745,180 @@ class vmmManager(vmmGObjectUI):
     # State/UI updating methods #
     #############################
 
-    def vm_row_updated(self, vm):
-        row = self.get_row(vm)
-        if row is None:  # pragma: no cover
-            return
-        self.model.row_changed(row.path, row.iter)
+    def _queue_row_update(self, obj, rebuild):
+        """
+        Mark the row of obj dirty. All dirty rows are applied together
+        from a single idle callback, so the per VM signals of a stats
+        tick only cost one batch of model updates
+        """
+        self._dirty_rows[obj] = self._dirty_rows.get(obj, False) or rebuild
+        if not self._flush_queued:
+            self._flush_queued = True
+            self.idle_add(self._flush_row_updates)
+
+    def _build_vm_row_values(self, vm):
+        name = vm.get_name_or_title()
+        status = vm.run_status()
+        return {
+            ROW_SORT_KEY: name,
+            ROW_STATUS_ICON: vm.run_status_icon_name(),
+            ROW_IS_VM_RUNNING: vm.is_active(),
+            ROW_MARKUP: self._build_vm_markup(name, status),
+            ROW_HINT: xmlutil.xml_escape(vm.get_description()),
+            ROW_SORT_NAME: name.lower(),
+        }
 
-    def vm_changed(self, vm):
-        row = self.get_row(vm)
-        if row is None:
-            return  # pragma: no cover
+    def _build_sort_values(self, obj):
+        return {
+            ROW_SORT_GUEST_CPU: float(obj.guest_cpu_time_percentage()),
+            ROW_SORT_HOST_CPU: float(obj.host_cpu_time_percentage()),
+            ROW_SORT_MEM: float(obj.stats_memory()),
+            ROW_SORT_DISK: float(obj.disk_io_rate()),
+            ROW_SORT_NETWORK: float(obj.network_traffic_rate()),
+        }
+
+    def _graphs_visible(self):
+        return any([c.get_visible() for c in
+            [self.netcol, self.diskcol, self.memcol,
+             self.guestcpucol, self.hostcpucol]])
+
+    def _flush_row_updates(self):
+        self._flush_queued = False
+        dirty = self._dirty_rows
+        self._dirty_rows = {}
+        if not dirty:
+            return False
 
+        changes = []
+        redraw = []
+        for obj, rebuild in dirty.items():
+            row = self.get_row(obj)
+            if row is None:
+                continue  # pragma: no cover
+
+            newvals = self._build_sort_values(obj)
+            if rebuild:
+                try:
+                    newvals.update(self._build_vm_row_values(obj))
+                except Exception as e:  # pragma: no cover
+                    if obj.conn.support.is_libvirt_error_no_domain(e):
+                        continue
+                    raise
+            newvals = dict((col, val) for col, val in newvals.items()
+                           if row[col] != val)
+
+            if newvals:
+                changes.append((row.iter, newvals))
+            else:
+                redraw.append(row)
+
+        # Every set() of the sort column re-sorts the row, so with more
+        # than one such row it's cheaper to sort once afterwards
+        model = self.model
+        sortid, order = model.get_sort_column_id()
+        suspend = (sortid is not None and
+                   len([1 for dummy, newvals in changes
+                        if sortid in newvals]) > 1)
+        if suspend:
+            model.set_sort_column_id(
+                    Gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID, order)
         try:
-            if vm == self.current_vm():
-                self.update_current_selection()
+            for rowiter, newvals in changes:
+                model.set(rowiter, newvals)
+        finally:
+            if suspend:
+                model.set_sort_column_id(sortid, order)
 
-            name = vm.get_name_or_title()
-            status = vm.run_status()
+        # Rows with only a new stats sample just need their graphs
+        # redrawn, set() already emitted row-changed for the others
+        if self._graphs_visible():
+            for row in redraw:
+                model.row_changed(row.path, row.iter)
 
-            row[ROW_SORT_KEY] = name
-            row[ROW_STATUS_ICON] = vm.run_status_icon_name()
-            row[ROW_IS_VM_RUNNING] = vm.is_active()
-            row[ROW_MARKUP] = self._build_vm_markup(name, status)
+        vm = self.current_vm()
+        if vm and dirty.get(vm):
+            self.update_current_selection()
+        return False
 
-            desc = vm.get_description()
-            row[ROW_HINT] = xmlutil.xml_escape(desc)
-        except Exception as e:  # pragma: no cover
-            if vm.conn.support.is_libvirt_error_no_domain(e):
-                return
-            raise
+    def vm_row_updated(self, vm):
+        self._queue_row_update(vm, False)
 
-        self.vm_row_updated(vm)
+    def _get_visible_vms(self):
+        vmlist = self.widget("vm-list")
+        visrange = self.is_visible() and vmlist.get_visible_range()
+        if not visrange:
+            return []
+
+        model = self.model
+        first = visrange[0].get_indices()
+        last = visrange[1].get_indices()
+        ret = []
+        for connidx in range(first[0], last[0] + 1):
+            conniter = model.iter_nth_child(None, connidx)
+            if (conniter is None or
+                not vmlist.row_expanded(model.get_path(conniter))):
+                continue
+
+            startidx = 0
+            if connidx == first[0] and len(first) > 1:
+                startidx = first[1]
+            endidx = model.iter_n_children(conniter) - 1
+            if connidx == last[0] and len(last) > 1:
+                endidx = min(endidx, last[1])
+            elif connidx == last[0]:
+                endidx = -1
+
+            for idx in range(startidx, endidx + 1):
+                rowiter = model.iter_nth_child(conniter, idx)
+                ret.append(model[rowiter][ROW_HANDLE])
+        return ret
+
+    def _queue_visible_update(self, *args):
+        ignore = args
+        if not self._visible_queued:
+            self._visible_queued = True
+            self.idle_add(self._update_visible_vms)
+
+    def _sorted_by_stats(self):
+        sortid = self.model.get_sort_column_id()[0]
+        return sortid in [_SORT_COLUMNS[col] for col in _SORT_COLUMNS
+                          if col != COL_NAME]
+
+    def _update_visible_vms(self):
+        """
+        Tell every connection's stats manager which of its VMs have
+        visible rows, so hidden VMs only get cheap state polling.
+        Visible and selected VMs are also initialized first when the
+        connection is repopulated, like after a reconnect.
+        """
+        self._visible_queued = False
+        if not self.topwin:
+            return False  # pragma: no cover
+
+        # Sorting by a stats column needs fresh stats of every VM,
+        # hidden rows included, or they'd be sorted by a stale sample
+        watchall = self._sorted_by_stats()
+        visible = {}
+        for vm in self._get_visible_vms():
+            visible.setdefault(vm.conn, []).append(vm)
+        selected = self.is_visible() and self.current_vm()
+        for row in self.model:
+            conn = row[ROW_HANDLE]
+            vms = visible.get(conn, [])
+            prio = [vm.get_uuid() for vm in vms]
+            if selected and selected.conn == conn:
+                prio.append(selected.get_uuid())
+            if conn.is_active():
+                # Keep the last set across a disconnect, so a reconnect
+                # initializes the rows the user was looking at first
+                conn.prioritize_init(prio, owner=self)
+            if conn.statsmanager:
+                conn.statsmanager.set_watched_vms(self,
+                        None if watchall else vms)
+        return False
+
+    def vm_changed(self, vm):
+        self._queue_row_update(vm, True)
 
     def vm_inspection_changed(self, vm):
         row = self.get_row(vm)
@@ -715,8 +928,6 @@ class vmmManager(vmmGObjectUI):
         new_icon = _get_inspection_icon_pixbuf(vm, 16, 16)
         row[ROW_INSPECTION_OS_ICON] = new_icon
 
-        self.vm_row_updated(vm)
-
     def set_initial_selection(self, uri):
         """
         Select the passed URI in the UI. Called from engine.py via
@@ -735,6 +946,7 @@ class vmmManager(vmmGObjectUI):
     def conn_state_changed(self, conn):
         row = self.get_row(conn)
         row[ROW_SORT_KEY] = conn.get_pretty_desc()
+        row[ROW_SORT_NAME] = row[ROW_SORT_KEY].lower()
         row[ROW_MARKUP] = self._build_conn_markup(conn, row[ROW_SORT_KEY])
         row[ROW_IS_CONN_CONNECTED] = not conn.is_disconnected()
         row[ROW_COLOR] = self._build_conn_color(conn)
@@ -747,13 +959,11 @@ class vmmManager(vmmGObjectUI):
         self.update_current_selection()
 
     def conn_row_updated(self, conn):
-        row = self.get_row(conn)
-
         self.max_disk_rate = max(self.max_disk_rate, conn.disk_io_max_rate())
         self.max_net_rate = max(self.max_net_rate,
                                 conn.network_traffic_max_rate())
 
-        self.model.row_changed(row.path, row.iter)
+        self._queue_row_update(conn, False)
 
     def change_run_text(self, can_restore):
         if can_restore:
@@ -848,44 +1058,6 @@ class vmmManager(vmmGObjectUI):
     # Stats methods #
     #################
 
-    def vmlist_name_sorter(self, model, iter1, iter2, ignore):
-        key1 = str(model[iter1][ROW_SORT_KEY]).lower()
-        key2 = str(model[iter2][ROW_SORT_KEY]).lower()
-        return _cmp(key1, key2)
-
-    def vmlist_guest_cpu_usage_sorter(self, model, iter1, iter2, ignore):
-        obj1 = model[iter1][ROW_HANDLE]
-        obj2 = model[iter2][ROW_HANDLE]
-
-        return _cmp(obj1.guest_cpu_time_percentage(),
-                   obj2.guest_cpu_time_percentage())
-
-    def vmlist_host_cpu_usage_sorter(self, model, iter1, iter2, ignore):
-        obj1 = model[iter1][ROW_HANDLE]
-        obj2 = model[iter2][ROW_HANDLE]
-
-        return _cmp(obj1.host_cpu_time_percentage(),
-                   obj2.host_cpu_time_percentage())
-
-    def vmlist_memory_usage_sorter(self, model, iter1, iter2, ignore):
-        obj1 = model[iter1][ROW_HANDLE]
-        obj2 = model[iter2][ROW_HANDLE]
-
-        return _cmp(obj1.stats_memory(),
-                   obj2.stats_memory())
-
-    def vmlist_disk_io_sorter(self, model, iter1, iter2, ignore):
-        obj1 = model[iter1][ROW_HANDLE]
-        obj2 = model[iter2][ROW_HANDLE]
-
-        return _cmp(obj1.disk_io_rate(), obj2.disk_io_rate())
-
-    def vmlist_network_usage_sorter(self, model, iter1, iter2, ignore):
-        obj1 = model[iter1][ROW_HANDLE]
-        obj2 = model[iter2][ROW_HANDLE]
-
-        return _cmp(obj1.network_traffic_rate(), obj2.network_traffic_rate())
-
     def _config_polling_change_cb(self, column):
         # pylint: disable=redefined-variable-type
         if column == COL_GUEST_CPU:
@@ -924,10 +1096,7 @@ class vmmManager(vmmGObjectUI):
         col.set_visible(do_show)
         self.widget(menu).set_active(do_show)
 
-        any_visible = any([c.get_visible() for c in
-            [self.netcol, self.diskcol, self.memcol,
-             self.guestcpucol, self.hostcpucol]])
-        self.spacer_txt.set_property("visible", not any_visible)
+        self.spacer_txt.set_property("visible", not self._graphs_visible())
 
     def toggle_network_traffic_visible_widget(self):
         self._toggle_graph_helper(
@@ -972,44 +1141,55 @@ class vmmManager(vmmGObjectUI):
     def toggle_stats_visible_network(self, src):
         self.toggle_stats_visible(src, COL_NETWORK)
 
+    def _set_graph_data(self, cell, obj, ceil, get_data):
+        # The renderer caches the drawn graph per VM until a new stats
+        # sample arrives, so only build the data if it has to redraw
+        cache_key = (obj, (obj.stats_version(), ceil))
+        cell.set_property("cache_key", cache_key)
+        if not cell.is_cached(cache_key):
+            cell.set_property("data_array", get_data())
+
     def guest_cpu_usage_img(self, column_ignore, cell, model, _iter, data):
         obj = model[_iter][ROW_HANDLE]
         if obj is None or not hasattr(obj, "conn"):
             return
 
-        data = obj.guest_cpu_time_vector(GRAPH_LEN)
-        cell.set_property('data_array', data)
+        self._set_graph_data(cell, obj, None,
+                lambda: obj.guest_cpu_time_vector(GRAPH_LEN))
 
     def host_cpu_usage_img(self, column_ignore, cell, model, _iter, data):
         obj = model[_iter][ROW_HANDLE]
         if obj is None or not hasattr(obj, "conn"):
             return
 
-        data = obj.host_cpu_time_vector(GRAPH_LEN)
-        cell.set_property('data_array', data)
+        self._set_graph_data(cell, obj, None,
+                lambda: obj.host_cpu_time_vector(GRAPH_LEN))
 
     def memory_usage_img(self, column_ignore, cell, model, _iter, data):
         obj = model[_iter][ROW_HANDLE]
         if obj is None or not hasattr(obj, "conn"):
             return
 
-        data = obj.stats_memory_vector(GRAPH_LEN)
-        cell.set_property('data_array', data)
+        self._set_graph_data(cell, obj, None,
+                lambda: obj.stats_memory_vector(GRAPH_LEN))
 
     def disk_io_img(self, column_ignore, cell, model, _iter, data):
         obj = model[_iter][ROW_HANDLE]
         if obj is None or not hasattr(obj, "conn"):
             return
 
-        d1, d2 = obj.disk_io_vectors(GRAPH_LEN, self.max_disk_rate)
-        data = [(x + y) / 2 for x, y in zip(d1, d2)]
-        cell.set_property('data_array', data)
+        def _get_data():
+            d1, d2 = obj.disk_io_vectors(GRAPH_LEN, self.max_disk_rate)
+            return [(x + y) / 2 for x, y in zip(d1, d2)]
+        self._set_graph_data(cell, obj, self.max_disk_rate, _get_data)
 
     def network_traffic_img(self, column_ignore, cell, model, _iter, data):
         obj = model[_iter][ROW_HANDLE]
         if obj is None or not hasattr(obj, "conn"):
             return
 
-        d1, d2 = obj.network_traffic_vectors(GRAPH_LEN, self.max_net_rate)
-        data = [(x + y) / 2 for x, y in zip(d1, d2)]
-        cell.set_property('data_array', data)
+        def _get_data():
+            d1, d2 = obj.network_traffic_vectors(GRAPH_LEN,
+                                                 self.max_net_rate)
+            return [(x + y) / 2 for x, y in zip(d1, d2)]
+        self._set_graph_data(cell, obj, self.max_net_rate, _get_data)
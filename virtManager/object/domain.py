@@ -15,6 +15,7 @@ from virtinst import DeviceController
 from virtinst import DeviceDisk
 from virtinst import DomainSnapshot
 from virtinst import Guest
+from virtinst import GuestSummary
 from virtinst import log
 
 from .libvirtobject import vmmLibvirtObject
@@ -358,6 +359,7 @@ class vmmDomain(vmmLibvirtObject):
         self._autostart = None
         self._domain_caps = None
         self._status_reason = None
+        self._summary = None
         self._ipfetcher = _IPFetcher()
 
         self.managedsave_supported = False
@@ -384,8 +386,7 @@ class vmmDomain(vmmLibvirtObject):
          self._active_xml_flags) = self.conn.get_dom_flags(self._backend)
 
         # Prime caches
-        info = self._backend.info()
-        self._refresh_status(newstatus=info[0])
+        self._refresh_status_bulk(cansignal=True)
         self.has_managed_save()
         self.snapshots_supported()
 
@@ -462,7 +463,7 @@ class vmmDomain(vmmLibvirtObject):
 
         # Check if our disks are all qcow2
         seen_qcow2 = False
-        for disk in self.get_disk_devices_norefresh():
+        for disk in self.get_summary(refresh_if_nec=False).disks:
             if disk.read_only:
                 continue
             if disk.is_empty():
@@ -486,6 +487,25 @@ class vmmDomain(vmmLibvirtObject):
     # Internal XML handling API #
     #############################
 
+    def get_summary(self, refresh_if_nec=True):
+        """
+        Return a GuestSummary of the active XML. The list views only
+        need the summary values, so they don't trigger a full Guest
+        parse when the XML changes
+        """
+        return self._get_summary_for_xml(
+                self._get_xml_source(refresh_if_nec=refresh_if_nec))
+
+    def _get_summary_for_xml(self, xml):
+        if self._summary is None or self._summary.get_xml() is not xml:
+            self._summary = GuestSummary(self.conn.get_backend(), xml)
+        return self._summary
+
+    def _parse_xml_source(self, xml):
+        # Share the Guest with the summary, so callers of either see
+        # the same object
+        return self._get_summary_for_xml(xml).get_guest()
+
     def _invalidate_xml(self):
         vmmLibvirtObject._invalidate_xml(self)
         self._id = None
@@ -1225,13 +1245,13 @@ class vmmDomain(vmmLibvirtObject):
             self._uuid = self._backend.UUIDString()
         return self._uuid
     def get_abi_type(self):
-        return self.get_xmlobj().os.os_type
+        return self.get_summary().os_type
     def get_hv_type(self):
-        return self.get_xmlobj().type
+        return self.get_summary().type
     def get_pretty_hv_type(self):
         return self.conn.pretty_hv(self.get_abi_type(), self.get_hv_type())
     def get_arch(self):
-        return self.get_xmlobj().os.arch
+        return self.get_summary().arch
     def get_init(self):
         import pipes
         init = self.get_xmlobj().os.init
@@ -1242,7 +1262,7 @@ class vmmDomain(vmmLibvirtObject):
     def get_emulator(self):
         return self.get_xmlobj().emulator
     def get_machtype(self):
-        return self.get_xmlobj().os.machine
+        return self.get_summary().machine
 
     def get_name_or_title(self):
         title = self.get_title()
@@ -1251,9 +1271,9 @@ class vmmDomain(vmmLibvirtObject):
         return self.get_name()
 
     def get_title(self):
-        return self.get_xmlobj().title
+        return self.get_summary().title
     def get_description(self):
-        return self.get_xmlobj().description
+        return self.get_summary().description
 
     def get_boot_order(self):
         legacy = not self.can_use_device_boot_order()
@@ -1452,6 +1472,11 @@ class vmmDomain(vmmLibvirtObject):
 
     def _get_stats(self):
         return self.conn.statsmanager.get_vm_statslist(self)
+    def stats_version(self):
+        """
+        Counter that changes with every new stats sample
+        """
+        return self._get_stats().version
     def stats_memory(self):
         return self._get_stats().get_record("curmem")
     def cpu_time(self):
@@ -1480,22 +1505,55 @@ class vmmDomain(vmmLibvirtObject):
         stats = self._get_stats()
         return max(stats.diskRdMaxRate, stats.diskWrMaxRate, 10.0)
 
-    def host_cpu_time_vector(self, limit=None):
-        return self._get_stats().get_vector("cpuHostPercent", limit)
-    def guest_cpu_time_vector(self, limit=None):
-        return self._get_stats().get_vector("cpuGuestPercent", limit)
-    def stats_memory_vector(self, limit=None):
-        return self._get_stats().get_vector("currMemPercent", limit)
-    def network_traffic_vectors(self, limit=None, ceil=None):
+    def vcpu_usage_breakdown(self):
+        """
+        Return a list of (vCPU number, usage percent) for every vCPU.
+        Like the other per device breakdowns this is only filled
+        from bulk stats
+        """
+        return [(name, values[0]) for name, values in
+                self._get_stats().vcpu_stats.get_latest()]
+    def disk_io_breakdown(self):
+        """
+        Return a list of (disk target, read rate, write rate)
+        """
+        return [(name, values[0], values[1]) for name, values in
+                self._get_stats().disk_stats.get_latest()]
+    def network_traffic_breakdown(self):
+        """
+        Return a list of (interface target, rx rate, tx rate)
+        """
+        return [(name, values[0], values[1]) for name, values in
+                self._get_stats().net_stats.get_latest()]
+
+    def host_cpu_time_vector(self, limit=None, history=False, width=None):
+        return self._get_stats().get_vector("cpuHostPercent", limit,
+                                            history=history, width=width)
+    def guest_cpu_time_vector(self, limit=None, history=False, width=None):
+        return self._get_stats().get_vector("cpuGuestPercent", limit,
+                                            history=history, width=width)
+    def stats_memory_vector(self, limit=None, history=False, width=None):
+        return self._get_stats().get_vector("currMemPercent", limit,
+                                            history=history, width=width)
+    def guest_cpu_time_range_vectors(self, width=None):
+        return self._get_stats().get_range_vectors("cpuGuestPercent",
+                                                   width)
+    def stats_memory_range_vectors(self, width=None):
+        return self._get_stats().get_range_vectors("currMemPercent", width)
+    def network_traffic_vectors(self, limit=None, ceil=None,
+                                history=False, width=None):
         if ceil is None:
             ceil = self.network_traffic_max_rate()
         return self._get_stats().get_in_out_vector(
-                "netRxRate", "netTxRate", limit, ceil)
-    def disk_io_vectors(self, limit=None, ceil=None):
+                "netRxRate", "netTxRate", limit, ceil,
+                history=history, width=width)
+    def disk_io_vectors(self, limit=None, ceil=None,
+                        history=False, width=None):
         if ceil is None:
             ceil = self.disk_io_max_rate()
         return self._get_stats().get_in_out_vector(
-                "diskRdRate", "diskWrRate", limit, ceil)
+                "diskRdRate", "diskWrRate", limit, ceil,
+                history=history, width=width)
 
 
     ###################
@@ -1616,6 +1674,33 @@ class vmmDomain(vmmLibvirtObject):
     # Polling helpers #
     ###################
 
+    def _refresh_status_bulk(self, cansignal):
+        """
+        Refresh status from the connection's last getAllDomainStats
+        call, which saves an info() call per domain. Falls back to
+        info() if bulk stats aren't available.
+        """
+        state = self.conn.statsmanager.get_vm_state(self)
+        if state is None:
+            info = self._backend.info()
+            return self._refresh_status(newstatus=info[0],
+                                        cansignal=cansignal)
+
+        status, reason = state
+        ret = self._refresh_status(newstatus=status, cansignal=cansignal)
+        # Set these after _refresh_status, since an XML refresh
+        # invalidates them
+        self._status_reason = reason
+        if (status == libvirt.VIR_DOMAIN_SHUTOFF and
+            reason == libvirt.VIR_DOMAIN_SHUTOFF_SAVED):
+            # libvirt reports this reason for a plain save to a file
+            # too, and managed saved domains report UNKNOWN after a
+            # daemon restart, so the reason can't tell us whether there
+            # is a managed save image. Just make has_managed_save()
+            # query it again
+            self._has_managed_save = None
+        return ret
+
     def tick(self, stats_update=True):
         if (not self._using_events() and
             not stats_update):
@@ -1627,8 +1712,7 @@ class vmmDomain(vmmLibvirtObject):
             # the latest XML, but other objects probably don't want to do
             # this since it could be a performance hit.
             self._invalidate_xml()
-            info = self._backend.info()
-            dosignal = self._refresh_status(newstatus=info[0], cansignal=False)
+            dosignal = self._refresh_status_bulk(cansignal=False)
 
         if stats_update:
             self.conn.statsmanager.refresh_vm_stats(self)
@@ -10,15 +10,28 @@ from virtinst import xmlutil
 from ..baseclass import vmmGObject
 
 
+# class name -> [reused XML, full parses] of active XML refreshes
+_PARSE_COUNTS = {}
+
+
 class vmmLibvirtObject(vmmGObject):
     __gsignals__ = {
         "state-changed": (vmmGObject.RUN_FIRST, None, []),
-        "initialized": (vmmGObject.RUN_FIRST, None, [bool]),
     }
 
     _STATUS_ACTIVE = 1
     _STATUS_INACTIVE = 2
 
+    @staticmethod
+    def get_parse_counts():
+        """
+        Return a dict of class name -> (hits, misses) of XML refreshes,
+        where a hit returned unchanged XML, and a miss is a full parse
+        of changed XML
+        """
+        return dict((name, tuple(counts)) for name, counts in
+                    _PARSE_COUNTS.items())
+
     def __init__(self, conn, backend, name, parseclass):
         vmmGObject.__init__(self)
         self._conn = conn
@@ -32,6 +45,8 @@ class vmmLibvirtObject(vmmGObject):
         self._xmlobj = None
         self._xmlobj_to_define = None
         self._is_xml_valid = False
+        # The latest raw XML. self._xmlobj is parsed from it on demand
+        self._xmlobj_source = None
 
         # These should be set by the child classes if necessary
         self._inactive_xml_flags = 0
@@ -121,6 +136,7 @@ class vmmLibvirtObject(vmmGObject):
             self._name = oldname
             raise
         finally:
+            self.conn.reindex_object(self)
             self.__force_refresh_xml()
 
 
@@ -153,6 +169,9 @@ class vmmLibvirtObject(vmmGObject):
 
     def get_name(self):
         return self._name
+    def get_uuid(self):
+        # Subclasses override this if the object has a UUID
+        return None
 
     def tick(self, stats_update=True):
         ignore = stats_update
@@ -165,9 +184,11 @@ class vmmLibvirtObject(vmmGObject):
         """
         Function called by vmmConnection to populate initial state when
         a new object appears.
+
+        :returns: True if initialization failed
         """
         if self.__initialized:
-            return  # pragma: no cover
+            return False  # pragma: no cover
 
         initialize_failed = False
         try:
@@ -181,7 +202,7 @@ class vmmLibvirtObject(vmmGObject):
             initialize_failed = True
 
         self.__initialized = True
-        self.idle_emit("initialized", initialize_failed)
+        return initialize_failed
 
 
     ###################
@@ -263,7 +284,7 @@ class vmmLibvirtObject(vmmGObject):
         events.
         """
         if (self._using_events() and
-            self._xmlobj and
+            self._xmlobj_source is not None and
             self._is_xml_valid):
             return
         self.__force_refresh_xml(nosignal=nosignal)
@@ -276,14 +297,19 @@ class vmmLibvirtObject(vmmGObject):
         :param nosignal: If true, don't send state-changed. Used by
             callers that are going to send it anyways.
         """
-        origxml = None
-        if self._xmlobj:
-            origxml = self._xmlobj.get_xml()
+        origxml = self._xmlobj_source
 
         self._invalidate_xml()
         active_xml = self._XMLDesc(self._active_xml_flags)
-        self._xmlobj = self._parseclass(self.conn.get_backend(),
-            parsexml=active_xml)
+        if origxml == active_xml:
+            # Most refreshes, especially event driven ones, return the
+            # same XML, so keep the already parsed object
+            self._get_parse_counts()[0] += 1
+        else:
+            # Parsing is deferred until get_xmlobj is called, callers
+            # like list views may get by with _get_xml_source
+            self._xmlobj = None
+            self._xmlobj_source = active_xml
         self._is_xml_valid = True
 
         if not nosignal and origxml != active_xml:
@@ -311,10 +337,10 @@ class vmmLibvirtObject(vmmGObject):
             return self._parseclass(self.conn.get_backend(),
                 parsexml=inactive_xml)
 
-        if (self._xmlobj is None or
-            (refresh_if_nec and not self._is_xml_valid)):
-            self.ensure_latest_xml()
-
+        xml = self._get_xml_source(refresh_if_nec=refresh_if_nec)
+        if self._xmlobj is None:
+            self._get_parse_counts()[1] += 1
+            self._xmlobj = self._parse_xml_source(xml)
         return self._xmlobj
 
     @property
@@ -343,6 +369,26 @@ class vmmLibvirtObject(vmmGObject):
     # Internal XML routines #
     #########################
 
+    def _get_parse_counts(self):
+        return _PARSE_COUNTS.setdefault(self.__class__.__name__, [0, 0])
+
+    def _get_xml_source(self, refresh_if_nec=True):
+        """
+        Return the raw active XML, refreshing it like get_xmlobj does
+        """
+        if (self._xmlobj_source is None or
+            (refresh_if_nec and not self._is_xml_valid)):
+            self.ensure_latest_xml()
+        return self._xmlobj_source
+
+    def _parse_xml_source(self, xml):
+        """
+        Build the xmlobj for raw XML from _get_xml_source. Subclasses
+        may override this to share the parsed object with their own
+        caches
+        """
+        return self._parseclass(self.conn.get_backend(), parsexml=xml)
+
     def _invalidate_xml(self):
         """
         Mark cached XML as invalid. Subclasses may extend this
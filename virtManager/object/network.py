@@ -52,6 +52,8 @@ class vmmNetwork(vmmLibvirtObject):
         return self._backend.XMLDesc(flags)
     def _define(self, xml):
         return self.conn.define_network(xml)
+    def get_uuid(self):
+        return self._backend.UUIDString()
     def _using_events(self):
         return self.conn.using_network_events
     def _get_backend_status(self):
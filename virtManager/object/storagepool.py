@@ -161,6 +161,8 @@ class vmmStoragePool(vmmLibvirtObject):
         return self._backend.XMLDesc(flags)
     def _define(self, xml):
         return self.conn.define_pool(xml)
+    def get_uuid(self):
+        return self._backend.UUIDString()
     def _using_events(self):
         return self.conn.using_storage_pool_events
     def _get_backend_status(self):
@@ -131,6 +131,10 @@ def parse_commandline():
     parser.add_argument("--trace-libvirt", choices=["all", "mainloop"],
         help=argparse.SUPPRESS)
 
+    # Write per-connection libvirt API call stats as JSON on exit
+    parser.add_argument("--dump-libvirt-stats", metavar="FILE",
+        help=argparse.SUPPRESS)
+
     # comma separated string of options to tweak app behavior,
     # for manual and automated testing config
     parser.add_argument("--test-options", action='append',
@@ -171,13 +175,17 @@ def main():
     if BuildConfig.running_from_srcdir:
         _setup_gsettings_path(BuildConfig.gsettings_dir)
 
-    if options.trace_libvirt:
-        log.debug("Libvirt tracing requested")
-        from .lib import module_trace
+    # libvirt API call stats are otherwise only collected once they
+    # are requested from the connection's Libvirt API Statistics dialog
+    from .lib import module_trace
+    if options.trace_libvirt or options.dump_libvirt_stats:
         import libvirt
-        module_trace.wrap_module(libvirt,
-                mainloop=(options.trace_libvirt == "mainloop"),
-                regex=None)
+        if options.trace_libvirt:
+            log.debug("Libvirt tracing requested")
+            module_trace.wrap_module(libvirt,
+                    mainloop=(options.trace_libvirt == "mainloop"),
+                    regex=None)
+        module_trace.enable_stats(libvirt)
 
     CLITestOptions = CLITestOptionsClass(options.test_options)
 
@@ -266,6 +274,9 @@ def main():
 
     engine.start(options.uri, show_window, domain, skip_autostart)
 
+    if options.dump_libvirt_stats:
+        module_trace.dump_stats(options.dump_libvirt_stats)
+
 
 def runcli():
     try:
@@ -188,6 +188,8 @@ class vmmVMWindow(vmmGObjectUI):
             return
 
         vmmEngine.get_instance().increment_window_counter()
+        if self.conn.statsmanager:
+            self.conn.statsmanager.set_watched_vms(self, [self.vm])
         self._refresh_vm_state()
 
     def customize_finish(self, src):
@@ -253,6 +255,8 @@ class vmmVMWindow(vmmGObjectUI):
         self.topwin.hide()
         self._console.vmwindow_close()
         self._details.vmwindow_close()
+        if self.conn.statsmanager:
+            self.conn.statsmanager.unwatch_vms(self)
 
         self.emit("closed")
         vmmEngine.get_instance().decrement_window_counter()
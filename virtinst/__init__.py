@@ -60,6 +60,7 @@ from virtinst.devices import *  # pylint: disable=wildcard-import
 from virtinst.install.installer import Installer
 
 from virtinst.guest import Guest
+from virtinst.guestsummary import GuestSummary
 from virtinst.cloner import Cloner
 from virtinst.snapshot import DomainSnapshot
 
@@ -13,7 +13,7 @@ from . import Capabilities
 from . import pollhelpers
 from . import support
 from . import xmlutil
-from .guest import Guest
+from .guestsummary import GuestSummary
 from .logger import log
 from .nodedev import NodeDevice
 from .storage import StoragePool, StorageVolume
@@ -81,6 +81,7 @@ class VirtinstConnection(object):
         # These let virt-manager register a callback which provides its
         # own cached object lists, rather than doing fresh calls
         self.cb_fetch_all_domains = None
+        self.cb_fetch_all_domain_summaries = None
         self.cb_fetch_all_pools = None
         self.cb_fetch_all_vols = None
         self.cb_fetch_all_nodedevs = None
@@ -168,6 +169,7 @@ class VirtinstConnection(object):
     ####################
 
     _FETCH_KEY_DOMAINS = "vms"
+    _FETCH_KEY_DOMAIN_SUMMARIES = "vmsummaries"
     _FETCH_KEY_POOLS = "pools"
     _FETCH_KEY_VOLS = "vols"
     _FETCH_KEY_NODEDEVS = "nodedevs"
@@ -179,10 +181,10 @@ class VirtinstConnection(object):
             self._fetch_cache[key] = raw_cb()
         return self._fetch_cache[key][:]
 
-    def _fetch_all_domains_raw(self):
+    def _fetch_all_domain_summaries_raw(self):
         dummy1, dummy2, ret = pollhelpers.fetch_vms(
             self, {}, lambda obj, ignore: obj)
-        domains = []
+        summaries = []
         for obj in ret:
             # TOCTOU race: a domain may go away in between enumeration and inspection
             try:
@@ -190,8 +192,13 @@ class VirtinstConnection(object):
             except libvirt.libvirtError as e:  # pragma: no cover
                 log.debug("Fetching domain XML failed: %s", e)
                 continue
-            domains.append(Guest(weakref.proxy(self), parsexml=xml))
-        return domains
+            summaries.append(GuestSummary(weakref.proxy(self), xml))
+        return summaries
+
+    def _fetch_all_domains_raw(self):
+        # Reuse the summaries' XML, so the domains aren't fetched twice
+        return [summary.get_guest() for summary in
+                self.fetch_all_domain_summaries()]
 
     def _build_pool_raw(self, poolobj):
         return StoragePool(weakref.proxy(self),
@@ -279,6 +286,16 @@ class VirtinstConnection(object):
                 self._fetch_all_domains_raw,
                 self.cb_fetch_all_domains)
 
+    def fetch_all_domain_summaries(self):
+        """
+        Returns a list of GuestSummary() objects. Prefer this over
+        fetch_all_domains when only the summary values are needed
+        """
+        return self._fetch_helper(
+                self._FETCH_KEY_DOMAIN_SUMMARIES,
+                self._fetch_all_domain_summaries_raw,
+                self.cb_fetch_all_domain_summaries)
+
     def fetch_all_pools(self):
         """
         Returns a list of StoragePool objects
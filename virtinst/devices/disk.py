@@ -311,14 +311,14 @@ class DeviceDisk(Device):
             vols.append(backpath)
 
         ret = []
-        vms = conn.fetch_all_domains()
+        vms = conn.fetch_all_domain_summaries()
         for vm in vms:
             if not read_only:
-                if path in [vm.os.kernel, vm.os.initrd, vm.os.dtb]:
+                if path in [vm.kernel, vm.initrd, vm.dtb]:
                     ret.append(vm.name)
                     continue
 
-            for disk in vm.devices.disk:
+            for disk in vm.disks:
                 checkpath = disk.get_source_path()
                 if checkpath in vols and vm.name not in ret:
                     # VM uses the path indirectly via backing store
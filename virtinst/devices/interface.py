@@ -162,9 +162,9 @@ class DeviceInterface(Device):
         if not searchmac:
             return
 
-        vms = conn.fetch_all_domains()
+        vms = conn.fetch_all_domain_summaries()
         for vm in vms:
-            for nic in vm.devices.interface:
+            for nic in vm.interfaces:
                 nicmac = nic.macaddr or ""
                 if nicmac.lower() == searchmac.lower():
                     raise RuntimeError(
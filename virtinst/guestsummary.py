@@ -0,0 +1,249 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+from xml.etree import ElementTree
+
+from .guest import Guest
+from .xmlapi import XMLAPI
+
+# How much XML _SummaryBase._parse hands to the parser at a time
+_FEED_CHUNK_SIZE = 16 * 1024
+
+
+class _SummaryField(object):
+    """
+    A value to pull out of the XML, declared with a restricted form of
+    the XMLProperty xpath syntax: ./elem/elem for element text and
+    ./elem/@attr for attributes, relative to the summary's root element.
+    Like XMLProperty, the first matching element wins.
+
+    :param is_bool: The value is True if the element exists, False if not
+    """
+    def __init__(self, xpath, is_bool=False):
+        parts = xpath.split("/")[1:]
+        self.attr = None
+        if parts and parts[-1].startswith("@"):
+            self.attr = parts.pop()[1:]
+        self.path = tuple(self._expand_ns(part) for part in parts)
+        self.is_bool = is_bool
+
+    @staticmethod
+    def _expand_ns(tag):
+        # ElementTree reports namespaced tags as {uri}localname
+        if ":" not in tag:
+            return tag
+        nsname, localname = tag.split(":", 1)
+        return "{%s}%s" % (XMLAPI.NAMESPACES[nsname], localname)
+
+
+class _SummaryBase(object):
+    """
+    Base class for summary records. Subclasses declare their values
+    in _FIELDS, a dict of attribute name -> _SummaryField, and any
+    repeated child elements in _RECORDS, a dict of list attribute
+    name -> (element xpath, _SummaryBase subclass)
+    """
+    _FIELDS = {}
+    _RECORDS = {}
+
+    def __init__(self):
+        for name, field in self._FIELDS.items():
+            setattr(self, name, False if field.is_bool else None)
+        for listname in self._RECORDS:
+            setattr(self, listname, [])
+        self._seen = set()
+
+    @classmethod
+    def _get_field_map(cls):
+        """
+        Index _FIELDS by element path, for the parse loop
+        """
+        if "_fieldmap" not in cls.__dict__:
+            fieldmap = {}
+            for name, field in cls._FIELDS.items():
+                fieldmap.setdefault(field.path, []).append((name, field))
+            cls._fieldmap = fieldmap
+        return cls._fieldmap
+
+    @classmethod
+    def _get_record_map(cls):
+        if "_recordmap" not in cls.__dict__:
+            cls._recordmap = dict(
+                    (_SummaryField(xpath).path, (listname, recordclass))
+                    for listname, (xpath, recordclass) in
+                    cls._RECORDS.items())
+        return cls._recordmap
+
+    def _set_value(self, name, value):
+        if name in self._seen:
+            return
+        self._seen.add(name)
+        setattr(self, name, value)
+
+    def _element_start(self, path, elem):
+        for name, field in self._get_field_map().get(path, []):
+            if field.is_bool:
+                self._set_value(name, True)
+            elif field.attr:
+                if field.attr in elem.attrib:
+                    self._set_value(name, elem.attrib[field.attr])
+
+    def _element_end(self, path, elem):
+        for name, field in self._get_field_map().get(path, []):
+            if not field.is_bool and not field.attr:
+                self._set_value(name, "".join(elem.itertext()))
+
+    @staticmethod
+    def _iter_events(xml):
+        """
+        Feed xml to the parser in chunks, and yield the parser events
+        of each chunk before feeding the next, so finished elements can
+        be dropped while the rest of the document is still unparsed
+        """
+        parser = ElementTree.XMLPullParser(events=("start", "end"))
+        for idx in range(0, len(xml), _FEED_CHUNK_SIZE):
+            parser.feed(xml[idx:idx + _FEED_CHUNK_SIZE])
+            for event in parser.read_events():
+                yield event
+        parser.close()
+        for event in parser.read_events():
+            yield event
+
+    def _parse(self, xml):
+        """
+        Fill in the declared values from xml in one pass over the
+        parser events, without building an XMLAPI document
+        """
+        # Stack of element paths relative to the document root, and the
+        # record that elements below path index recordidx belong to
+        recordmap = self._get_record_map()
+        paths = [None]
+        record = None
+        recordidx = 0
+        target = self
+        for event, elem in self._iter_events(xml):
+            if event == "start":
+                parent = paths[-1]
+                path = () if parent is None else parent + (elem.tag,)
+                paths.append(path)
+                if record is None and path in recordmap:
+                    listname, recordclass = recordmap[path]
+                    records = getattr(self, listname)
+                    record = recordclass(self, len(records))
+                    records.append(record)
+                    recordidx = len(path)
+                    target = record
+                target._element_start(path[recordidx:], elem)
+                continue
+
+            path = paths.pop()
+            target._element_end(path[recordidx:], elem)
+            if record is not None and len(path) == recordidx:
+                record = None
+                recordidx = 0
+                target = self
+            if len(path) == 1:
+                # Drop finished top level children, there's no need to
+                # keep the whole tree around
+                elem.clear()
+
+
+class _SummaryRecord(_SummaryBase):
+    """
+    Base class for the records of repeated elements. idx is the
+    position of the element among its siblings of the same kind
+    """
+    def __init__(self, parent, idx):
+        _SummaryBase.__init__(self)
+        self._parent = parent
+        self._idx = idx
+
+
+class DiskSummary(_SummaryRecord):
+    """
+    The <disk> values needed for disk path lookups
+    """
+    _FIELDS = {
+        "type": _SummaryField("./@type"),
+        "device": _SummaryField("./@device"),
+        "driver_type": _SummaryField("./driver/@type"),
+        "source_file": _SummaryField("./source/@file"),
+        "source_dev": _SummaryField("./source/@dev"),
+        "source_dir": _SummaryField("./source/@dir"),
+        "has_source": _SummaryField("./source", is_bool=True),
+        "target": _SummaryField("./target/@dev"),
+        "read_only": _SummaryField("./readonly", is_bool=True),
+        "shareable": _SummaryField("./shareable", is_bool=True),
+    }
+
+    def get_source_path(self):
+        """
+        Same as DeviceDisk.get_source_path. Local paths come straight
+        from the XML, other sources like network or volume ones are
+        resolved via the full Guest
+        """
+        path = self.source_file or self.source_dev or self.source_dir
+        if path or not self.has_source:
+            return path
+        guest = self._parent.get_guest()
+        return guest.devices.disk[self._idx].get_source_path()
+
+    def is_empty(self):
+        return not self.get_source_path()
+
+
+class InterfaceSummary(_SummaryRecord):
+    """
+    The <interface> values needed for MAC address lookups
+    """
+    _FIELDS = {
+        "type": _SummaryField("./@type"),
+        "macaddr": _SummaryField("./mac/@address"),
+        "target_dev": _SummaryField("./target/@dev"),
+    }
+
+
+class GuestSummary(_SummaryBase):
+    """
+    The <domain> values that list views and disk path or MAC address
+    lookups need, pulled from the XML in a single pass without building
+    a Guest. The full Guest is built from the same XML on first use of
+    get_guest()
+    """
+    _FIELDS = {
+        "name": _SummaryField("./name"),
+        "uuid": _SummaryField("./uuid"),
+        "title": _SummaryField("./title"),
+        "description": _SummaryField("./description"),
+        "type": _SummaryField("./@type"),
+        "os_type": _SummaryField("./os/type"),
+        "arch": _SummaryField("./os/type/@arch"),
+        "machine": _SummaryField("./os/type/@machine"),
+        "kernel": _SummaryField("./os/kernel"),
+        "initrd": _SummaryField("./os/initrd"),
+        "dtb": _SummaryField("./os/dtb"),
+        "os_id": _SummaryField(
+            "./metadata/libosinfo:libosinfo/libosinfo:os/@id"),
+    }
+    _RECORDS = {
+        "disks": ("./devices/disk", DiskSummary),
+        "interfaces": ("./devices/interface", InterfaceSummary),
+    }
+
+    def __init__(self, conn, xml):
+        _SummaryBase.__init__(self)
+        self.conn = conn
+        self._xml = xml
+        self._guest = None
+        self._parse(xml)
+
+    def get_xml(self):
+        return self._xml
+
+    def get_guest(self):
+        """
+        Return the full Guest for this XML, parsed on first use
+        """
+        if self._guest is None:
+            self._guest = Guest(self.conn, parsexml=self._xml)
+        return self._guest
@@ -70,3 +70,203 @@ def fetch_vms(backend, origmap, build_cb):
     list_cb = backend.listAllDomains
     support_cb = backend.support.conn_domain
     return _new_poll_helper(origmap, typename, list_cb, build_cb, support_cb)
+
+
+class _ReconcileEntry(object):
+    """
+    Bookkeeping for a single object tracked by PollReconciler
+    """
+    __slots__ = ["obj", "name", "seen"]
+
+    def __init__(self, obj, name, seen):
+        self.obj = obj
+        self.name = name
+        self.seen = seen
+
+
+class PollDelta(object):
+    """
+    The changes found by a single PollReconciler.reconcile call
+
+    :ivar gone: Previously tracked objects that disappeared
+    :ivar new: Newly built objects
+    :ivar renamed: List of (obj, oldname, newname) for tracked objects
+        that kept their identity across a rename
+    :ivar generation: The reconciler generation after this poll
+    """
+    __slots__ = ["gone", "new", "renamed", "generation"]
+
+    def __init__(self, generation):
+        self.gone = []
+        self.new = []
+        self.renamed = []
+        self.generation = generation
+
+    def __bool__(self):
+        return bool(self.gone or self.new or self.renamed)
+
+
+def _uuid_key(obj):
+    return obj.UUIDString()
+
+
+def _name_key(obj):
+    return obj.name()
+
+
+class _ReconcileView(object):
+    """
+    Read only iterable over the objects tracked by a PollReconciler
+    """
+    __slots__ = ["_entries"]
+
+    def __init__(self, entries):
+        self._entries = entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        for entry in self._entries.values():
+            yield entry.obj
+
+
+class PollReconciler(object):
+    """
+    Incrementally track the objects reported by a listAll* API across
+    polls.
+
+    Objects are keyed by UUID where libvirt provides one, so a rename
+    is reported as such rather than as a remove + add. The object map
+    is kept between polls, so a poll where nothing changed doesn't
+    build any new maps or objects, and only the delta is returned.
+
+    :param typename: Object type used for logging, like 'domain'
+    """
+    _UUID_TYPES = ["domain", "network", "pool"]
+
+    def __init__(self, typename):
+        self.typename = typename
+        self.generation = 0
+
+        self._key_cb = _name_key
+        if typename in self._UUID_TYPES:
+            self._key_cb = _uuid_key
+        self._entries = {}
+        self._keys = {}
+        self._polls = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def objects(self):
+        """
+        Return a view of every tracked object. This is not a copy
+        """
+        return _ReconcileView(self._entries)
+
+    def tracks(self, obj):
+        """
+        Return True if the passed built object is currently tracked
+        """
+        return id(obj) in self._keys
+
+    def discard(self, obj):
+        """
+        Stop tracking the passed built object, so the next poll reports
+        it as new again. Used when object initialization fails.
+
+        :returns: True if the object was tracked
+        """
+        key = self._keys.pop(id(obj), None)
+        if key is None:
+            return False
+        del self._entries[key]
+        self.generation += 1
+        return True
+
+    def reconcile(self, list_cb, support_cb, build_cb, renamed_cb=None):
+        """
+        Poll list_cb and diff the result against the tracked objects
+
+        :param build_cb: Called as build_cb(rawobj, name) for every new
+            object, returns the object we will track
+        :param renamed_cb: Called as renamed_cb(obj, newname) when a
+            tracked object shows up with a new name. If it returns
+            True, obj is kept, otherwise it is reported as gone and
+            a replacement is built with build_cb
+        :returns: PollDelta
+        """
+        rawobjs = []
+        try:
+            if support_cb():
+                rawobjs = list_cb()
+        except Exception as e:  # pragma: no cover
+            log.debug("Unable to list all %ss: %s", self.typename, e)
+
+        self._polls += 1
+        polls = self._polls
+        entries = self._entries
+        keys = self._keys
+        delta = PollDelta(self.generation)
+        seen = 0
+
+        for rawobj in rawobjs:
+            key = self._key_cb(rawobj)
+            name = rawobj.name()
+            entry = entries.get(key)
+
+            if entry is None:
+                obj = build_cb(rawobj, name)
+                entries[key] = _ReconcileEntry(obj, name, polls)
+                keys[id(obj)] = key
+                delta.new.append(obj)
+                continue
+
+            entry.seen = polls
+            seen += 1
+            if entry.name == name:
+                continue
+
+            oldname = entry.name
+            entry.name = name
+            if renamed_cb and renamed_cb(entry.obj, name):
+                delta.renamed.append((entry.obj, oldname, name))
+                continue
+
+            delta.gone.append(entry.obj)
+            del keys[id(entry.obj)]
+            entry.obj = build_cb(rawobj, name)
+            keys[id(entry.obj)] = key
+            delta.new.append(entry.obj)
+
+        if seen + len(delta.new) - len(delta.gone) != len(entries):
+            for key in [k for k, e in entries.items() if e.seen != polls]:
+                obj = entries.pop(key).obj
+                del keys[id(obj)]
+                delta.gone.append(obj)
+
+        if delta:
+            self.generation += 1
+            delta.generation = self.generation
+        return delta
+
+
+def reconcile_nets(backend, reconciler, build_cb, renamed_cb=None):
+    return reconciler.reconcile(backend.listAllNetworks,
+            backend.support.conn_network, build_cb, renamed_cb)
+
+
+def reconcile_pools(backend, reconciler, build_cb, renamed_cb=None):
+    return reconciler.reconcile(backend.listAllStoragePools,
+            backend.support.conn_storage, build_cb, renamed_cb)
+
+
+def reconcile_nodedevs(backend, reconciler, build_cb, renamed_cb=None):
+    return reconciler.reconcile(backend.listAllDevices,
+            backend.support.conn_nodedev, build_cb, renamed_cb)
+
+
+def reconcile_vms(backend, reconciler, build_cb, renamed_cb=None):
+    return reconciler.reconcile(backend.listAllDomains,
+            backend.support.conn_domain, build_cb, renamed_cb)
@@ -4,7 +4,17 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
-import libxml2
+import functools
+import os
+
+try:
+    import libxml2
+except ImportError:  # pragma: no cover
+    libxml2 = None
+try:
+    from lxml import etree
+except ImportError:  # pragma: no cover
+    etree = None
 
 from . import xmlutil
 from .logger import log
@@ -82,17 +92,60 @@ class _XPath(object):
         return self.join(self.segments[:-1])
 
 
+# _XPath objects are never modified after creation, and the same
+# xpaths are requested over and over by XMLProperty lookups
+_parse_xpath = functools.lru_cache(maxsize=4096)(_XPath)
+
+
 class _XMLBase(object):
     NAMESPACES = {}
+    # Cache parsed xpaths and node lookups. Only meant to be turned
+    # off for benchmarking
+    CACHE_LOOKUPS = True
+
     @classmethod
     def register_namespace(cls, nsname, uri):
         cls.NAMESPACES[nsname] = uri
 
+    def __init__(self):
+        # Bumped on every change to the document
+        self._generation = 0
+        # fullxpath -> node, or None if it doesn't exist. Only valid
+        # for the current generation
+        self._node_cache = {}
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def _changed(self):
+        """
+        Must be called by the backends after every change to the
+        document, since cached nodes may be gone or no longer match
+        """
+        self._generation += 1
+        self._node_cache.clear()
+
+    def _get_xpath(self, fullxpath):
+        if not self.CACHE_LOOKUPS:
+            return _XPath(fullxpath)
+        return _parse_xpath(fullxpath)
+
+    def _find(self, fullxpath):
+        if not self.CACHE_LOOKUPS:
+            return self._find_node(fullxpath)
+        try:
+            return self._node_cache[fullxpath]
+        except KeyError:
+            node = self._find_node(fullxpath)
+            self._node_cache[fullxpath] = node
+            return node
+
     def copy_api(self):
         raise NotImplementedError()
     def count(self, xpath):
         raise NotImplementedError()
-    def _find(self, fullxpath):
+    def _find_node(self, fullxpath):
         raise NotImplementedError()
     def _node_tostring(self, node):
         raise NotImplementedError()
@@ -135,7 +188,7 @@ class _XMLBase(object):
             return None
         if is_bool:
             return True
-        xpathobj = _XPath(xpath)
+        xpathobj = self._get_xpath(xpath)
         if xpathobj.is_prop:
             return self._node_get_property(node, xpathobj.propname)
         return self._node_get_text(node)
@@ -176,7 +229,7 @@ class _XMLBase(object):
         of whether it has children or not, and then clean up the XML
         chain
         """
-        xpathobj = _XPath(fullxpath)
+        xpathobj = self._get_xpath(fullxpath)
         parentnode = self._find(xpathobj.parent_xpath())
         childnode = self._find(fullxpath)
         if parentnode is None or childnode is None:
@@ -193,7 +246,7 @@ class _XMLBase(object):
             {"expectname": expected_root_name, "foundname": rootname})
 
     def _node_set_content(self, xpath, node, setval):
-        xpathobj = _XPath(xpath)
+        xpathobj = self._get_xpath(xpath)
         if setval is not None:
             setval = str(setval)
         if xpathobj.is_prop:
@@ -223,10 +276,10 @@ class _XMLBase(object):
         Even if <bar> didn't exist before. So we fill in the dependent property
         expression values
         """
-        xpathobj = _XPath(fullxpath)
+        xpathobj = self._get_xpath(fullxpath)
         parentxpath = "."
         parentnode = self._find(parentxpath)
-        if not parentnode:
+        if parentnode is None:
             raise xmlutil.DevError(
                     "Did not find XML root node for xpath=%s" % fullxpath)
 
@@ -257,7 +310,7 @@ class _XMLBase(object):
         if it doesn't have any children or attributes, so we don't
         leave stale elements in the XML
         """
-        xpathobj = _XPath(fullxpath)
+        xpathobj = self._get_xpath(fullxpath)
         segments = xpathobj.segments[:]
         parent = None
         while segments:
@@ -279,17 +332,19 @@ def node_is_text(n):
     return bool(n and n.type == "text")
 
 
+def _libxml2_parse(xml):
+    # Use of gtksourceview in virt-manager changes the keepBlanksDefault
+    # libxml global setting, which messes up whitespace after parsing.
+    # readDoc options override the globals, without us having to reset
+    # them for the whole process on every parse
+    return libxml2.readDoc(xml, None, None, 0)
+
+
 class _Libxml2API(_XMLBase):
     def __init__(self, xml):
         _XMLBase.__init__(self)
 
-        # Use of gtksourceview in virt-manager changes this libxml
-        # global setting which messes up whitespace after parsing.
-        # We can probably get away with calling this less but it
-        # would take some investigation
-        libxml2.keepBlanksDefault(1)
-
-        self._doc = libxml2.parseDoc(xml)
+        self._doc = _libxml2_parse(xml)
         self._ctx = self._doc.xpathNewContext()
         self._ctx.setContextNode(self._doc.children)
         for key, val in self.NAMESPACES.items():
@@ -299,6 +354,7 @@ class _Libxml2API(_XMLBase):
         if not hasattr(self, "_doc"):
             # In case we error when parsing the doc
             return
+        self._node_cache = {}
         self._doc.freeDoc()
         self._doc = None
         self._ctx.xpathFreeContext()
@@ -312,8 +368,8 @@ class _Libxml2API(_XMLBase):
     def copy_api(self):
         return _Libxml2API(self._doc.children.serialize())
 
-    def _find(self, fullxpath):
-        xpath = _XPath(fullxpath).xpath
+    def _find_node(self, fullxpath):
+        xpath = self._get_xpath(fullxpath).xpath
         try:
             node = self._ctx.xpathEval(xpath)
         except Exception as e:
@@ -328,7 +384,7 @@ class _Libxml2API(_XMLBase):
     def _node_tostring(self, node):
         return node.serialize()
     def _node_from_xml(self, xml):
-        return libxml2.parseDoc(xml).children
+        return _libxml2_parse(xml).children
 
     def _node_get_text(self, node):
         return node.content
@@ -336,6 +392,7 @@ class _Libxml2API(_XMLBase):
         if setval is not None:
             setval = xmlutil.xml_escape(setval)
         node.setContent(setval)
+        self._changed()
 
     def _node_get_property(self, node, propname):
         prop = node.hasProp(propname)
@@ -349,6 +406,7 @@ class _Libxml2API(_XMLBase):
                 prop.freeNode()
         else:
             node.setProp(propname, xmlutil.xml_escape(setval))
+        self._changed()
 
     def _node_new(self, xpathseg, parentnode):
         newnode = libxml2.newNode(xpathseg.nodename)
@@ -377,6 +435,7 @@ class _Libxml2API(_XMLBase):
             for p in propnames:
                 node.unsetProp(p)
             node.setContent(None)
+            self._changed()
 
     def _node_has_content(self, node):
         return node.type == "element" and (node.children or node.properties)
@@ -397,6 +456,7 @@ class _Libxml2API(_XMLBase):
         node.freeNode()
         if all([node_is_text(n) for n in parentnode.children]):
             parentnode.setContent(None)
+        self._changed()
 
     def _node_add_child(self, parentxpath, parentnode, newnode):
         ignore = parentxpath
@@ -412,10 +472,206 @@ class _Libxml2API(_XMLBase):
         parentnode.addChild(libxml2.newText("  "))
         parentnode.addChild(newnode)
         parentnode.addChild(libxml2.newText(endtext))
+        self._changed()
 
     def _node_replace_child(self, xpath, newnode):
         oldnode = self._find(xpath)
         oldnode.replaceNode(newnode)
+        self._changed()
+
+
+class _LxmlAPI(_XMLBase):
+    """
+    Backend using lxml's ElementTree API. In ElementTree, text between
+    elements isn't a node of its own, it's stored in the .text of the
+    parent for text before the first child, and the .tail of every
+    child for the text following it. The helpers below map that onto
+    the whitespace handling of the libxml2 backend, so both produce
+    the same XML.
+    """
+    _PARSER = None
+
+    def __init__(self, xml):
+        _XMLBase.__init__(self)
+        self._root = self._parse(xml)
+
+    @classmethod
+    def _parse(cls, xml):
+        if not cls._PARSER:
+            cls._PARSER = etree.XMLParser(
+                    remove_blank_text=False, resolve_entities=False,
+                    huge_tree=True)
+        if isinstance(xml, str):
+            # lxml refuses str input with an encoding declaration
+            xml = xml.encode("utf-8")
+        return etree.fromstring(xml, cls._PARSER)
+
+    def _sanitize_xml(self, xml):
+        if not xml.endswith("\n") and "\n" in xml:
+            xml += "\n"
+        return xml
+
+    def copy_api(self):
+        return _LxmlAPI(self._node_tostring(self._root))
+
+    def _xpath_eval(self, xpath):
+        return self._root.xpath(xpath, namespaces=self.NAMESPACES)
+
+    def _find_node(self, fullxpath):
+        xpath = self._get_xpath(fullxpath).xpath
+        try:
+            node = self._xpath_eval(xpath)
+        except Exception as e:
+            log.debug("fullxpath=%s xpath=%s eval failed",
+                    fullxpath, xpath, exc_info=True)
+            raise RuntimeError("%s %s" % (fullxpath, str(e))) from None
+        # Elements with no children are False in a boolean context
+        return node[0] if node else None
+
+    def count(self, xpath):
+        return len(self._xpath_eval(xpath))
+
+    def _node_tostring(self, node):
+        return etree.tostring(node, encoding="unicode", with_tail=False)
+    def _node_from_xml(self, xml):
+        return self._parse(xml)
+
+    def _node_get_text(self, node):
+        return etree.tostring(node, method="text", encoding="unicode",
+                              with_tail=False)
+    def _node_set_text(self, node, setval):
+        for child in list(node):
+            node.remove(child)
+        node.text = setval
+        self._changed()
+
+    def _find_attr_name(self, node, propname):
+        # Like libxml2's hasProp, match attributes in any namespace
+        if propname in node.attrib:
+            return propname
+        for key in node.attrib:
+            if key.endswith("}" + propname):
+                return key
+        return None
+
+    def _node_get_property(self, node, propname):
+        key = self._find_attr_name(node, propname)
+        if key:
+            return node.get(key)
+    def _node_set_property(self, node, propname, setval):
+        if setval is None:
+            key = self._find_attr_name(node, propname)
+            if key:
+                del node.attrib[key]
+        else:
+            node.set(propname, setval)
+        self._changed()
+
+    def _node_new(self, xpathseg, parentnode):
+        if not xpathseg.nsname:
+            return etree.Element(xpathseg.nodename)
+
+        uri = (parentnode.nsmap.get(xpathseg.nsname) or
+               self.NAMESPACES[xpathseg.nsname])
+        # lxml drops the declaration again if a parent already has it
+        return etree.Element("{%s}%s" % (uri, xpathseg.nodename),
+                             nsmap={xpathseg.nsname: uri})
+
+    def node_clear(self, xpath):
+        node = self._find(xpath)
+        if node is not None:
+            node.attrib.clear()
+            self._node_set_text(node, None)
+
+    def _node_has_content(self, node):
+        return (isinstance(node.tag, str) and
+                bool(len(node) or node.text or node.attrib))
+
+    def _node_get_name(self, node):
+        return etree.QName(node).localname
+
+    @staticmethod
+    def _get_prev_text(node):
+        """
+        Return the text directly preceding node
+        """
+        prev = node.getprevious()
+        if prev is not None:
+            return prev.tail
+        parent = node.getparent()
+        if parent is not None:
+            return parent.text
+        return None
+
+    @staticmethod
+    def _set_prev_text(node, text):
+        prev = node.getprevious()
+        if prev is not None:
+            prev.tail = text
+        else:
+            node.getparent().text = text
+
+    def _node_remove_child(self, parentnode, childnode):
+        # Drop the preceding whitespace, like the libxml2 backend. The
+        # text following the node takes its place, otherwise it would
+        # be removed along with the node's .tail
+        self._set_prev_text(childnode, childnode.tail)
+        childnode.getparent().remove(childnode)
+        if not len(parentnode):
+            parentnode.text = None
+        self._changed()
+
+    def _node_add_child(self, parentxpath, parentnode, newnode):
+        ignore = parentxpath
+        if len(parentnode):
+            lasttext = parentnode[-1].tail
+        else:
+            lasttext = parentnode.text
+        if not lasttext:
+            lasttext = self._get_prev_text(parentnode) or "\n"
+
+        if len(parentnode):
+            parentnode[-1].tail = lasttext + "  "
+        else:
+            parentnode.text = lasttext + "  "
+        parentnode.append(newnode)
+        newnode.tail = lasttext
+        self._changed()
+
+    def _node_replace_child(self, xpath, newnode):
+        oldnode = self._find(xpath)
+        newnode.tail = oldnode.tail
+        oldnode.getparent().replace(oldnode, newnode)
+        self._changed()
+
+
+_BACKENDS = {}
+if libxml2:
+    _BACKENDS["libxml2"] = _Libxml2API
+if etree is not None:
+    _BACKENDS["lxml"] = _LxmlAPI
+
+
+def get_backends():
+    """
+    Return a dict of name -> XMLAPI class of all usable backends
+    """
+    return _BACKENDS.copy()
+
+
+def _pick_backend():
+    name = os.environ.get("VIRTINST_XML_BACKEND")
+    if name and name in _BACKENDS:
+        return _BACKENDS[name]
+    if name:  # pragma: no cover
+        log.warning("Unknown or unavailable XML backend '%s'", name)
+    for name in ["libxml2", "lxml"]:
+        if name in _BACKENDS:
+            return _BACKENDS[name]
+    raise ImportError(  # pragma: no cover
+            "Either the libxml2 or lxml python module is required")
 
 
-XMLAPI = _Libxml2API
+# The XML backend used for all parsing, picked at import time. Set
+# VIRTINST_XML_BACKEND=lxml to use lxml rather than libxml2
+XMLAPI = _pick_backend()
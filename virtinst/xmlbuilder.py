@@ -163,6 +163,8 @@ class XMLChildProperty(_XMLPropertyBase):
 
 
     def _get(self, xmlbuilder):
+        if self.propname in xmlbuilder._lazy_child_props:
+            xmlbuilder._parse_child_list(self)
         if self.propname not in xmlbuilder._propstore and not self.is_single:
             xmlbuilder._propstore[self.propname] = []
         return xmlbuilder._propstore[self.propname]
@@ -512,6 +514,8 @@ class XMLBuilder(object):
             parsexml = "".join([c for c in parsexml if c in string.printable])
 
         self._propstore = collections.OrderedDict()
+        # Names of XMLChildProperty lists not built from the XML yet
+        self._lazy_child_props = set()
         self._xmlstate = _XMLState(self.XML_NAME,
                                    parsexml, parentxmlstate,
                                    relative_object_xpath)
@@ -545,26 +549,39 @@ class XMLBuilder(object):
 
     def _initial_child_parse(self):
         # Walk the XML tree and hand of parsing to any registered
-        # child classes
+        # child classes. Lists of child objects, like all the devices
+        # of a domain, are only built when first used, since many
+        # callers only want a few top level properties
         for xmlprop in list(self._all_child_props().values()):
-            child_class = xmlprop.child_class
-            prop_path = xmlprop.get_prop_xpath(self, child_class)
-
-            if xmlprop.is_single:
-                obj = child_class(self.conn,
-                    parentxmlstate=self._xmlstate,
-                    relative_object_xpath=prop_path)
-                xmlprop.set(self, obj)
+            if not xmlprop.is_single:
+                self._lazy_child_props.add(xmlprop.propname)
                 continue
 
-            nodecount = self._xmlstate.xmlapi.count(
-                self._xmlstate.make_abs_xpath(prop_path))
-            for idx in range(nodecount):
-                idxstr = "[%d]" % (idx + 1)
-                obj = child_class(self.conn,
-                    parentxmlstate=self._xmlstate,
-                    relative_object_xpath=(prop_path + idxstr))
-                xmlprop.append(self, obj)
+            child_class = xmlprop.child_class
+            prop_path = xmlprop.get_prop_xpath(self, child_class)
+            obj = child_class(self.conn,
+                parentxmlstate=self._xmlstate,
+                relative_object_xpath=prop_path)
+            xmlprop.set(self, obj)
+
+    def _parse_child_list(self, xmlprop):
+        """
+        Build the child objects of the XMLChildProperty list from
+        the XML at our current location
+        """
+        self._lazy_child_props.discard(xmlprop.propname)
+        child_class = xmlprop.child_class
+        prop_path = xmlprop.get_prop_xpath(self, child_class)
+
+        objs = []
+        nodecount = self._xmlstate.xmlapi.count(
+            self._xmlstate.make_abs_xpath(prop_path))
+        for idx in range(nodecount):
+            idxstr = "[%d]" % (idx + 1)
+            objs.append(child_class(self.conn,
+                parentxmlstate=self._xmlstate,
+                relative_object_xpath=(prop_path + idxstr)))
+        xmlprop.set(self, objs)
 
     def __repr__(self):
         return "<%s %s %s>" % (self.__class__.__name__.split(".")[-1],
@@ -691,6 +708,8 @@ class XMLBuilder(object):
         if relative_object_xpath != -1:
             self._xmlstate.set_relative_object_xpath(relative_object_xpath)
         for propname in self._all_child_props():
+            if propname in self._lazy_child_props:
+                continue
             for p in xmlutil.listify(getattr(self, propname, [])):
                 p._set_xpaths(self._xmlstate.abs_xpath())
 
@@ -702,6 +721,9 @@ class XMLBuilder(object):
         """
         typecount = {}
         for propname, xmlprop in self._all_child_props().items():
+            if propname in self._lazy_child_props:
+                # Built from the XML with correct xpaths once used
+                continue
             for obj in xmlutil.listify(getattr(self, propname)):
                 idxstr = ""
                 if not xmlprop.is_single:
@@ -721,6 +743,8 @@ class XMLBuilder(object):
         """
         self._xmlstate.parse(*args, **kwargs)
         for propname in self._all_child_props():
+            if propname in self._lazy_child_props:
+                continue
             for p in xmlutil.listify(getattr(self, propname, [])):
                 p._parse_with_children(None, self._xmlstate)
 
@@ -800,6 +824,7 @@ class XMLBuilder(object):
         the backing xml.
         """
         origpropstore = self._propstore.copy()
+        origlazy = self._lazy_child_props.copy()
         origapi = self._xmlstate.xmlapi
         try:
             self._xmlstate.xmlapi = xmlapi
@@ -807,6 +832,7 @@ class XMLBuilder(object):
         finally:
             self._xmlstate.xmlapi = origapi
             self._propstore = origpropstore
+            self._lazy_child_props = origlazy
 
     def _do_add_parse_bits(self):
         # Set all defaults if the properties have one registered
@@ -831,6 +857,9 @@ class XMLBuilder(object):
             if key in xmlprops:
                 xmlprops[key]._set_xml(self, self._propstore[key])
             elif key in childprops:
+                if key in self._lazy_child_props:
+                    # Never used, so nothing changed in the XML
+                    continue
                 for obj in xmlutil.listify(getattr(self, key)):
                     obj._add_parse_bits(self._xmlstate.xmlapi)
 